@@ -10,4 +10,26 @@ class Config:
     NGINX_SITES_AVAILABLE: str = "/etc/nginx/sites-available"
     NGINX_SITES_ENABLED: str = "/etc/nginx/sites-enabled"
     NGINX_LOG_DIR: str = "/var/log/nginx"
-    NGINX_CONF_FILE: str = "/etc/nginx/nginx.conf"
\ No newline at end of file
+    NGINX_CONF_FILE: str = "/etc/nginx/nginx.conf"
+    NGINX_MAX_LOG_ROTATIONS: int = 20
+    NGINX_STRUCTURED_LOG_LIMIT: int = 1000
+    NGINX_STRUCTURED_LOG_WINDOW_HOURS: float = 24 * 7
+    NGINX_LOG_WORKERS: int = os.cpu_count() or 1
+    NGINX_LOG_POLL_SECONDS: float = 5
+    NGINX_LOG_BOOTSTRAP_BYTES: int = 10 * 1024 * 1024
+    NGINX_RESPONSE_CACHE_BYTES: int = 32 * 1024 * 1024
+    NGINX_LIVE_TAIL_POLL_SECONDS: float = 1
+    NGINX_LIVE_TAIL_QUEUE_BATCHES: int = 256
+    NGINX_LIVE_TAIL_KEEPALIVE_SECONDS: float = 15
+    NGINX_ANALYTICS_STATE_DIR: str = "/var/lib/secure-ui/analytics"
+    NGINX_ANALYTICS_SAVE_SECONDS: float = 60
+    NGINX_SCAN_CHUNK_BYTES: int = 64 * 1024 * 1024
+    NGINX_LOG_ARCHIVE_BLOCK_BYTES: int = 256 * 1024
+    NGINX_SEARCH_CHUNK_BYTES: int = 16 * 1024 * 1024
+    NGINX_LOG_INGEST_ENABLED: bool = False
+    NGINX_LOG_INGEST_COLLECTION: str = "nginx_access_logs"
+    NGINX_LOG_INGEST_BATCH_SIZE: int = 5000
+    NGINX_LOG_INGEST_FLUSH_SECONDS: float = 5
+    NGINX_LOG_INGEST_RETENTION_DAYS: int = 30
+    NGINX_COMMAND_TIMEOUT_SECONDS: float = 60
+    NGINX_RELOAD_DEBOUNCE_SECONDS: float = 0.5
@@ -11,6 +11,8 @@ from helpers.logger import logger, ic
 from auth.login import auth_router
 from admin.routes import admin_router
 from nginx.routes import nginx_router
+from nginx.executors import shutdown_process_pool
+from nginx import nginx_manager
 import os
 from fastapi import HTTPException
 from fastapi.staticfiles import StaticFiles
@@ -53,10 +55,15 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Error creating database indexes during startup: {e}")
 
+    nginx_manager.start_background_tasks()
+    nginx_manager.start_log_ingestion(db_instance)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down the FastAPI application.")
+    await nginx_manager.stop_background_tasks()
     await mongo_manager.disconnect()
+    shutdown_process_pool()
     logger.info("FastAPI application has been shut down.")
 
 
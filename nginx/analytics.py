@@ -0,0 +1,640 @@
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .log_batch import LogBatch
+from config import Config
+from helpers.logger import logger
+from .models import (
+    HeavyHitter, HeavyHitters, LatencyReport, LatencySummary, LogScanSummary, TrafficRollup, UniqueVisitorBucket,
+    UniqueVisitors
+)
+from .sketches import HyperLogLog, LatencyHistogram, SpaceSaving
+
+
+ROLLUP_GRANULARITIES: Dict[str, int] = {
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+# How many buckets of each granularity are kept.
+ROLLUP_RETENTION: Dict[str, int] = {
+    "minute": 2 * 24 * 60,
+    "hour": 90 * 24,
+    "day": 2 * 365,
+}
+
+MAX_METHODS_PER_BUCKET = 16
+
+
+class _RollupBucket:
+    __slots__ = ("requests", "status_classes", "bytes_sent", "methods")
+
+    def __init__(self):
+        self.requests = 0
+        self.status_classes = [0, 0, 0, 0, 0]
+        self.bytes_sent = 0
+        self.methods: Dict[str, int] = {}
+
+
+class TrafficRollups:
+    """
+    Per-minute, per-hour and per-day traffic aggregates (request count, status
+    class counts, bytes sent and method mix), updated incrementally with each
+    batch of newly parsed records and trimmed to ROLLUP_RETENTION buckets.
+    A batch is first reduced to per-minute partials, which are then folded
+    into every granularity.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[int, _RollupBucket]] = {name: {} for name in ROLLUP_GRANULARITIES}
+        self._lock = threading.Lock()
+
+    def add(self, batch: LogBatch) -> None:
+        minutes: Dict[int, _RollupBucket] = {}
+        for time_us, status_code, size, method_code in zip(
+            batch.times, batch.status_codes, batch.response_sizes, batch.method.codes
+        ):
+            minute = time_us // 60_000_000 * 60
+            partial = minutes.get(minute)
+            if partial is None:
+                partial = minutes[minute] = _RollupBucket()
+            partial.requests += 1
+            status_class = status_code // 100 - 1
+            if 0 <= status_class < 5:
+                partial.status_classes[status_class] += 1
+            partial.bytes_sent += size
+            partial.methods[method_code] = partial.methods.get(method_code, 0) + 1
+
+        methods = batch.method
+        with self._lock:
+            for minute, partial in minutes.items():
+                for name, seconds in ROLLUP_GRANULARITIES.items():
+                    buckets = self._buckets[name]
+                    bucket_start = minute - minute % seconds
+                    bucket = buckets.get(bucket_start)
+                    if bucket is None:
+                        bucket = buckets[bucket_start] = _RollupBucket()
+                        self._trim(name, bucket_start)
+                    bucket.requests += partial.requests
+                    bucket.status_classes = [a + b for a, b in zip(bucket.status_classes, partial.status_classes)]
+                    bucket.bytes_sent += partial.bytes_sent
+                    for method_code, count in partial.methods.items():
+                        method = methods.decode(method_code) or "-"
+                        if method not in bucket.methods and len(bucket.methods) >= MAX_METHODS_PER_BUCKET:
+                            method = "OTHER"
+                        bucket.methods[method] = bucket.methods.get(method, 0) + count
+
+    def _trim(self, name: str, newest_start: int) -> None:
+        buckets = self._buckets[name]
+        if len(buckets) <= ROLLUP_RETENTION[name]:
+            return
+        cutoff = newest_start - ROLLUP_RETENTION[name] * ROLLUP_GRANULARITIES[name]
+        for bucket_start in [start for start in buckets if start <= cutoff]:
+            del buckets[bucket_start]
+
+    def query(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              coverage_start_us: Optional[int] = None, gaps: Sequence[Tuple[int, int]] = ()) -> List[TrafficRollup]:
+        """
+        Returns the buckets of `granularity` that start within [start, end),
+        oldest first. Buckets that begin before `coverage_start_us` or overlap
+        one of the skipped `gaps` (see AccessLogTailer.coverage) are marked partial.
+        """
+        start_epoch = start.timestamp() if start is not None else float('-inf')
+        end_epoch = end.timestamp() if end is not None else float('inf')
+        seconds = ROLLUP_GRANULARITIES[granularity]
+
+        def is_partial(bucket_start: int) -> bool:
+            bucket_start_us, bucket_end_us = bucket_start * 1_000_000, (bucket_start + seconds) * 1_000_000
+            if coverage_start_us is not None and bucket_start_us < coverage_start_us:
+                return True
+            return any(gap_start < bucket_end_us and gap_end > bucket_start_us for gap_start, gap_end in gaps)
+
+        with self._lock:
+            selected = sorted(
+                (bucket_start, bucket) for bucket_start, bucket in self._buckets[granularity].items()
+                if start_epoch <= bucket_start < end_epoch
+            )
+            return [
+                TrafficRollup(
+                    bucket_start=datetime.fromtimestamp(bucket_start, timezone.utc).isoformat(),
+                    requests=bucket.requests,
+                    status_classes={f"{i + 1}xx": count for i, count in enumerate(bucket.status_classes)},
+                    bytes_sent=bucket.bytes_sent,
+                    methods=dict(bucket.methods),
+                    partial=is_partial(bucket_start),
+                )
+                for bucket_start, bucket in selected
+            ]
+
+
+# dimension -> LogBatch string column
+HEAVY_HITTER_DIMENSIONS: Dict[str, str] = {
+    "ip": "ip",
+    "path": "path",
+    "user_agent": "user_agent",
+    "referer": "referer",
+}
+
+# Counters kept per dimension per minute (up to twice this between prunes).
+HEAVY_HITTER_CAPACITY = 100
+HEAVY_HITTER_RETENTION_MINUTES = 6 * 60
+# Long user agents and paths are truncated so one counter's key stays small.
+HEAVY_HITTER_MAX_VALUE_LENGTH = 512
+
+
+class HeavyHitterTracker:
+    """
+    The most frequent client IPs, paths, user agents and referers, kept as one
+    Space-Saving summary per dimension per minute. Memory is bounded by
+    HEAVY_HITTER_CAPACITY counters per summary no matter how many distinct values
+    are seen; a window query merges the summaries of the minutes it covers.
+    Each batch is counted per (minute, value) first, so a summary sees every
+    distinct value once per batch, weighted by its count.
+    """
+
+    def __init__(self):
+        self._minutes: Dict[int, Dict[str, SpaceSaving]] = {}
+        self._totals: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, batch: LogBatch) -> None:
+        minutes = [time_us // 60_000_000 * 60 for time_us in batch.times]
+        counted = {
+            dimension: Counter(zip(minutes, getattr(batch, column).codes))
+            for dimension, column in HEAVY_HITTER_DIMENSIONS.items()
+        }
+        with self._lock:
+            for minute, count in Counter(minutes).items():
+                self._get_summaries(minute)
+                self._totals[minute] = self._totals.get(minute, 0) + count
+            for dimension, counts in counted.items():
+                column = getattr(batch, HEAVY_HITTER_DIMENSIONS[dimension])
+                for (minute, code), count in counts.items():
+                    value = column.decode(code)
+                    summaries = self._minutes.get(minute)
+                    if value and summaries is not None:
+                        summaries[dimension].add(value[:HEAVY_HITTER_MAX_VALUE_LENGTH], count)
+
+    def _get_summaries(self, minute: int) -> Dict[str, SpaceSaving]:
+        summaries = self._minutes.get(minute)
+        if summaries is None:
+            summaries = self._minutes[minute] = {
+                dimension: SpaceSaving(HEAVY_HITTER_CAPACITY) for dimension in HEAVY_HITTER_DIMENSIONS
+            }
+            self._trim(minute)
+        return summaries
+
+    def _trim(self, newest_minute: int) -> None:
+        if len(self._minutes) <= HEAVY_HITTER_RETENTION_MINUTES:
+            return
+        cutoff = newest_minute - HEAVY_HITTER_RETENTION_MINUTES * 60
+        for minute in [minute for minute in self._minutes if minute <= cutoff]:
+            del self._minutes[minute]
+            self._totals.pop(minute, None)
+
+    def query(self, dimension: str, start: datetime, end: datetime, limit: int) -> HeavyHitters:
+        """Returns the `limit` most frequent values of `dimension` in minutes starting within [start, end)."""
+        start_epoch, end_epoch = start.timestamp(), end.timestamp()
+        merged = SpaceSaving(HEAVY_HITTER_CAPACITY)
+        total = 0
+        with self._lock:
+            for minute, summaries in self._minutes.items():
+                if start_epoch <= minute < end_epoch:
+                    merged.merge(summaries[dimension])
+                    total += self._totals.get(minute, 0)
+        return HeavyHitters(
+            dimension=dimension,
+            window_start=start.isoformat(),
+            window_end=end.isoformat(),
+            total_requests=total,
+            items=[HeavyHitter(value=value, count=count, error=error) for value, count, error in merged.top(limit)],
+        )
+
+
+UNIQUE_VISITOR_GRANULARITIES: Dict[str, int] = {
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+UNIQUE_VISITOR_RETENTION: Dict[str, int] = {
+    "hour": 14 * 24,
+    "day": 400,
+}
+
+UNIQUE_VISITOR_PRECISION = 12
+# Sites are taken from the Host header, which clients control, so they are capped too.
+MAX_SITES_PER_BUCKET = 16
+ALL_SITES = "*"
+OTHER_SITES = "OTHER"
+
+_SKETCH_MAGIC = b'NGXHLL1\n'
+_SKETCH_HEADER = struct.Struct('<BH')  # precision, site count
+_SITE_HEADER = struct.Struct('<H')  # site name length
+
+
+class UniqueVisitorCounter:
+    """
+    Distinct client IPs and distinct IP + user agent pairs per hour and per day,
+    overall and per site (the request's host, when the log_format records it).
+    Each bucket holds a pair of HyperLogLog sketches per site, so memory doesn't
+    grow with traffic and a range query merges buckets with a register-wise max.
+    Buckets are persisted to `state_dir`, one file each, and because re-adding a
+    visitor doesn't change a sketch, replaying lines after a restart is harmless.
+    """
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = Path(state_dir)
+        self._buckets: Dict[str, Dict[int, Dict[str, Tuple[HyperLogLog, HyperLogLog]]]] = {
+            name: {} for name in UNIQUE_VISITOR_GRANULARITIES
+        }
+        self._dirty: Set[Tuple[str, int]] = set()
+        self._expired: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+
+    def add(self, batch: LogBatch) -> None:
+        # Adding a visitor twice doesn't change a sketch, so each distinct
+        # (hour, ip, user agent, host) in the batch is hashed and added once.
+        visits = set(zip(
+            [time_us // 3_600_000_000 * 3600 for time_us in batch.times],
+            batch.ip.codes, batch.user_agent.codes, batch.host.codes,
+        ))
+        ip_hashes: Dict[int, Tuple[str, int]] = {}
+        with self._lock:
+            for hour, ip_code, user_agent_code, host_code in visits:
+                ip_and_hash = ip_hashes.get(ip_code)
+                if ip_and_hash is None:
+                    ip = batch.ip.decode(ip_code)
+                    ip_and_hash = ip_hashes[ip_code] = (ip, HyperLogLog.hash(ip))
+                ip, ip_hash = ip_and_hash
+                client_hash = HyperLogLog.hash(f"{ip}\0{batch.user_agent.decode(user_agent_code) or ''}")
+                host = batch.host.decode(host_code)
+                for name, seconds in UNIQUE_VISITOR_GRANULARITIES.items():
+                    bucket_start = hour - hour % seconds
+                    for site in (ALL_SITES, host) if host else (ALL_SITES,):
+                        ip_sketch, client_sketch = self._get_sketches(name, bucket_start, site)
+                        ip_sketch.add_hash(ip_hash)
+                        client_sketch.add_hash(client_hash)
+                    self._dirty.add((name, bucket_start))
+
+    def _get_sketches(self, name: str, bucket_start: int, site: str) -> Tuple[HyperLogLog, HyperLogLog]:
+        buckets = self._buckets[name]
+        bucket = buckets.get(bucket_start)
+        if bucket is None:
+            bucket = buckets[bucket_start] = {}
+            self._trim(name, bucket_start)
+        sketches = bucket.get(site)
+        if sketches is None:
+            real_sites = len(bucket) - (ALL_SITES in bucket) - (OTHER_SITES in bucket)
+            if site != ALL_SITES and real_sites >= MAX_SITES_PER_BUCKET:
+                site = OTHER_SITES
+                sketches = bucket.get(site)
+            if sketches is None:
+                sketches = bucket[site] = (HyperLogLog(UNIQUE_VISITOR_PRECISION), HyperLogLog(UNIQUE_VISITOR_PRECISION))
+        return sketches
+
+    def _trim(self, name: str, newest_start: int) -> None:
+        buckets = self._buckets[name]
+        if len(buckets) <= UNIQUE_VISITOR_RETENTION[name]:
+            return
+        cutoff = newest_start - UNIQUE_VISITOR_RETENTION[name] * UNIQUE_VISITOR_GRANULARITIES[name]
+        for bucket_start in [start for start in buckets if start <= cutoff]:
+            del buckets[bucket_start]
+            self._dirty.discard((name, bucket_start))
+            self._expired.add((name, bucket_start))
+
+    def query(self, granularity: str, site: Optional[str] = None,
+              start: Optional[datetime] = None, end: Optional[datetime] = None) -> UniqueVisitors:
+        """
+        Returns the distinct visitor counts of each bucket of `granularity` that
+        starts within [start, end), oldest first, and for the whole range.
+        """
+        start_epoch = start.timestamp() if start is not None else float('-inf')
+        end_epoch = end.timestamp() if end is not None else float('inf')
+        all_ips, all_clients = HyperLogLog(UNIQUE_VISITOR_PRECISION), HyperLogLog(UNIQUE_VISITOR_PRECISION)
+        buckets = []
+        with self._lock:
+            selected = sorted(
+                (bucket_start, bucket[site or ALL_SITES])
+                for bucket_start, bucket in self._buckets[granularity].items()
+                if start_epoch <= bucket_start < end_epoch and (site or ALL_SITES) in bucket
+            )
+            for bucket_start, (ips, clients) in selected:
+                all_ips.merge(ips)
+                all_clients.merge(clients)
+                buckets.append(UniqueVisitorBucket(
+                    bucket_start=datetime.fromtimestamp(bucket_start, timezone.utc).isoformat(),
+                    unique_ips=ips.count(),
+                    unique_clients=clients.count(),
+                ))
+        return UniqueVisitors(
+            site=site,
+            granularity=granularity,
+            unique_ips=all_ips.count(),
+            unique_clients=all_clients.count(),
+            buckets=buckets,
+        )
+
+    def _bucket_path(self, name: str, bucket_start: int) -> Path:
+        return self.state_dir / f"visitors-{name}-{bucket_start}.hll"
+
+    def save(self) -> None:
+        """Writes buckets changed since the last save and removes expired ones. Blocking."""
+        with self._lock:
+            changed = [
+                (name, bucket_start, {site: (bytes(ips.registers), bytes(clients.registers))
+                                      for site, (ips, clients) in self._buckets[name][bucket_start].items()})
+                for name, bucket_start in self._dirty
+            ]
+            expired, self._dirty, self._expired = self._expired, set(), set()
+
+        try:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            for name, bucket_start, sites in changed:
+                bucket_path = self._bucket_path(name, bucket_start)
+                tmp_path = bucket_path.with_name(bucket_path.name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(_SKETCH_MAGIC)
+                    f.write(_SKETCH_HEADER.pack(UNIQUE_VISITOR_PRECISION, len(sites)))
+                    for site, (ips, clients) in sites.items():
+                        encoded = site.encode('utf-8', errors='ignore')[:255]
+                        f.write(_SITE_HEADER.pack(len(encoded)) + encoded + ips + clients)
+                os.replace(tmp_path, bucket_path)
+            for name, bucket_start in expired:
+                self._bucket_path(name, bucket_start).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not persist unique visitor sketches to {self.state_dir}: {e}")
+            return
+        if changed:
+            logger.debug(f"Saved {len(changed)} unique visitor buckets to {self.state_dir}.")
+
+    def load(self) -> None:
+        """Merges the persisted buckets into memory. Blocking."""
+        try:
+            bucket_files = list(self.state_dir.glob("visitors-*.hll"))
+        except OSError as e:
+            logger.warning(f"Could not read unique visitor sketches from {self.state_dir}: {e}")
+            return
+
+        loaded = 0
+        for bucket_path in sorted(bucket_files):
+            try:
+                _, name, bucket_start = bucket_path.stem.split('-')
+                sites = self._read_bucket(bucket_path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning(f"Ignoring unreadable unique visitor sketch {bucket_path.name}: {e}")
+                continue
+            if name not in self._buckets:
+                continue
+            with self._lock:
+                for site, (ips, clients) in sites.items():
+                    current_ips, current_clients = self._get_sketches(name, int(bucket_start), site)
+                    current_ips.merge(ips)
+                    current_clients.merge(clients)
+            loaded += 1
+        if loaded:
+            logger.info(f"Loaded {loaded} unique visitor buckets from {self.state_dir}.")
+
+    @staticmethod
+    def _read_bucket(bucket_path: Path) -> Dict[str, Tuple[HyperLogLog, HyperLogLog]]:
+        with open(bucket_path, 'rb') as f:
+            if f.read(len(_SKETCH_MAGIC)) != _SKETCH_MAGIC:
+                raise ValueError("not a sketch file")
+            precision, site_count = _SKETCH_HEADER.unpack(f.read(_SKETCH_HEADER.size))
+            if precision != UNIQUE_VISITOR_PRECISION:
+                raise ValueError(f"precision {precision} != {UNIQUE_VISITOR_PRECISION}")
+            size = 1 << precision
+            sites = {}
+            for _ in range(site_count):
+                (name_length,) = _SITE_HEADER.unpack(f.read(_SITE_HEADER.size))
+                site = f.read(name_length).decode('utf-8', errors='ignore')
+                ips, clients = f.read(size), f.read(size)
+                if len(clients) != size:
+                    raise ValueError("truncated")
+                sites[site] = (HyperLogLog(precision, ips), HyperLogLog(precision, clients))
+            return sites
+
+
+# dimension -> (LogBatch string column to group by, LogBatch latency column in ms)
+LATENCY_DIMENSIONS: Dict[str, Tuple[str, str]] = {
+    "path": ("path", "request_times_ms"),
+    "upstream": ("upstream_addr", "upstream_times_ms"),
+}
+
+LATENCY_GRANULARITIES: Dict[str, int] = {
+    "minute": 60,
+    "hour": 60 * 60,
+}
+
+LATENCY_RETENTION: Dict[str, int] = {
+    "minute": 6 * 60,
+    "hour": 7 * 24,
+}
+
+MAX_LATENCY_KEYS_PER_BUCKET = 64
+
+
+class _LatencyBucket:
+    __slots__ = ("overall", "keys")
+
+    def __init__(self):
+        self.overall = LatencyHistogram()
+        self.keys: Dict[str, LatencyHistogram] = {}
+
+
+class LatencyTracker:
+    """
+    Request latency ($request_time) per path and upstream latency
+    ($upstream_response_time) per upstream, as mergeable histograms per minute
+    and per hour, so percentiles over any window are answered from at most a
+    few hundred histograms and no raw samples. Only log_formats that include the
+    timing variables contribute.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[str, Dict[int, _LatencyBucket]]] = {
+            dimension: {name: {} for name in LATENCY_GRANULARITIES} for dimension in LATENCY_DIMENSIONS
+        }
+        self._lock = threading.Lock()
+
+    def add(self, batch: LogBatch) -> None:
+        with self._lock:
+            for dimension, (key_column, latency_column) in LATENCY_DIMENSIONS.items():
+                keys = getattr(batch, key_column)
+                for time_us, key_code, latency in zip(batch.times, keys.codes, getattr(batch, latency_column)):
+                    if latency != latency:  # NaN: not logged
+                        continue
+                    epoch = time_us // 1_000_000
+                    key = keys.decode(key_code) or "-"
+                    for name, seconds in LATENCY_GRANULARITIES.items():
+                        buckets = self._buckets[dimension][name]
+                        bucket_start = epoch - epoch % seconds
+                        bucket = buckets.get(bucket_start)
+                        if bucket is None:
+                            bucket = buckets[bucket_start] = _LatencyBucket()
+                            self._trim(buckets, name, bucket_start)
+                        bucket.overall.add(latency)
+                        histogram = bucket.keys.get(key)
+                        if histogram is None:
+                            bucket_key = key if len(bucket.keys) < MAX_LATENCY_KEYS_PER_BUCKET else "OTHER"
+                            histogram = bucket.keys.get(bucket_key)
+                            if histogram is None:
+                                histogram = bucket.keys[bucket_key] = LatencyHistogram()
+                        histogram.add(latency)
+
+    @staticmethod
+    def _trim(buckets: Dict[int, _LatencyBucket], name: str, newest_start: int) -> None:
+        if len(buckets) <= LATENCY_RETENTION[name]:
+            return
+        cutoff = newest_start - LATENCY_RETENTION[name] * LATENCY_GRANULARITIES[name]
+        for bucket_start in [start for start in buckets if start <= cutoff]:
+            del buckets[bucket_start]
+
+    def query(self, dimension: str, start: datetime, end: datetime, limit: int) -> LatencyReport:
+        """
+        Returns latency percentiles over [start, end), overall and for the `limit`
+        busiest keys of `dimension`. Minute buckets are used while they still
+        cover `start`, hour buckets (aligned to whole hours) before that.
+        """
+        granularity = "minute" if start.timestamp() >= time.time() - LATENCY_RETENTION["minute"] * 60 else "hour"
+        seconds = LATENCY_GRANULARITIES[granularity]
+        start_epoch = start.timestamp() // seconds * seconds
+        end_epoch = end.timestamp()
+        overall = LatencyHistogram()
+        keys: Dict[str, LatencyHistogram] = {}
+        with self._lock:
+            for bucket_start, bucket in self._buckets[dimension][granularity].items():
+                if not start_epoch <= bucket_start < end_epoch:
+                    continue
+                overall.merge(bucket.overall)
+                for key, histogram in bucket.keys.items():
+                    merged = keys.get(key)
+                    if merged is None:
+                        merged = keys[key] = LatencyHistogram()
+                    merged.merge(histogram)
+        busiest = sorted(keys.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+        return LatencyReport(
+            dimension=dimension,
+            granularity=granularity,
+            window_start=datetime.fromtimestamp(start_epoch, timezone.utc).isoformat(),
+            window_end=end.isoformat(),
+            overall=_summarize_latency(None, overall),
+            items=[_summarize_latency(key, histogram) for key, histogram in busiest],
+        )
+
+
+def _round_ms(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def _summarize_latency(key: Optional[str], histogram: LatencyHistogram) -> LatencySummary:
+    return LatencySummary(
+        key=key,
+        count=histogram.count,
+        mean_ms=round(histogram.total / histogram.count, 3) if histogram.count else None,
+        p50_ms=_round_ms(histogram.quantile(0.5)),
+        p95_ms=_round_ms(histogram.quantile(0.95)),
+        p99_ms=_round_ms(histogram.quantile(0.99)),
+        max_ms=histogram.max if histogram.count else None,
+    )
+
+
+SCAN_TOP_LIMIT = 20
+
+
+class LogScanAggregate:
+    """
+    Whole-file statistics for one access log scan: totals, status and method
+    mix, distinct IPs, the top IPs and paths and the overall latency
+    distribution. Partial aggregates of separate byte ranges are built in
+    worker processes (so this pickles) and combined with `merge`.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.unparsed_lines = 0
+        self.bytes_sent = 0
+        self.first_seen: Optional[datetime] = None
+        self.last_seen: Optional[datetime] = None
+        self.status_classes = [0, 0, 0, 0, 0]
+        self.methods: Dict[str, int] = {}
+        self.ips = HyperLogLog(UNIQUE_VISITOR_PRECISION)
+        self.top_ips = SpaceSaving(HEAVY_HITTER_CAPACITY)
+        self.top_paths = SpaceSaving(HEAVY_HITTER_CAPACITY)
+        self.latency = LatencyHistogram()
+
+    def add(self, batch: LogBatch) -> None:
+        if not len(batch):
+            return
+        self.requests += len(batch)
+        self.bytes_sent += sum(batch.response_sizes)
+        first = batch.time(min(range(len(batch)), key=batch.times.__getitem__))
+        last = batch.time(max(range(len(batch)), key=batch.times.__getitem__))
+        if self.first_seen is None or first < self.first_seen:
+            self.first_seen = first
+        if self.last_seen is None or last > self.last_seen:
+            self.last_seen = last
+        for status_class, count in Counter(status_code // 100 - 1 for status_code in batch.status_codes).items():
+            if 0 <= status_class < 5:
+                self.status_classes[status_class] += count
+        for method_code, count in Counter(batch.method.codes).items():
+            method = batch.method.decode(method_code) or "-"
+            if method not in self.methods and len(self.methods) >= MAX_METHODS_PER_BUCKET:
+                method = "OTHER"
+            self.methods[method] = self.methods.get(method, 0) + count
+        for ip_code, count in Counter(batch.ip.codes).items():
+            ip = batch.ip.decode(ip_code)
+            self.ips.add(ip)
+            self.top_ips.add(ip, count)
+        for path_code, count in Counter(batch.path.codes).items():
+            path = batch.path.decode(path_code)
+            if path:
+                self.top_paths.add(path[:HEAVY_HITTER_MAX_VALUE_LENGTH], count)
+        for latency in batch.request_times_ms:
+            if latency == latency:
+                self.latency.add(latency)
+
+    def merge(self, other: "LogScanAggregate") -> None:
+        self.requests += other.requests
+        self.unparsed_lines += other.unparsed_lines
+        self.bytes_sent += other.bytes_sent
+        if other.first_seen is not None and (self.first_seen is None or other.first_seen < self.first_seen):
+            self.first_seen = other.first_seen
+        if other.last_seen is not None and (self.last_seen is None or other.last_seen > self.last_seen):
+            self.last_seen = other.last_seen
+        self.status_classes = [a + b for a, b in zip(self.status_classes, other.status_classes)]
+        for method, count in other.methods.items():
+            if method not in self.methods and len(self.methods) >= MAX_METHODS_PER_BUCKET:
+                method = "OTHER"
+            self.methods[method] = self.methods.get(method, 0) + count
+        self.ips.merge(other.ips)
+        self.top_ips.merge(other.top_ips)
+        self.top_paths.merge(other.top_paths)
+        self.latency.merge(other.latency)
+
+    def to_summary(self) -> LogScanSummary:
+        return LogScanSummary(
+            requests=self.requests,
+            unparsed_lines=self.unparsed_lines,
+            bytes_sent=self.bytes_sent,
+            first_seen=self.first_seen.isoformat() if self.first_seen else None,
+            last_seen=self.last_seen.isoformat() if self.last_seen else None,
+            status_classes={f"{i + 1}xx": count for i, count in enumerate(self.status_classes)},
+            methods=dict(self.methods),
+            unique_ips=self.ips.count() if self.requests else 0,
+            top_ips=[HeavyHitter(value=value, count=count, error=error) for value, count, error in self.top_ips.top(SCAN_TOP_LIMIT)],
+            top_paths=[HeavyHitter(value=value, count=count, error=error) for value, count, error in self.top_paths.top(SCAN_TOP_LIMIT)],
+            latency=_summarize_latency(None, self.latency) if self.latency.count else None,
+        )
+
+
+traffic_rollups = TrafficRollups()
+heavy_hitters = HeavyHitterTracker()
+unique_visitors = UniqueVisitorCounter(Path(Config.NGINX_ANALYTICS_STATE_DIR))
+latency_stats = LatencyTracker()
@@ -0,0 +1,299 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from config import Config
+from .models import ConfDirective, ConfDirectiveMatch, ConfError, ConfFile, ConfLocation, ConfServer, ConfTree, ConfUpstream
+
+
+# A file rewritten within this long of being cached might change again
+# without its mtime moving, so its stat alone isn't trusted until it's older.
+_RACY_NANOSECONDS = 1_000_000_000
+
+
+# The escapes nginx resolves in quoted strings; any other backslash is kept as
+# is, so regexes like "\.php$" reach the directive unchanged.
+_QUOTED_ESCAPES = {'"': '"', "'": "'", '\\': '\\', 't': '\t', 'r': '\r', 'n': '\n'}
+
+
+class Directive(NamedTuple):
+    name: str
+    args: Tuple[str, ...]
+    line: int
+    block: Optional[Tuple["Directive", ...]]  # child directives, or None for a simple directive
+
+    def label(self) -> str:
+        return " ".join((self.name,) + self.args)
+
+
+class ParsedFile(NamedTuple):
+    path: str
+    digest: str  # sha256 of the content; empty if the file couldn't be read
+    mtime_ns: Optional[int]
+    directives: Tuple[Directive, ...]
+    errors: Tuple[Tuple[int, str], ...]  # (line, message); line 0 for the whole file
+
+
+def tokenize(text: str) -> Iterator[Tuple[str, bool, int]]:
+    """
+    Splits nginx config text into (token, is_word, line) triples. Words include
+    quoted strings (with quotes removed and escapes resolved as nginx does);
+    the other tokens are ';', '{' and '}'.
+    """
+    i, length, line = 0, len(text), 1
+    while i < length:
+        char = text[i]
+        if char == '\n':
+            line += 1
+            i += 1
+        elif char.isspace():
+            i += 1
+        elif char == '#':
+            end = text.find('\n', i)
+            i = length if end == -1 else end
+        elif char in ';{}':
+            yield char, False, line
+            i += 1
+        elif char in '"\'':
+            start_line = line
+            value = []
+            i += 1
+            while i < length and text[i] != char:
+                if text[i] == '\\' and i + 1 < length and text[i + 1] in _QUOTED_ESCAPES:
+                    value.append(_QUOTED_ESCAPES[text[i + 1]])
+                    i += 2
+                    continue
+                if text[i] == '\n':
+                    line += 1
+                value.append(text[i])
+                i += 1
+            yield ''.join(value), True, start_line
+            i += 1
+        else:
+            start = i
+            while i < length and not text[i].isspace() and text[i] not in ';{}"\'':
+                i += 1
+            yield text[start:i], True, line
+
+
+def parse_conf_text(text: str) -> Tuple[Tuple[Directive, ...], Tuple[Tuple[int, str], ...]]:
+    """
+    Parses nginx config text into a tree of directives. Syntax errors are
+    returned alongside the tree, which keeps everything that could be parsed.
+    """
+    # One frame per open block: (directives so far, block directive name, args, line).
+    stack: List[Tuple[List[Directive], str, Tuple[str, ...], int]] = [([], "", (), 0)]
+    errors: List[Tuple[int, str]] = []
+    words: List[str] = []
+    words_line = 0
+    for token, is_word, line in tokenize(text):
+        if is_word:
+            if not words:
+                words_line = line
+            words.append(token)
+        elif token == ';':
+            if words:
+                stack[-1][0].append(Directive(words[0], tuple(words[1:]), words_line, None))
+            else:
+                errors.append((line, 'unexpected ";"'))
+            words = []
+        elif token == '{':
+            if not words:
+                errors.append((line, 'unexpected "{"'))
+                words = ["?"]
+                words_line = line
+            stack.append(([], words[0], tuple(words[1:]), words_line))
+            words = []
+        else:
+            if words:
+                errors.append((line, f'unexpected "}}" after "{words[0]}" (missing ";")'))
+                words = []
+            if len(stack) == 1:
+                errors.append((line, 'unexpected "}"'))
+                continue
+            children, name, args, block_line = stack.pop()
+            stack[-1][0].append(Directive(name, args, block_line, tuple(children)))
+
+    if words:
+        errors.append((words_line, f'unexpected end of file after "{words[0]}", expecting ";" or "{{"'))
+    while len(stack) > 1:
+        children, name, args, block_line = stack.pop()
+        errors.append((block_line, f'unexpected end of file, expecting "}}" to close "{name}"'))
+        stack[-1][0].append(Directive(name, args, block_line, tuple(children)))
+    return tuple(stack[0][0]), tuple(errors)
+
+
+_parsed_files: Dict[str, Tuple[Optional[Tuple[int, int, int]], ParsedFile]] = {}
+_parsed_files_lock = threading.Lock()
+
+
+def parse_conf_file(path: Path) -> ParsedFile:
+    """
+    Returns the parsed directives of one config file, without resolving its
+    includes. Parses are cached by content hash, so only files whose content
+    changed are parsed again; unchanged (inode, size, mtime) skips even
+    reading the file. Blocking.
+    """
+    key = str(path)
+    try:
+        stats = os.stat(path)
+    except OSError as e:
+        return ParsedFile(key, "", None, (), ((0, f"Could not read file: {e.strerror}"),))
+    stat_key = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+    with _parsed_files_lock:
+        cached = _parsed_files.get(key)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    try:
+        content = Path(path).read_bytes()
+    except OSError as e:
+        return ParsedFile(key, "", None, (), ((0, f"Could not read file: {e.strerror}"),))
+    digest = hashlib.sha256(content).hexdigest()
+    if cached is not None and cached[1].digest == digest:
+        parsed = cached[1]._replace(mtime_ns=stats.st_mtime_ns)
+    else:
+        directives, errors = parse_conf_text(content.decode('utf-8', errors='ignore'))
+        parsed = ParsedFile(key, digest, stats.st_mtime_ns, directives, errors)
+
+    racy = stats.st_mtime_ns >= time.time_ns() - _RACY_NANOSECONDS
+    with _parsed_files_lock:
+        _parsed_files[key] = (None if racy else stat_key, parsed)
+    return parsed
+
+
+def include_pattern(arg: str) -> str:
+    """An include argument as an absolute glob; relative ones are relative to nginx.conf's directory."""
+    return arg if os.path.isabs(arg) else str(Path(Config.NGINX_CONF_FILE).parent / arg)
+
+
+def resolve_include(arg: str) -> List[Path]:
+    """The files an include directive loads, in the (sorted) order nginx loads them."""
+    pattern = include_pattern(arg)
+    if not glob.has_magic(pattern):
+        return [Path(pattern)]
+    return [Path(match) for match in sorted(glob.glob(pattern)) if os.path.isfile(match)]
+
+
+def iter_expanded(directives: Tuple[Directive, ...], source: ParsedFile,
+                  ancestors: Tuple[str, ...]) -> Iterator[Tuple[Directive, ParsedFile, Tuple[str, ...]]]:
+    """
+    Yields the directives of one block level with includes expanded in place
+    (the include directive itself first), as (directive, file, file chain).
+    An include of a file that is already in the chain is skipped.
+    """
+    for directive in directives:
+        yield directive, source, ancestors
+        if directive.name == 'include' and directive.args:
+            for included_path in resolve_include(directive.args[0]):
+                if str(included_path) in ancestors:
+                    continue
+                included = parse_conf_file(included_path)
+                yield from iter_expanded(included.directives, included, ancestors + (included.path,))
+
+
+def walk(source: ParsedFile, context: Tuple[str, ...] = ()) -> Iterator[Tuple[Directive, ParsedFile, Tuple[str, ...]]]:
+    """
+    Yields every directive of a config file and everything it includes, depth
+    first in file order, as (directive, file it is in, labels of the enclosing
+    blocks such as ("http", "server", "location /api")).
+    """
+    yield from _walk(source.directives, source, (source.path,), context)
+
+
+def _walk(directives: Tuple[Directive, ...], source: ParsedFile, ancestors: Tuple[str, ...],
+          context: Tuple[str, ...]) -> Iterator[Tuple[Directive, ParsedFile, Tuple[str, ...]]]:
+    for directive, directive_source, directive_ancestors in iter_expanded(directives, source, ancestors):
+        yield directive, directive_source, context
+        if directive.block is not None:
+            yield from _walk(directive.block, directive_source, directive_ancestors, context + (directive.label(),))
+
+
+def _to_model(directive: Directive) -> ConfDirective:
+    includes = None
+    if directive.name == 'include' and directive.args:
+        includes = [str(path) for path in resolve_include(directive.args[0])]
+    block = [_to_model(child) for child in directive.block] if directive.block is not None else None
+    return ConfDirective(name=directive.name, args=list(directive.args), line=directive.line, block=block, includes=includes)
+
+
+def build_conf_tree(root: Path) -> ConfTree:
+    """Parses `root` and every file it (transitively) includes into a ConfTree. Blocking."""
+    root_file = parse_conf_file(root)
+    files: Dict[str, ParsedFile] = {root_file.path: root_file}
+    for directive, _, _ in walk(root_file):
+        if directive.name == 'include' and directive.args:
+            for included_path in resolve_include(directive.args[0]):
+                if str(included_path) not in files:
+                    files[str(included_path)] = parse_conf_file(included_path)
+    return ConfTree(
+        files=[
+            ConfFile(path=parsed.path, sha256=parsed.digest, directives=[_to_model(d) for d in parsed.directives])
+            for parsed in files.values()
+        ],
+        errors=[
+            ConfError(file=parsed.path, line=line, message=message)
+            for parsed in files.values()
+            for line, message in parsed.errors
+        ],
+    )
+
+
+def find_directives(root: Path, name: str) -> List[ConfDirectiveMatch]:
+    """Every `name` directive in `root` and its includes, in load order. Blocking."""
+    return [
+        ConfDirectiveMatch(name=directive.name, args=list(directive.args), file=source.path, line=directive.line, context=list(context))
+        for directive, source, context in walk(parse_conf_file(root))
+        if directive.name == name
+    ]
+
+
+def _locations(block: Tuple[Directive, ...], source: ParsedFile) -> List[ConfLocation]:
+    return [
+        ConfLocation(
+            match=" ".join(directive.args), file=location_source.path, line=directive.line,
+            locations=_locations(directive.block, location_source),
+        )
+        for directive, location_source, _ in iter_expanded(block, source, (source.path,))
+        if directive.name == 'location' and directive.block is not None
+    ]
+
+
+def find_servers(root: Path) -> List[ConfServer]:
+    """Every server block in `root` and its includes, with its names, listen addresses and locations. Blocking."""
+    servers = []
+    for directive, source, _ in walk(parse_conf_file(root)):
+        if directive.name != 'server' or directive.block is None:
+            continue
+        server_names, listen = [], []
+        for child, _, _ in iter_expanded(directive.block, source, (source.path,)):
+            if child.name == 'server_name':
+                server_names.extend(child.args)
+            elif child.name == 'listen':
+                listen.append(" ".join(child.args))
+        servers.append(ConfServer(
+            server_names=server_names, listen=listen, file=source.path, line=directive.line,
+            locations=_locations(directive.block, source),
+        ))
+    return servers
+
+
+def find_upstreams(root: Path) -> List[ConfUpstream]:
+    """Every upstream block in `root` and its includes, with its servers. Blocking."""
+    return [
+        ConfUpstream(
+            name=" ".join(directive.args), file=source.path, line=directive.line,
+            servers=[
+                " ".join(child.args)
+                for child, _, _ in iter_expanded(directive.block, source, (source.path,))
+                if child.name == 'server'
+            ],
+        )
+        for directive, source, _ in walk(parse_conf_file(root))
+        if directive.name == 'upstream' and directive.block is not None
+    ]
@@ -0,0 +1,253 @@
+import os
+import re
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .models import ErrorLogEntry, ErrorLogSummary, ErrorTemplateCount
+from .log_reader import iter_lines_reversed, open_log_text
+
+
+# Severities in increasing order, as accepted by the error_log directive.
+ERROR_LOG_LEVELS = ["debug", "info", "notice", "warn", "error", "crit", "alert", "emerg"]
+_LEVEL_RANKS = {level: rank for rank, level in enumerate(ERROR_LOG_LEVELS)}
+
+ERROR_BUCKET_SECONDS = {
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+# Normalisation should keep the number of templates small, but bound it anyway.
+MAX_ERROR_TEMPLATES = 500
+MAX_BUCKETS_PER_TEMPLATE = 2000
+
+_HEADER = re.compile(r'(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d) \[(\w+)\] (\d+)#(\d+): (?:\*(\d+) )?(.*)', re.DOTALL)
+_LINE_START = r'\d{4}/\d\d/\d\d \d\d:\d\d:\d\d \['
+_LINE_START_TEXT = re.compile(_LINE_START)
+_LINE_START_BYTES = re.compile(_LINE_START.encode())
+# nginx appends request context as ", client: 1.2.3.4, server: example.com, request: "GET / HTTP/1.1", ..."
+_CONTEXT_START = re.compile(r', (?:client|server|request|upstream|host|referrer): ')
+_CONTEXT_FIELD = re.compile(r'(\w+): ("(?:[^"\\]|\\.)*"|[^,]*)(?:, |$)')
+_TEMPLATE_TOKENS = re.compile(
+    r'"(?:[^"\\]|\\.)*"'                          # quoted strings: file names, headers, URLs
+    r'|\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'      # IPv4 addresses, with port
+    r'|\[[0-9a-fA-F:]+\](?::\d+)?'                # IPv6 addresses
+    r'|\b0x[0-9a-fA-F]+\b'                        # pointers
+    r'|(?<![\w/])/[^\s,;()"]+'                    # paths and URIs
+    r'|\b\d+(?:\.\d+)?\b'                         # numbers: sizes, fds, errnos
+)
+
+
+class ErrorLogRecord(NamedTuple):
+    """A parsed error log entry (which may span several lines)."""
+    time: datetime
+    level: str
+    pid: int
+    tid: int
+    connection: Optional[int]
+    message: str
+    context: str  # the raw ", client: ..., server: ..." suffix, parsed only by to_entry
+
+    def to_entry(self) -> ErrorLogEntry:
+        context = _parse_context(self.context)
+        return ErrorLogEntry(
+            timestamp=self.time.isoformat(),
+            level=self.level,
+            pid=self.pid,
+            tid=self.tid,
+            connection=self.connection,
+            message=self.message,
+            template=normalize_error_message(self.message),
+            client=context.get("client"),
+            server=context.get("server"),
+            request=context.get("request"),
+            upstream=context.get("upstream"),
+            host=context.get("host"),
+        )
+
+
+def _parse_error_time(value: str) -> datetime:
+    # Fixed-width 'YYYY/MM/DD HH:MM:SS', much faster to slice than strptime.
+    # nginx writes error log times in the server's local time zone, without an offset.
+    return datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[14:16]), int(value[17:19])
+    ).astimezone()
+
+
+def _parse_context(text: str) -> Dict[str, str]:
+    context: Dict[str, str] = {}
+    for field in _CONTEXT_FIELD.finditer(text):
+        value = field.group(2)
+        context[field.group(1)] = value[1:-1] if value.startswith('"') else value
+    return context
+
+
+def parse_error_log_entry(text: str) -> Optional[ErrorLogRecord]:
+    """
+    Parses one error log entry: its header line plus any continuation lines
+    (e.g. multi-line FastCGI stderr output). Returns None if it doesn't match.
+    """
+    match = _HEADER.match(text)
+    if match is None:
+        return None
+    timestamp, level, pid, tid, connection, rest = match.groups()
+    try:
+        log_time = _parse_error_time(timestamp)
+    except ValueError:
+        return None
+
+    context_match = _CONTEXT_START.search(rest)
+    message, context = rest, ''
+    if context_match is not None:
+        message, context = rest[:context_match.start()], rest[context_match.start() + 2:]
+    return ErrorLogRecord(
+        log_time, level, int(pid), int(tid), int(connection) if connection else None, message.rstrip(), context
+    )
+
+
+@lru_cache(maxsize=8192)
+def normalize_error_message(message: str) -> str:
+    """
+    Reduces a message to its template by masking variable parts, e.g.
+    'connect() failed (111: Connection refused) while connecting to upstream'
+    becomes 'connect() failed (<n>: Connection refused) while connecting to upstream'.
+    """
+    def mask(match: re.Match) -> str:
+        token = match.group(0)
+        if token[0] == '"':
+            return '"<*>"'
+        if token[0] == '/':
+            return '<path>'
+        if token[0] == '[' or token.count('.') == 3:
+            return '<ip>'
+        if token.startswith('0x'):
+            return '<hex>'
+        return '<n>'
+
+    return ' '.join(_TEMPLATE_TOKENS.sub(mask, message).split())
+
+
+def _iter_entries_forward(lines: Iterable[str]) -> Iterator[ErrorLogRecord]:
+    pending: List[str] = []
+    for line in lines:
+        if _LINE_START_TEXT.match(line) and pending:
+            record = parse_error_log_entry(''.join(pending).rstrip('\n'))
+            if record is not None:
+                yield record
+            pending = []
+        pending.append(line)
+    if pending:
+        record = parse_error_log_entry(''.join(pending).rstrip('\n'))
+        if record is not None:
+            yield record
+
+
+def iter_error_log(path: Path) -> Iterator[ErrorLogRecord]:
+    """Yields the entries of an (optionally gzipped) error log, oldest first."""
+    with open_log_text(path) as log_file:
+        yield from _iter_entries_forward(log_file)
+
+
+def _iter_entries_reversed(path: Path) -> Iterator[ErrorLogRecord]:
+    with open(path, 'rb') as f:
+        continuation: List[bytes] = []
+        for _, line in iter_lines_reversed(f, os.fstat(f.fileno()).st_size):
+            if not _LINE_START_BYTES.match(line):
+                continuation.append(line)
+                continue
+            text = b'\n'.join([line, *reversed(continuation)]).decode('utf-8', errors='ignore')
+            continuation = []
+            record = parse_error_log_entry(text)
+            if record is not None:
+                yield record
+
+
+def read_error_log(path: str, limit: int, min_level: Optional[str] = None,
+                   since: Optional[datetime] = None) -> List[ErrorLogEntry]:
+    """
+    Returns the newest `limit` entries of an error log at or above `min_level`,
+    newest first. Plain logs are read backwards from the end, so only the
+    entries returned (and those skipped by the filters) are parsed.
+    """
+    min_rank = _LEVEL_RANKS.get(min_level, 0) if min_level else 0
+    path = Path(path)
+
+    if path.suffix == '.gz':
+        matched = deque(maxlen=limit)
+        for record in iter_error_log(path):
+            if _LEVEL_RANKS.get(record.level, 0) >= min_rank and (since is None or record.time >= since):
+                matched.append(record)
+        return [record.to_entry() for record in reversed(matched)]
+
+    entries = []
+    for record in _iter_entries_reversed(path):
+        if since is not None and record.time < since:
+            break
+        if _LEVEL_RANKS.get(record.level, 0) >= min_rank:
+            entries.append(record.to_entry())
+            if len(entries) >= limit:
+                break
+    return entries
+
+
+def aggregate_error_log(path: str, granularity: str = "hour", min_level: Optional[str] = None,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        limit: int = 50) -> ErrorLogSummary:
+    """
+    Streams through an error log and counts entries per message template and
+    per time bucket. Returns the `limit` most frequent templates. Runs in a
+    worker process, so it only takes and returns picklable values.
+    """
+    min_rank = _LEVEL_RANKS.get(min_level, 0) if min_level else 0
+    seconds = ERROR_BUCKET_SECONDS[granularity]
+    templates: Dict[str, List] = {}  # template -> [count, level, first, last, example, buckets]
+    total = 0
+
+    for record in iter_error_log(Path(path)):
+        if (start is not None and record.time < start) or (end is not None and record.time >= end):
+            continue
+        if _LEVEL_RANKS.get(record.level, 0) < min_rank:
+            continue
+        total += 1
+        template = normalize_error_message(record.message)
+        summary = templates.get(template)
+        if summary is None:
+            if len(templates) >= MAX_ERROR_TEMPLATES:
+                template = "<other>"
+                summary = templates.get(template)
+            if summary is None:
+                summary = templates[template] = [0, record.level, record.time, record.time, record.message, {}]
+        summary[0] += 1
+        if _LEVEL_RANKS.get(record.level, 0) > _LEVEL_RANKS.get(summary[1], 0):
+            summary[1] = record.level
+        summary[3] = record.time
+        epoch = int(record.time.timestamp())
+        bucket_start = epoch - epoch % seconds
+        buckets = summary[5]
+        if bucket_start in buckets or len(buckets) < MAX_BUCKETS_PER_TEMPLATE:
+            buckets[bucket_start] = buckets.get(bucket_start, 0) + 1
+
+    ranked = sorted(templates.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return ErrorLogSummary(
+        log_name=Path(path).name,
+        granularity=granularity,
+        total=total,
+        templates=[
+            ErrorTemplateCount(
+                template=template,
+                level=level,
+                count=count,
+                first_seen=first_seen.isoformat(),
+                last_seen=last_seen.isoformat(),
+                example=example,
+                buckets={
+                    datetime.fromtimestamp(bucket_start, timezone.utc).isoformat(): bucket_count
+                    for bucket_start, bucket_count in sorted(buckets.items())
+                },
+            )
+            for template, (count, level, first_seen, last_seen, example, buckets) in ranked
+        ],
+    )
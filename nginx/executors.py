@@ -0,0 +1,29 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import threading
+
+from config import Config
+from helpers.logger import logger
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool used for CPU-bound log parsing, creating it on first use."""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            logger.info(f"Starting log parsing process pool with {Config.NGINX_LOG_WORKERS} workers.")
+            _process_pool = ProcessPoolExecutor(max_workers=Config.NGINX_LOG_WORKERS)
+        return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Shuts down the shared process pool if it was started."""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+            logger.info("Log parsing process pool shut down.")
@@ -0,0 +1,258 @@
+import gzip
+import math
+import os
+import shutil
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .log_parser import compile_log_format
+from .log_format import get_log_format
+from .log_index import INDEX_ORDER_SLACK_SECONDS, filter_time_range
+
+
+# Each block is a complete gzip member, so an archive is still an ordinary .gz
+# file to zcat, logrotate and everything else. The member header carries an
+# extra field (RFC 1952 FEXTRA) describing the block: its compressed length,
+# so the next header can be found without decompressing, its uncompressed
+# length and line count, and the time of its first parseable line.
+_GZIP_MAGIC = b'\x1f\x8b\x08'
+_FEXTRA = 0x04
+_BLOCK_SUBFIELD_ID = b'LB'
+_BLOCK_INFO = struct.Struct('<IIId')  # member length, uncompressed length, line count, first timestamp
+_BLOCK_EXTRA = _BLOCK_SUBFIELD_ID + struct.pack('<H', _BLOCK_INFO.size)
+_MEMBER_HEADER = struct.Struct('<3sBIBBH')  # magic, flags, mtime, extra flags, OS, extra length
+_HEADER_SIZE = _MEMBER_HEADER.size + len(_BLOCK_EXTRA) + _BLOCK_INFO.size
+_OS_UNKNOWN = 255
+
+
+class ArchiveIndex(NamedTuple):
+    """
+    The blocks of a compacted log: block i is the gzip member at bytes
+    offsets[i]:offsets[i + 1] of the file and holds the uncompressed bytes
+    positions[i]:positions[i + 1] of the log. Both arrays end with a sentinel.
+    """
+    offsets: array
+    positions: array
+    line_counts: array
+    timestamps: array  # first line's epoch time; blocks without one take the previous block's
+
+    def __len__(self) -> int:
+        return len(self.line_counts)
+
+    def find_block(self, start: datetime) -> int:
+        """Returns the first block that can contain a line logged at or after `start`."""
+        return max(0, bisect_right(self.timestamps, start.timestamp() - INDEX_ORDER_SLACK_SECONDS) - 1)
+
+    def find_end_block(self, end: datetime) -> int:
+        """Returns the first block that only holds lines logged after `end` (len(self) if none does)."""
+        return bisect_right(self.timestamps, end.timestamp() + INDEX_ORDER_SLACK_SECONDS)
+
+    def find_position(self, position: int) -> int:
+        """Returns the block holding uncompressed byte `position`."""
+        return bisect_right(self.positions, position) - 1
+
+
+class ArchiveCompaction(NamedTuple):
+    status: str  # compacted, already_compacted, empty or rotated (renamed while being compacted)
+    blocks: int
+    original_bytes: int
+    archived_bytes: int
+
+
+def _encode_block(data: bytes, first_timestamp: float) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    line_count = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+    member_size = _HEADER_SIZE + len(body) + 8
+    header = _MEMBER_HEADER.pack(_GZIP_MAGIC, _FEXTRA, 0, 0, _OS_UNKNOWN, len(_BLOCK_EXTRA) + _BLOCK_INFO.size)
+    info = _BLOCK_INFO.pack(member_size, len(data), line_count, first_timestamp)
+    trailer = struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff)
+    return header + _BLOCK_EXTRA + info + body + trailer
+
+
+def _first_timestamp(lines: List[bytes], parse) -> float:
+    for line in lines:
+        record = parse(line.decode('utf-8', errors='ignore'))
+        if record is not None:
+            return record.time.timestamp()
+    return math.nan
+
+
+def read_archive_index(path: Path) -> Optional[ArchiveIndex]:
+    """
+    Reads the block index of a compacted log by hopping from member header to
+    member header, or returns None if the file isn't a compacted archive
+    (an ordinary .gz, or one that was appended to after compaction). Blocking.
+    """
+    offsets, positions, line_counts, timestamps = array('q', [0]), array('q', [0]), array('I'), array('d')
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None
+        while offsets[-1] < size:
+            f.seek(offsets[-1])
+            header = f.read(_HEADER_SIZE)
+            if len(header) < _HEADER_SIZE:
+                return None
+            magic, flags, _, _, _, _ = _MEMBER_HEADER.unpack_from(header)
+            extra = header[_MEMBER_HEADER.size:_MEMBER_HEADER.size + len(_BLOCK_EXTRA)]
+            if magic != _GZIP_MAGIC or not flags & _FEXTRA or extra != _BLOCK_EXTRA:
+                return None
+            member_size, raw_size, line_count, first_timestamp = _BLOCK_INFO.unpack_from(header, _HEADER_SIZE - _BLOCK_INFO.size)
+            if math.isnan(first_timestamp):
+                first_timestamp = timestamps[-1] if timestamps else -math.inf
+            offsets.append(offsets[-1] + member_size)
+            positions.append(positions[-1] + raw_size)
+            line_counts.append(line_count)
+            timestamps.append(first_timestamp)
+    if offsets[-1] != size:
+        return None
+    return ArchiveIndex(offsets, positions, line_counts, timestamps)
+
+
+_archive_indexes: Dict[Path, Tuple[Tuple[int, int, int], Optional[ArchiveIndex]]] = {}
+_archive_indexes_lock = threading.Lock()
+
+
+def get_archive_index(path: Path) -> Optional[ArchiveIndex]:
+    """
+    Returns the block index of a compacted log (None for any other file),
+    cached until the file's inode, size or mtime changes. Blocking.
+    """
+    stats = os.stat(path)
+    fingerprint = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+    with _archive_indexes_lock:
+        cached = _archive_indexes.get(path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    index = read_archive_index(path) if path.suffix == '.gz' else None
+    with _archive_indexes_lock:
+        _archive_indexes[path] = (fingerprint, index)
+    return index
+
+
+def read_block(f: BinaryIO, index: ArchiveIndex, block: int) -> bytes:
+    """Decompresses one block of an open archive."""
+    f.seek(index.offsets[block])
+    return zlib.decompress(f.read(index.offsets[block + 1] - index.offsets[block]), 16 + zlib.MAX_WBITS)
+
+
+def iter_blocks(path: Path, index: ArchiveIndex, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+    """Yields the decompressed blocks start..stop of an archive, in order."""
+    with open(path, 'rb') as f:
+        for block in range(start, len(index) if stop is None else stop):
+            yield read_block(f, index, block)
+
+
+def iter_blocks_reversed(path: Path, index: ArchiveIndex, stop: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yields (block number, decompressed block) for the blocks before `stop`, last block first."""
+    with open(path, 'rb') as f:
+        for block in reversed(range(len(index) if stop is None else stop)):
+            yield block, read_block(f, index, block)
+
+
+def compact_log_archive(path: str, log_format: str, block_bytes: int) -> ArchiveCompaction:
+    """
+    Recompresses a gzipped log into independently compressed blocks of about
+    `block_bytes` of whole lines, replacing it atomically. Permissions and
+    times are kept (rotations are skipped by mtime), and the content is
+    unchanged, byte for byte. Runs in a worker process, so it only takes and
+    returns picklable values.
+    """
+    log_path = Path(path)
+    stats = os.stat(log_path)
+    index = read_archive_index(log_path)
+    if index is not None:
+        return ArchiveCompaction("already_compacted", len(index), stats.st_size, stats.st_size)
+
+    parse = compile_log_format(log_format).parse
+    tmp_path = log_path.with_name(f".{log_path.name}.compact")
+    blocks = 0
+    try:
+        with gzip.open(log_path, 'rb') as source, open(tmp_path, 'wb') as target:
+            while True:
+                lines = source.readlines(block_bytes)
+                if not lines:
+                    break
+                target.write(_encode_block(b''.join(lines), _first_timestamp(lines, parse)))
+                blocks += 1
+        if not blocks:
+            return ArchiveCompaction("empty", 0, stats.st_size, stats.st_size)
+
+        shutil.copystat(log_path, tmp_path)
+        try:
+            os.chown(tmp_path, stats.st_uid, stats.st_gid)
+        except PermissionError:
+            pass
+        if os.stat(log_path).st_ino != stats.st_ino:
+            # logrotate moved it on meanwhile; replacing would clobber the file now at this name.
+            return ArchiveCompaction("rotated", 0, stats.st_size, stats.st_size)
+        archived_bytes = os.path.getsize(tmp_path)
+        os.replace(tmp_path, log_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return ArchiveCompaction("compacted", blocks, stats.st_size, archived_bytes)
+
+
+def read_compressed_tail(path: Path, lines: int) -> str:
+    """
+    Returns the last `lines` lines of a gzipped log. For a compacted archive
+    only the last blocks holding that many lines are decompressed; other .gz
+    files have to be decompressed in full. Blocking.
+    """
+    if lines <= 0:
+        return ""
+
+    index = get_archive_index(path)
+    if index is None:
+        with gzip.open(path, 'rb') as f:
+            tail = deque(f, maxlen=lines)
+        return b''.join(tail).decode('utf-8', errors='ignore')
+
+    blocks = []
+    line_count = 0
+    for block, data in iter_blocks_reversed(path, index):
+        blocks.append(data)
+        line_count += index.line_counts[block]
+        if line_count >= lines:
+            break
+    data = b''.join(reversed(blocks))
+    trailing_newline = data.endswith(b'\n')
+    parts = (data[:-1] if trailing_newline else data).rsplit(b'\n', lines)
+    if len(parts) > lines:
+        parts = parts[1:]
+    return (b'\n'.join(parts) + (b'\n' if trailing_newline else b'')).decode('utf-8', errors='ignore')
+
+
+def read_compressed_time_range(path: Path, start: Optional[datetime], end: Optional[datetime]) -> Iterator[bytes]:
+    """
+    Returns an iterator over the lines of a gzipped access log logged within
+    [start, end). For a compacted archive the block index (read here, blocking)
+    limits decompression to the blocks overlapping the range; other .gz files
+    are decompressed from the start.
+    """
+    start_ts = start.timestamp() if start is not None else float('-inf')
+    end_ts = end.timestamp() if end is not None else float('inf')
+    parse = compile_log_format(get_log_format(path)).parse
+    index = get_archive_index(path)
+    if index is None:
+        return filter_time_range(_iter_gzip_chunks(path), start_ts, end_ts, parse)
+    first = index.find_block(start) if start is not None else 0
+    stop = index.find_end_block(end) if end is not None else len(index)
+    return filter_time_range(iter_blocks(path, index, first, stop), start_ts, end_ts, parse)
+
+
+def _iter_gzip_chunks(path: Path, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    with gzip.open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
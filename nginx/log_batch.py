@@ -0,0 +1,379 @@
+import math
+import sys
+from array import array
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import compress
+from pathlib import Path
+from socket import AF_INET, inet_ntop, inet_pton
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from .models import StructuredLogEntry
+from .log_parser import COMBINED_LOG_FORMAT, AccessLogRecord, compile_log_format
+from .log_query import LogQuery
+from .log_reader import open_log_text
+from .log_archive import ArchiveIndex, get_archive_index, iter_blocks_reversed
+
+
+_MICROSECONDS = 1_000_000
+_MISSING = float('nan')
+
+# AccessLogRecord string fields, stored as code columns (see DictionaryColumn and IpColumn).
+STRING_COLUMNS = ("ip", "method", "path", "query", "protocol", "referer", "user_agent", "host", "upstream_addr")
+
+
+class DictionaryColumn:
+    """
+    A string column stored as one integer code per row plus the list of distinct
+    values, with code 0 meaning None. Paths, user agents and methods repeat
+    heavily, so each distinct string is kept once however many rows use it, and
+    a predicate only has to be evaluated once per distinct value.
+    """
+
+    __slots__ = ("codes", "values", "_lookup")
+
+    def __init__(self, values: Optional[List[Optional[str]]] = None, lookup: Optional[Dict[str, int]] = None):
+        self.codes = array('I')
+        self.values: List[Optional[str]] = values if values is not None else [None]
+        self._lookup: Dict[str, int] = lookup if lookup is not None else {}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def find(self, value: Optional[str]) -> Optional[int]:
+        """The code of `value`, or None if no row has it."""
+        return 0 if value is None else self._lookup.get(value)
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.values[code]
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self.decode(self.codes[row])
+
+    def extend(self, values: Sequence[Optional[str]]) -> None:
+        encoded = {value: self.encode(value) for value in set(values)}
+        self.codes.extend(map(encoded.__getitem__, values))
+
+    def matching_codes(self, predicate: Callable[[str], bool]) -> Set[int]:
+        """The codes of the (non-None) values that satisfy `predicate`."""
+        return {code for code, value in enumerate(self.values) if value is not None and predicate(value)}
+
+    def __getstate__(self):
+        # The reverse lookup is rebuilt on unpickling rather than shipped from worker processes.
+        return self.codes, self.values
+
+    def __setstate__(self, state) -> None:
+        self.codes, self.values = state
+        self._lookup = {value: code for code, value in enumerate(self.values) if value is not None}
+
+
+class IpColumn(DictionaryColumn):
+    """
+    Client addresses. An IPv4 address is packed into its code (0 to 2**32 - 1),
+    so the column's many distinct addresses need no strings at all; anything
+    else (IPv6, '-') is dictionary-encoded and stored as -1 minus its index.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, values: Optional[List[Optional[str]]] = None, lookup: Optional[Dict[str, int]] = None):
+        super().__init__(values, lookup)
+        self.codes = array('q')
+
+    @staticmethod
+    def _pack(value: Optional[str]) -> Optional[int]:
+        if value is None or value.count('.') != 3:
+            return None
+        try:
+            packed = inet_pton(AF_INET, value)
+        except OSError:
+            return None
+        # Only canonical dotted quads, so that decoding gives back the logged string.
+        return int.from_bytes(packed, 'big') if inet_ntop(AF_INET, packed) == value else None
+
+    def encode(self, value: Optional[str]) -> int:
+        packed = self._pack(value)
+        return packed if packed is not None else -1 - super().encode(value)
+
+    def find(self, value: Optional[str]) -> Optional[int]:
+        packed = self._pack(value)
+        if packed is not None:
+            return packed
+        code = super().find(value)
+        return -1 - code if code is not None else None
+
+    def decode(self, code: int) -> Optional[str]:
+        return inet_ntop(AF_INET, code.to_bytes(4, 'big')) if code >= 0 else self.values[-1 - code]
+
+    def matching_codes(self, predicate: Callable[[str], bool]) -> Set[int]:
+        """The codes of the (non-None) values that satisfy `predicate`: packed addresses are decoded from the codes in use."""
+        matching = {
+            -1 - index for index, value in enumerate(self.values)
+            if value is not None and predicate(value)
+        }
+        matching.update(code for code in set(self.codes) if code >= 0 and predicate(self.decode(code)))
+        return matching
+
+
+@lru_cache(maxsize=64)
+def _utc_offset(seconds: int) -> timezone:
+    return timezone.utc if seconds == 0 else timezone(timedelta(seconds=seconds))
+
+
+# The parser hands out one datetime object per second of traffic, so these are mostly cache hits.
+@lru_cache(maxsize=4096)
+def _epoch_microseconds(value: datetime) -> int:
+    return int(value.timestamp()) * _MICROSECONDS + value.microsecond
+
+
+@lru_cache(maxsize=4096)
+def _utc_offset_seconds(value: datetime) -> int:
+    offset = value.utcoffset()
+    return int(offset.total_seconds()) if offset is not None else 0
+
+
+class LogBatch:
+    """
+    Access log records stored column by column: times (epoch microseconds and
+    UTC offset), status codes, sizes and latencies in typed arrays, IPv4
+    addresses packed into integers and the other strings dictionary-encoded.
+    A row takes well under 100 bytes instead of a tuple of Python objects,
+    batches pickle cheaply out of worker processes, and filters and analytics
+    work on whole columns. Rows are only turned back into
+    records or StructuredLogEntry objects (`record`, `to_entry`) at the API edge.
+    Batches are append-only; `slice` shares the string dictionaries, `take`
+    re-encodes them so values no longer referenced are dropped.
+    """
+
+    __slots__ = ("times", "utc_offsets", "status_codes", "response_sizes", "request_times_ms",
+                 "upstream_times_ms") + STRING_COLUMNS
+
+    def __init__(self):
+        self.times = array('q')
+        self.utc_offsets = array('i')
+        self.status_codes = array('H')
+        self.response_sizes = array('q')
+        self.request_times_ms = array('d')  # NaN when not logged
+        self.upstream_times_ms = array('d')
+        for name in STRING_COLUMNS:
+            setattr(self, name, IpColumn() if name == "ip" else DictionaryColumn())
+
+    @classmethod
+    def from_records(cls, records: Iterable[AccessLogRecord]) -> "LogBatch":
+        batch = cls()
+        batch.extend(records)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def extend(self, records: Iterable[AccessLogRecord]) -> None:
+        """Appends records column by column, encoding each distinct string once."""
+        records = list(records)
+        if not records:
+            return
+        columns = dict(zip(AccessLogRecord._fields, zip(*records)))
+        self.times.extend(map(_epoch_microseconds, columns["time"]))
+        self.utc_offsets.extend(map(_utc_offset_seconds, columns["time"]))
+        self.status_codes.extend(columns["status_code"])
+        self.response_sizes.extend(columns["response_size"])
+        self.request_times_ms.extend([_MISSING if value is None else value for value in columns["request_time_ms"]])
+        self.upstream_times_ms.extend([_MISSING if value is None else value for value in columns["upstream_response_time_ms"]])
+        for name in STRING_COLUMNS:
+            getattr(self, name).extend(columns[name])
+
+    def extend_batch(self, other: "LogBatch") -> None:
+        """Appends all rows of `other`, translating its string codes into this batch's dictionaries."""
+        for name in ("times", "utc_offsets", "status_codes", "response_sizes", "request_times_ms", "upstream_times_ms"):
+            getattr(self, name).extend(getattr(other, name))
+        for name in STRING_COLUMNS:
+            column, other_column = getattr(self, name), getattr(other, name)
+            translated = {code: column.encode(other_column.decode(code)) for code in set(other_column.codes)}
+            column.codes.extend(map(translated.__getitem__, other_column.codes))
+
+    def slice(self, start: int, stop: int) -> "LogBatch":
+        """Rows [start, stop) as a new batch that shares this one's string dictionaries."""
+        batch = LogBatch.__new__(LogBatch)
+        for name in ("times", "utc_offsets", "status_codes", "response_sizes", "request_times_ms", "upstream_times_ms"):
+            setattr(batch, name, getattr(self, name)[start:stop])
+        for name in STRING_COLUMNS:
+            column = getattr(self, name)
+            sliced = type(column)(column.values, column._lookup)
+            sliced.codes = column.codes[start:stop]
+            setattr(batch, name, sliced)
+        return batch
+
+    def take(self, rows: Sequence[int]) -> "LogBatch":
+        """The given rows, in that order, as a new batch with dictionaries of just the values they use."""
+        batch = LogBatch()
+        for name in ("times", "utc_offsets", "status_codes", "response_sizes", "request_times_ms", "upstream_times_ms"):
+            column = getattr(self, name)
+            getattr(batch, name).extend(map(column.__getitem__, rows))
+        for name in STRING_COLUMNS:
+            column, taken = getattr(self, name), getattr(batch, name)
+            codes = list(map(column.codes.__getitem__, rows))
+            translated = {code: taken.encode(column.decode(code)) for code in set(codes)}
+            taken.codes.extend(map(translated.__getitem__, codes))
+        return batch
+
+    def time(self, row: int) -> datetime:
+        micros = self.times[row]
+        return datetime.fromtimestamp(micros // _MICROSECONDS, _utc_offset(self.utc_offsets[row])).replace(
+            microsecond=micros % _MICROSECONDS
+        )
+
+    def record(self, row: int) -> AccessLogRecord:
+        request_time = self.request_times_ms[row]
+        upstream_time = self.upstream_times_ms[row]
+        return AccessLogRecord(
+            time=self.time(row),
+            ip=self.ip[row],
+            method=self.method[row],
+            path=self.path[row],
+            query=self.query[row],
+            protocol=self.protocol[row],
+            status_code=self.status_codes[row],
+            response_size=self.response_sizes[row],
+            referer=self.referer[row],
+            user_agent=self.user_agent[row],
+            host=self.host[row],
+            request_time_ms=None if math.isnan(request_time) else request_time,
+            upstream_response_time_ms=None if math.isnan(upstream_time) else upstream_time,
+            upstream_addr=self.upstream_addr[row],
+        )
+
+    def to_entry(self, row: int) -> StructuredLogEntry:
+        return self.record(row).to_entry()
+
+    def select(self, query: LogQuery) -> Sequence[int]:
+        """
+        Returns the rows matching `query`, in order. String filters are evaluated
+        once per distinct value, and each condition is applied to a whole column
+        with C-level map/compress rather than a per-row Python branch.
+        """
+        rows: Sequence[int] = range(len(self))
+        conditions = []
+        if query.statuses:
+            conditions.append((self.status_codes, query.statuses.__contains__))
+        if query.ip is not None:
+            conditions.append((self.ip.codes, {self.ip.find(query.ip)}.__contains__))
+        if query.method is not None:
+            conditions.append((self.method.codes, {self.method.find(query.method)}.__contains__))
+        if query.path_prefix is not None:
+            prefix = query.path_prefix
+            conditions.append((self.path.codes, self.path.matching_codes(lambda path: path.startswith(prefix)).__contains__))
+        if query.since is not None:
+            since = int(query.since.timestamp() * _MICROSECONDS)
+            conditions.append((self.times, since.__le__))
+        if query.until is not None:
+            until = int(query.until.timestamp() * _MICROSECONDS)
+            conditions.append((self.times, until.__gt__))
+        for column, keep in conditions:
+            rows = list(compress(rows, map(keep, map(column.__getitem__, rows))))
+        return rows
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the columns and their distinct string values."""
+        total = 0
+        for name in ("times", "utc_offsets", "status_codes", "response_sizes", "request_times_ms", "upstream_times_ms"):
+            column = getattr(self, name)
+            total += column.itemsize * len(column)
+        for name in STRING_COLUMNS:
+            column = getattr(self, name)
+            total += column.codes.itemsize * len(column.codes) + sys.getsizeof(column.values)
+            total += sum(sys.getsizeof(value) for value in column.values if value is not None)
+        return total
+
+
+def parse_log_file(path: str, limit: int, log_format: str = COMBINED_LOG_FORMAT) -> LogBatch:
+    """
+    Parses a whole (optionally gzipped) access log and returns a batch of its
+    newest `limit` records, in file order. Of a compacted archive only the
+    last blocks are decompressed. Runs in a worker process, so it only takes
+    and returns picklable values.
+    """
+    parse = compile_log_format(log_format).parse
+    index = get_archive_index(Path(path)) if path.endswith('.gz') else None
+    if index is not None:
+        return _parse_archive_tail(Path(path), index, limit, parse)
+    records = deque(maxlen=limit)
+    with open_log_text(Path(path)) as log_file:
+        for line in log_file:
+            record = parse(line)
+            if record is not None:
+                records.append(record)
+    return LogBatch.from_records(records)
+
+
+def _parse_archive_tail(path: Path, index: ArchiveIndex, limit: int, parse) -> LogBatch:
+    blocks = []
+    parsed = 0
+    for _, data in iter_blocks_reversed(path, index):
+        records = [record for record in map(parse, data.decode('utf-8', errors='ignore').split('\n')) if record is not None]
+        blocks.append(records)
+        parsed += len(records)
+        if parsed >= limit:
+            break
+    records = [record for block in reversed(blocks) for record in block]
+    return LogBatch.from_records(records[-limit:])
+
+
+def _benchmark(line_count: int = 100000) -> None:
+    """
+    Compares the memory held by parsed entries as StructuredLogEntry objects,
+    as AccessLogRecord tuples and as a LogBatch. Run with `python -m nginx.log_batch`.
+    """
+    import random
+    import time
+    import tracemalloc
+
+    start_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    paths = ['/', '/api/items', '/static/app.js', '/login', '/images/logo.png'] + [f'/blog/post-{i}' for i in range(200)]
+    agents = [f'Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/{version}.0' for version in range(100, 130)]
+    lines = [
+        f'10.0.{random.randint(0, 255)}.{random.randint(0, 255)} - - '
+        f'[{(start_time + timedelta(seconds=i // 50)).strftime("%d/%b/%Y:%H:%M:%S %z")}] '
+        f'"GET {random.choice(paths)} HTTP/1.1" {random.choice([200, 200, 304, 404, 502])} {random.randint(0, 50000)} '
+        f'"https://example.com/" "{random.choice(agents)}"\n'
+        for i in range(line_count)
+    ]
+    parse = compile_log_format().parse
+
+    def measure(build):
+        tracemalloc.start()
+        began = time.perf_counter()
+        result = build()
+        seconds = time.perf_counter() - began
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size, seconds
+
+    _, entries_size, _ = measure(lambda: [parse(line).to_entry() for line in lines])
+    records, records_size, _ = measure(lambda: [parse(line) for line in lines])
+    batch, batch_size, _ = measure(lambda: LogBatch.from_records(parse(line) for line in lines))
+    query = LogQuery(statuses=[404], path_prefix='/blog/')
+    began = time.perf_counter()
+    expected = [record for record in records if query.matches(record)]
+    scan_seconds = time.perf_counter() - began
+    began = time.perf_counter()
+    selected = batch.select(query)
+    select_seconds = time.perf_counter() - began
+    assert len(selected) == len(expected)
+
+    print(f"entries:               {line_count}")
+    print(f"StructuredLogEntry:    {entries_size / line_count:>10.0f} bytes/entry")
+    print(f"AccessLogRecord:       {records_size / line_count:>10.0f} bytes/entry")
+    print(f"LogBatch:              {batch_size / line_count:>10.0f} bytes/entry")
+    print(f"filter records:        {scan_seconds * 1000:>10.1f} ms")
+    print(f"LogBatch.select:       {select_seconds * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
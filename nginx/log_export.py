@@ -0,0 +1,244 @@
+import csv
+import gzip
+import io
+import itertools
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple
+
+from .models import StructuredLogEntry
+from .log_parser import AccessLogRecord, compile_log_format
+from .log_format import get_log_format
+from .log_batch import LogBatch
+from .log_index import INDEX_ORDER_SLACK_SECONDS, get_log_index
+from .log_archive import get_archive_index, iter_blocks
+from .log_query import LogQuery
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional.
+    pyarrow = None
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FIELDS = list(StructuredLogEntry.model_fields)
+EXPORT_READ_SIZE = 1024 * 1024
+PARQUET_ROW_GROUP_ROWS = 64 * 1024
+
+
+class LogExport(NamedTuple):
+    body: Iterator[bytes]
+    media_type: str
+    filename: str
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def iter_matching_records(log_files: List[Path], query: LogQuery) -> Iterator[List[AccessLogRecord]]:
+    """
+    Yields lists of records matching `query` from `log_files` (ordered newest
+    first, as from discover_rotated_logs), oldest first, one list per chunk
+    read. Plain logs are read from the sparse index offset of `since`, and
+    compacted archives from the block holding it; reading stops shortly after
+    `until`. Rotations last written before `since` are skipped. Only one chunk
+    of lines is held at a time.
+    """
+    for log_path in reversed(log_files):
+        try:
+            if query.since is not None and datetime.fromtimestamp(os.stat(log_path).st_mtime, timezone.utc) < query.since:
+                continue
+            if log_path.suffix == '.gz':
+                chunks = _iter_compressed_chunks(log_path, query)
+            else:
+                start = 0
+                if query.since is not None:
+                    index = get_log_index(log_path)
+                    index.update()
+                    start = index.find_offset(query.since)
+                chunks = _iter_plain_chunks(open(log_path, 'rb'), start)
+        except FileNotFoundError:
+            # Rotated away (and compressed or deleted) since the export started.
+            continue
+        parse = compile_log_format(get_log_format(log_path)).parse
+        yield from _iter_file_matches(chunks, parse, query)
+
+
+def _iter_plain_chunks(log_file, start: int) -> Iterator[bytes]:
+    with log_file:
+        log_file.seek(start)
+        while True:
+            chunk = log_file.read(EXPORT_READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _iter_compressed_chunks(log_path: Path, query: LogQuery) -> Iterator[bytes]:
+    index = get_archive_index(log_path)
+    if index is not None:
+        return iter_blocks(log_path, index, index.find_block(query.since) if query.since is not None else 0)
+    return _iter_plain_chunks(gzip.open(log_path, 'rb'), 0)
+
+
+def _iter_file_matches(chunks: Iterable[bytes], parse, query: LogQuery) -> Iterator[List[AccessLogRecord]]:
+    stop_after = query.until.timestamp() + INDEX_ORDER_SLACK_SECONDS if query.until is not None else float('inf')
+    pending = b''
+    for chunk in itertools.chain(chunks, (b'',)):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop() if chunk else b''
+        matched = []
+        for line in lines:
+            if not query.prefilter(line):
+                continue
+            record = parse(line.decode('utf-8', errors='ignore'))
+            if record is None:
+                continue
+            if record.time.timestamp() >= stop_after:
+                # Past `until` (allowing for out-of-order lines): nothing later in this file can match.
+                if matched:
+                    yield matched
+                return
+            if query.matches(record):
+                matched.append(record)
+        if matched:
+            yield matched
+
+
+def iter_ndjson(chunks: Iterator[List[AccessLogRecord]]) -> Iterator[bytes]:
+    for records in chunks:
+        yield b''.join(record.to_entry().model_dump_json().encode() + b'\n' for record in records)
+
+
+def iter_csv(chunks: Iterator[List[AccessLogRecord]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for records in chunks:
+        for record in records:
+            entry = record.to_entry()
+            writer.writerow(["" if value is None else value for value in (getattr(entry, field) for field in EXPORT_FIELDS)])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only stream that hands what was written so far to the caller, for streaming Parquet."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def _parquet_schema():
+    string = pyarrow.string()
+    return pyarrow.schema([
+        ("timestamp", pyarrow.timestamp('us', tz='UTC')),
+        ("utc_offset_seconds", pyarrow.int32()),
+        ("ip", string),
+        ("method", string),
+        ("path", string),
+        ("query", string),
+        ("protocol", string),
+        ("status_code", pyarrow.uint16()),
+        ("response_size", pyarrow.int64()),
+        ("referer", string),
+        ("user_agent", string),
+        ("host", string),
+        ("request_time_ms", pyarrow.float64()),
+        ("upstream_response_time_ms", pyarrow.float64()),
+        ("upstream_addr", string),
+    ])
+
+
+def _batch_to_arrow(batch: LogBatch, schema):
+    def strings(column):
+        return [column.decode(code) for code in column.codes]
+
+    return pyarrow.RecordBatch.from_arrays([
+        pyarrow.array(batch.times, schema.field("timestamp").type),
+        pyarrow.array(batch.utc_offsets, pyarrow.int32()),
+        pyarrow.array(strings(batch.ip), pyarrow.string()),
+        pyarrow.array(strings(batch.method), pyarrow.string()),
+        pyarrow.array(strings(batch.path), pyarrow.string()),
+        pyarrow.array(strings(batch.query), pyarrow.string()),
+        pyarrow.array(strings(batch.protocol), pyarrow.string()),
+        pyarrow.array(batch.status_codes, pyarrow.uint16()),
+        pyarrow.array(batch.response_sizes, pyarrow.int64()),
+        pyarrow.array(strings(batch.referer), pyarrow.string()),
+        pyarrow.array(strings(batch.user_agent), pyarrow.string()),
+        pyarrow.array(strings(batch.host), pyarrow.string()),
+        # NaN marks a missing latency in LogBatch; from_pandas turns it into null.
+        pyarrow.array(batch.request_times_ms, pyarrow.float64(), from_pandas=True),
+        pyarrow.array(batch.upstream_times_ms, pyarrow.float64(), from_pandas=True),
+        pyarrow.array(strings(batch.upstream_addr), pyarrow.string()),
+    ], schema=schema)
+
+
+def iter_parquet(chunks: Iterator[List[AccessLogRecord]]) -> Iterator[bytes]:
+    """
+    Writes a Parquet row group every PARQUET_ROW_GROUP_ROWS records, buffered
+    as a LogBatch, and yields the bytes as they are produced. Timestamps are
+    stored as UTC instants with each line's original UTC offset alongside;
+    missing values are nulls.
+    """
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        batch = LogBatch()
+        for records in chunks:
+            batch.extend(records)
+            if len(batch) >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_batch(_batch_to_arrow(batch, schema))
+                batch = LogBatch()
+                yield sink.drain()
+        if len(batch):
+            writer.write_batch(_batch_to_arrow(batch, schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_EXPORT_WRITERS = {
+    "ndjson": iter_ndjson,
+    "csv": iter_csv,
+    "parquet": iter_parquet,
+}
+
+
+def export_records(log_files: List[Path], query: LogQuery, export_format: str) -> LogExport:
+    """
+    Returns a lazily generated export of the records matching `query`, oldest
+    first, in `export_format` (ndjson, csv or parquet). Blocking iterator:
+    each step reads and converts one chunk of the logs.
+    """
+    body = _EXPORT_WRITERS[export_format](iter_matching_records(log_files, query))
+    return LogExport(body, EXPORT_MEDIA_TYPES[export_format], f"access-log-export.{export_format}")
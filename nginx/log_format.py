@@ -0,0 +1,78 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from helpers.logger import logger
+from .log_parser import COMBINED_LOG_FORMAT
+from .conf_parser import include_pattern, parse_conf_file, walk
+
+
+_ROTATION_SUFFIX = re.compile(r'\.\d+(\.gz)?$')
+
+
+class _LogFormatConfig:
+    """The log_format definitions and access_log -> format mapping found in the nginx config."""
+
+    def __init__(self):
+        self.formats: Dict[str, str] = {"combined": COMBINED_LOG_FORMAT}
+        self.access_logs: Dict[str, str] = {}
+        self.sources: List[Tuple[str, int]] = []
+
+    def load(self, conf_path: Path) -> None:
+        seen = set()
+        for directive, source, _ in walk(parse_conf_file(conf_path)):
+            if source.path not in seen:
+                seen.add(source.path)
+                if source.mtime_ns is not None:
+                    self.sources.append((source.path, source.mtime_ns))
+                for _, message in source.errors:
+                    logger.warning(f"Problem reading nginx config {source.path} for log formats: {message}")
+            args = directive.args
+            if directive.name == 'log_format' and len(args) >= 2:
+                strings = [arg for arg in args[1:] if not arg.startswith('escape=')]
+                self.formats[args[0]] = ''.join(strings)
+            elif directive.name == 'access_log' and args and args[0] != 'off' and '$' not in args[0]:
+                self.access_logs[os.path.normpath(args[0])] = args[1] if len(args) > 1 and '=' not in args[1] else "combined"
+            elif directive.name == 'include' and args:
+                include_dir = os.path.dirname(include_pattern(args[0]))
+                if os.path.isdir(include_dir):
+                    # Picks up files added to or removed from e.g. sites-enabled/.
+                    self.sources.append((include_dir, os.stat(include_dir).st_mtime_ns))
+
+    def is_current(self) -> bool:
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime for path, mtime in self.sources)
+        except OSError:
+            return False
+
+
+_config: Optional[_LogFormatConfig] = None
+_config_lock = threading.Lock()
+
+
+def _get_config() -> _LogFormatConfig:
+    global _config
+    with _config_lock:
+        if _config is None or not _config.is_current():
+            _config = _LogFormatConfig()
+            _config.load(Path(Config.NGINX_CONF_FILE))
+        return _config
+
+
+def get_log_format(log_path: Path) -> str:
+    """
+    Returns the log_format string nginx uses to write `log_path` (or a rotation of
+    it), as configured by `access_log` in nginx.conf and its includes. Falls back
+    to the predefined 'combined' format.
+    """
+    config = _get_config()
+    current_log = _ROTATION_SUFFIX.sub('', os.path.normpath(str(log_path)))
+    format_name = config.access_logs.get(current_log, "combined")
+    log_format = config.formats.get(format_name)
+    if log_format is None:
+        logger.warning(f"access_log {current_log} uses undefined log_format '{format_name}'; assuming 'combined'.")
+        return COMBINED_LOG_FORMAT
+    return log_format
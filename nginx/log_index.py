@@ -0,0 +1,231 @@
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from helpers.logger import logger
+from .log_parser import compile_log_format
+from .log_format import get_log_format
+
+
+INDEX_BLOCK_SIZE = 64 * 1024
+# Lines are written when requests finish, so timestamps can be slightly out of order.
+INDEX_ORDER_SLACK_SECONDS = 5
+_INDEX_MAGIC = b'NGXIDX1\n'
+_INDEX_HEADER = struct.Struct('<QQQQ')  # inode, block size, next block start, entry count
+_PROBE_BYTES = 8 * 1024
+
+
+def index_path_for(log_path: Path) -> Path:
+    """Where a log's index is kept: a hidden file next to it."""
+    return log_path.parent / f".{log_path.name}.idx"
+
+
+class SparseLogIndex:
+    """
+    A sparse timestamp -> byte offset index for one access log: for each
+    INDEX_BLOCK_SIZE block, the offset and time of the first complete line that
+    starts in it. It is persisted next to the log as a hidden `.<name>.idx` file,
+    extended incrementally as the log grows and rebuilt when the log is rotated
+    (inode change) or truncated.
+    """
+
+    def __init__(self, log_path: Path, block_size: int = INDEX_BLOCK_SIZE):
+        self.log_path = Path(log_path)
+        self.index_path = index_path_for(self.log_path)
+        self.block_size = block_size
+        self.inode: Optional[int] = None
+        self.next_block = 0
+        self.timestamps = array('d')
+        self.offsets = array('q')
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _reset(self, inode: int) -> None:
+        self.inode = inode
+        self.next_block = 0
+        self.timestamps = array('d')
+        self.offsets = array('q')
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.index_path, 'rb') as f:
+                if f.read(len(_INDEX_MAGIC)) != _INDEX_MAGIC:
+                    return
+                inode, block_size, next_block, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                if block_size != self.block_size:
+                    return
+                timestamps, offsets = array('d'), array('q')
+                timestamps.fromfile(f, count)
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return
+        self.inode, self.next_block, self.timestamps, self.offsets = inode, next_block, timestamps, offsets
+
+    def _save(self) -> None:
+        tmp_path = self.index_path.with_name(self.index_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_INDEX_MAGIC)
+                f.write(_INDEX_HEADER.pack(self.inode, self.block_size, self.next_block, len(self.offsets)))
+                self.timestamps.tofile(f)
+                self.offsets.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            # The index still works from memory; it just has to be rebuilt after a restart.
+            logger.debug(f"Could not persist log index {self.index_path}: {e}")
+
+    def update(self) -> None:
+        """Extends the index over blocks appended since the last update. Blocking."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            stats = os.stat(self.log_path)
+            if stats.st_ino != self.inode or stats.st_size < self.next_block:
+                if self.inode is not None:
+                    logger.info(f"{self.log_path.name} was rotated or truncated; rebuilding its time index.")
+                self._reset(stats.st_ino)
+
+            if self.next_block >= stats.st_size:
+                return
+
+            parse = compile_log_format(get_log_format(self.log_path)).parse
+            added = 0
+            with open(self.log_path, 'rb') as f:
+                # Only complete blocks are indexed; range reads scan the tail from the last entry.
+                while self.next_block + self.block_size <= stats.st_size:
+                    probe = self._probe_block(f, self.next_block, stats.st_size, parse)
+                    if probe:
+                        self.timestamps.append(probe[0])
+                        self.offsets.append(probe[1])
+                        added += 1
+                    self.next_block += self.block_size
+
+            if added:
+                self._save()
+                logger.debug(f"Indexed {added} new blocks of {self.log_path.name} ({len(self.offsets)} total).")
+
+    def _probe_block(self, f, block_start: int, size: int, parse) -> Tuple[float, int]:
+        """
+        Returns (timestamp, offset) of the first parseable line starting in the
+        block, or () if there is none. Reads a small probe first and only falls
+        back to the whole block for unusually long or unparseable lines.
+        """
+        read_from = max(0, block_start - 1)
+        for probe_size in (_PROBE_BYTES, self.block_size + _PROBE_BYTES):
+            f.seek(read_from)
+            data = f.read(min(probe_size, size - read_from))
+            result = self._first_record_in_block(data, read_from, block_start, parse)
+            if result is not None:
+                return result
+        return ()
+
+    def _first_record_in_block(self, data: bytes, read_from: int, block_start: int, parse):
+        block_end = block_start + self.block_size
+        # data starts one byte before the block, so a line starting exactly at block_start is found too.
+        position = 0 if block_start == 0 else data.find(b'\n') + 1
+        if block_start > 0 and position == 0:
+            return None
+        while read_from + position < block_end:
+            line_end = data.find(b'\n', position)
+            if line_end == -1:
+                return None
+            record = parse(data[position:line_end].decode('utf-8', errors='ignore'))
+            if record is not None:
+                return record.time.timestamp(), read_from + position
+            position = line_end + 1
+        return ()
+
+    def find_offset(self, start: datetime) -> int:
+        """Returns a byte offset at or before the first line logged at or after `start`."""
+        with self._lock:
+            i = bisect_right(self.timestamps, start.timestamp() - INDEX_ORDER_SLACK_SECONDS) - 1
+            return self.offsets[i] if i >= 0 else 0
+
+    def find_end_offset(self, end: datetime) -> Optional[int]:
+        """
+        Returns a line-start byte offset at or after the last line logged before
+        `end`, or None if that may be in the unindexed tail of the file.
+        """
+        with self._lock:
+            i = bisect_right(self.timestamps, end.timestamp() + INDEX_ORDER_SLACK_SECONDS)
+            return self.offsets[i] if i < len(self.offsets) else None
+
+
+_indexes: Dict[Path, SparseLogIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def discard_log_index(log_path: Path) -> None:
+    """Forgets the index of a deleted log, in memory and on disk. Blocking."""
+    with _indexes_lock:
+        _indexes.pop(log_path, None)
+    index_path_for(log_path).unlink(missing_ok=True)
+
+
+def get_log_index(log_path: Path) -> SparseLogIndex:
+    """Returns the shared index for a log file, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(log_path)
+        if index is None:
+            index = _indexes[log_path] = SparseLogIndex(log_path)
+        return index
+
+
+def read_time_range(log_path: Path, start: Optional[datetime], end: Optional[datetime],
+                    chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """
+    Returns an iterator over the lines of an access log logged within [start, end).
+    The sparse index is brought up to date here (blocking), so the iterator only
+    reads the slice between the block found for `start` and the first line past `end`.
+    """
+    offset = 0
+    if start is not None:
+        index = get_log_index(log_path)
+        index.update()
+        offset = index.find_offset(start)
+    start_ts = start.timestamp() if start is not None else float('-inf')
+    end_ts = end.timestamp() if end is not None else float('inf')
+    parse = compile_log_format(get_log_format(log_path)).parse
+    return filter_time_range(_iter_chunks(log_path, offset, chunk_size), start_ts, end_ts, parse)
+
+
+def _iter_chunks(log_path: Path, offset: int, chunk_size: int) -> Iterator[bytes]:
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def filter_time_range(chunks: Iterator[bytes], start_ts: float, end_ts: float, parse) -> Iterator[bytes]:
+    """
+    Yields the complete lines in `chunks` (consecutive pieces of a log starting
+    at a line boundary) logged within [start_ts, end_ts), joined per chunk.
+    Stops reading once lines are clearly past `end_ts`.
+    """
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        matched = []
+        for line in lines:
+            record = parse(line.decode('utf-8', errors='ignore'))
+            if record is None:
+                continue
+            timestamp = record.time.timestamp()
+            if timestamp >= end_ts + INDEX_ORDER_SLACK_SECONDS:
+                if matched:
+                    yield b''.join(matched)
+                return
+            if start_ts <= timestamp < end_ts:
+                matched.append(line + b'\n')
+        if matched:
+            yield b''.join(matched)
@@ -0,0 +1,287 @@
+import asyncio
+import os
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+from config import Config
+from helpers.logger import logger
+from .models import StructuredLogEntry, TrafficRollup
+from .log_parser import AccessLogRecord, compile_log_format
+from .log_format import get_log_format
+from .log_reader import LogFollower, discover_rotated_logs
+from .log_query import LogQuery
+
+
+CHECKPOINT_COLLECTION = "nginx_log_ingest_checkpoints"
+INGEST_READ_BYTES = 4 * 1024 * 1024
+
+
+def record_to_document(record: AccessLogRecord, log_name: str) -> Dict[str, Any]:
+    document = record._asdict()
+    del document["time"], document["host"]
+    document["timestamp"] = record.time
+    # The time-series metaField: low-cardinality values that documents are bucketed by.
+    document["meta"] = {"log": log_name, "host": record.host}
+    return document
+
+
+def document_to_entry(document: Dict[str, Any]) -> StructuredLogEntry:
+    timestamp = document["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    values = {field: document.get(field) for field in AccessLogRecord._fields}
+    values.update(time=timestamp, host=document.get("meta", {}).get("host"))
+    return AccessLogRecord(**values).to_entry()
+
+
+class AccessLogIngester:
+    """
+    Tails access.log into a MongoDB time-series collection with batched
+    insert_many calls. The read position (file inode and byte offset) is
+    checkpointed after every batch; after a restart, ingestion resumes there,
+    first finishing the rotated file if the log was rotated in between.
+    Delivery is at-least-once: a crash between an insert and its checkpoint
+    re-inserts that batch.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, log_path: Path):
+        self.db = db
+        self.collection = db[Config.NGINX_LOG_INGEST_COLLECTION]
+        self.checkpoints = db[CHECKPOINT_COLLECTION]
+        self.log_path = Path(log_path)
+        self._follower: Optional[LogFollower] = None
+        self._buffer: List[Dict[str, Any]] = []
+        self._checkpoint_pending = False  # inserted entries the checkpoint doesn't cover yet
+
+    async def ensure_collection(self) -> None:
+        name = Config.NGINX_LOG_INGEST_COLLECTION
+        retention = int(Config.NGINX_LOG_INGEST_RETENTION_DAYS * 24 * 60 * 60)
+        try:
+            await self.db.create_collection(
+                name,
+                timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=retention,
+            )
+            logger.info(f"Created time-series collection '{name}' with {Config.NGINX_LOG_INGEST_RETENTION_DAYS} days retention.")
+        except CollectionInvalid:
+            await self.db.command("collMod", name, expireAfterSeconds=retention)
+        await self.collection.create_index([("meta.log", 1), ("timestamp", DESCENDING)])
+        await self.collection.create_index([("status_code", 1), ("timestamp", DESCENDING)])
+        await self.collection.create_index([("ip", 1), ("timestamp", DESCENDING)])
+
+    def _new_follower(self, path: Path, inode: int, offset: int) -> LogFollower:
+        follower = LogFollower(path, max_catch_up_bytes=None, max_read_bytes=INGEST_READ_BYTES)
+        follower.inode, follower.offset = inode, offset
+        return follower
+
+    def _find_by_inode(self, inode: int) -> Optional[Path]:
+        """Finds the plain (not yet compressed) rotation of the log that has this inode."""
+        for log_path in discover_rotated_logs(self.log_path.parent, self.log_path.name, Config.NGINX_MAX_LOG_ROTATIONS):
+            if log_path.suffix != '.gz' and os.stat(log_path).st_ino == inode:
+                return log_path
+        return None
+
+    async def _resume(self) -> None:
+        checkpoint = await self.checkpoints.find_one({"_id": str(self.log_path)})
+        current_inode = (await asyncio.to_thread(os.stat, self.log_path)).st_ino
+        if checkpoint is None:
+            logger.info(f"No ingestion checkpoint for {self.log_path.name}; ingesting it from the start.")
+            self._follower = self._new_follower(self.log_path, current_inode, 0)
+            return
+        inode, offset = checkpoint["inode"], checkpoint["offset"]
+        log_path = self.log_path if inode == current_inode else await asyncio.to_thread(self._find_by_inode, inode)
+        if log_path is None:
+            logger.warning(f"The file checkpointed for {self.log_path.name} is gone; resuming from the start of the current log.")
+            self._follower = self._new_follower(self.log_path, current_inode, 0)
+            return
+        logger.info(f"Resuming ingestion of {log_path.name} at byte {offset}.")
+        self._follower = self._new_follower(log_path, inode, offset)
+
+    def _read_documents(self) -> List[Dict[str, Any]]:
+        """Reads and parses the next lines, moving on to the current log once a rotated one is finished. Blocking."""
+        while True:
+            current_inode = os.stat(self.log_path).st_ino
+            follower = self._follower
+            if follower.path == self.log_path and follower.inode != current_inode:
+                # Rotated since the last read: finish the old file before starting the new one.
+                rotated = self._find_by_inode(follower.inode)
+                if rotated is not None:
+                    self._follower = self._new_follower(rotated, follower.inode, follower.offset)
+                else:
+                    self._follower = self._new_follower(self.log_path, current_inode, 0)
+                continue
+            if follower.path != self.log_path:
+                lines = follower.read_new_lines() if os.stat(follower.path).st_ino == follower.inode else []
+                if not lines:
+                    logger.info(f"Finished ingesting rotated log {follower.path.name}.")
+                    self._follower = self._new_follower(self.log_path, current_inode, 0)
+                    continue
+            else:
+                lines = follower.read_new_lines()
+
+            parse = compile_log_format(get_log_format(follower.path)).parse
+            documents = []
+            for line in lines:
+                record = parse(line)
+                if record is not None:
+                    documents.append(record_to_document(record, self.log_path.name))
+            return documents
+
+    async def _save_checkpoint(self) -> None:
+        await self.checkpoints.update_one(
+            {"_id": str(self.log_path)},
+            {"$set": {
+                "file": self._follower.path.name,
+                "inode": self._follower.inode,
+                "offset": self._follower.offset,
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True,
+        )
+
+    async def _flush(self) -> bool:
+        """
+        Inserts the buffered documents, then checkpoints the read position.
+        Time-series collections have no unique index to absorb duplicates, so
+        only documents known not to be written are buffered again: those a
+        bulk write reports as failed, or all of them if the insert failed as
+        a whole. The checkpoint is only written once nothing is left to retry,
+        and a failed checkpoint is retried on its own.
+        """
+        documents, self._buffer = self._buffer, []
+        if documents:
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = sorted({error["index"] for error in e.details.get("writeErrors", [])})
+                self._checkpoint_pending = True
+                if failed:
+                    logger.error(f"Failed to ingest {len(failed)} of {len(documents)} access log entries, will retry them: {e}")
+                    self._buffer = [documents[index] for index in failed] + self._buffer
+                    return False
+            except PyMongoError as e:
+                logger.error(f"Failed to ingest {len(documents)} access log entries, will retry: {e}")
+                self._buffer = documents + self._buffer
+                return False
+            self._checkpoint_pending = True
+        try:
+            await self._save_checkpoint()
+        except PyMongoError as e:
+            logger.error(f"Failed to checkpoint access log ingestion, will retry: {e}")
+            return False
+        self._checkpoint_pending = False
+        logger.debug(f"Ingested {len(documents)} access log entries (offset {self._follower.offset} in {self._follower.path.name}).")
+        return True
+
+    async def run(self) -> None:
+        await self.ensure_collection()
+        await self._resume()
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        try:
+            while True:
+                read_any = False
+                # While MongoDB is unavailable, stop reading instead of buffering without bound.
+                if len(self._buffer) < Config.NGINX_LOG_INGEST_BATCH_SIZE:
+                    try:
+                        documents = await asyncio.to_thread(self._read_documents)
+                    except OSError as e:
+                        logger.warning(f"Could not read {self.log_path} for ingestion: {e}")
+                        documents = []
+                    self._buffer.extend(documents)
+                    read_any = bool(documents)
+                due = loop.time() - last_flush >= Config.NGINX_LOG_INGEST_FLUSH_SECONDS
+                if len(self._buffer) >= Config.NGINX_LOG_INGEST_BATCH_SIZE or ((self._buffer or self._checkpoint_pending) and due):
+                    if await self._flush():
+                        last_flush = loop.time()
+                    else:
+                        read_any = False
+                if not read_any:
+                    await asyncio.sleep(min(Config.NGINX_LOG_INGEST_FLUSH_SECONDS, Config.NGINX_LOG_POLL_SECONDS))
+        finally:
+            if (self._buffer or self._checkpoint_pending) and self._follower is not None:
+                await self._flush()
+
+
+_ingester: Optional[AccessLogIngester] = None
+
+
+def start_ingester(db: AsyncIOMotorDatabase) -> AccessLogIngester:
+    global _ingester
+    _ingester = AccessLogIngester(db, Path(Config.NGINX_LOG_DIR) / "access.log")
+    return _ingester
+
+
+def get_ingester() -> Optional[AccessLogIngester]:
+    return _ingester
+
+
+def _query_filter(query: LogQuery) -> Dict[str, Any]:
+    conditions: Dict[str, Any] = {}
+    if query.statuses:
+        conditions["status_code"] = {"$in": sorted(query.statuses)}
+    if query.ip:
+        conditions["ip"] = query.ip
+    if query.method:
+        conditions["method"] = query.method
+    if query.path_prefix:
+        conditions["path"] = {"$regex": f"^{re.escape(query.path_prefix)}"}
+    time_range = {}
+    if query.since is not None:
+        time_range["$gte"] = query.since
+    if query.until is not None:
+        time_range["$lt"] = query.until
+    if time_range:
+        conditions["timestamp"] = time_range
+    return conditions
+
+
+async def find_ingested_entries(ingester: AccessLogIngester, query: LogQuery, limit: int) -> List[StructuredLogEntry]:
+    """Returns ingested entries matching `query`, newest first, using the collection's indexes."""
+    cursor = ingester.collection.find(_query_filter(query), {"_id": 0}).sort("timestamp", DESCENDING).limit(limit)
+    return [document_to_entry(document) async for document in cursor]
+
+
+async def aggregate_ingested_traffic(ingester: AccessLogIngester, granularity: str,
+                                     start: Optional[datetime], end: Optional[datetime]) -> List[TrafficRollup]:
+    """Computes TrafficRollup buckets of `granularity` (minute, hour or day) with a server-side aggregation."""
+    pipeline: List[Dict[str, Any]] = []
+    match = _query_filter(LogQuery(since=start, until=end))
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$group": {
+        "_id": {
+            "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+            "status_class": {"$floor": {"$divide": ["$status_code", 100]}},
+            "method": {"$ifNull": ["$method", "-"]},
+        },
+        "requests": {"$sum": 1},
+        "bytes_sent": {"$sum": "$response_size"},
+    }})
+
+    buckets: Dict[datetime, TrafficRollup] = {}
+    async for group in ingester.collection.aggregate(pipeline):
+        key = group["_id"]
+        bucket_start = key["bucket"].replace(tzinfo=timezone.utc) if key["bucket"].tzinfo is None else key["bucket"]
+        rollup = buckets.get(bucket_start)
+        if rollup is None:
+            rollup = buckets[bucket_start] = TrafficRollup(
+                bucket_start=bucket_start.isoformat(),
+                requests=0,
+                status_classes={f"{i}xx": 0 for i in range(1, 6)},
+                bytes_sent=0,
+                methods={},
+            )
+        rollup.requests += group["requests"]
+        rollup.bytes_sent += group["bytes_sent"]
+        status_class = f"{int(key['status_class'])}xx"
+        if status_class in rollup.status_classes:
+            rollup.status_classes[status_class] += group["requests"]
+        rollup.methods[key["method"]] = rollup.methods.get(key["method"], 0) + group["requests"]
+    return [buckets[bucket_start] for bucket_start in sorted(buckets)]
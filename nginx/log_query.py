@@ -0,0 +1,217 @@
+import base64
+import gzip
+import io
+import json
+import os
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from .log_parser import AccessLogRecord, as_utc, compile_log_format
+from .log_format import get_log_format
+from .log_reader import iter_lines_reversed
+from .log_index import INDEX_ORDER_SLACK_SECONDS, get_log_index
+from .log_archive import ArchiveIndex, get_archive_index, iter_blocks_reversed
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed or its log file no longer exists."""
+
+
+class LogQuery:
+    """
+    Filters for access log records. `prefilter` is a cheap necessary condition
+    checked on the raw line bytes, so most non-matching lines are rejected
+    before they are parsed at all; `matches` is the exact check on a record.
+    Naive `since`/`until` values are taken as UTC.
+    """
+
+    def __init__(
+        self,
+        statuses: Sequence[int] = (),
+        ip: Optional[str] = None,
+        method: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.statuses = frozenset(statuses)
+        self.ip = ip
+        self.method = method.upper() if method else None
+        self.path_prefix = path_prefix
+        self.since = as_utc(since)
+        self.until = as_utc(until)
+        self._needles = [needle.encode() for needle in (ip, self.method, path_prefix) if needle]
+        self._status_needles = [str(status).encode() for status in self.statuses]
+
+    def prefilter(self, line: bytes) -> bool:
+        for needle in self._needles:
+            if needle not in line:
+                return False
+        if self._status_needles and not any(needle in line for needle in self._status_needles):
+            return False
+        return True
+
+    def matches(self, record: AccessLogRecord) -> bool:
+        return (
+            (not self.statuses or record.status_code in self.statuses)
+            and (self.ip is None or record.ip == self.ip)
+            and (self.method is None or record.method == self.method)
+            and (self.path_prefix is None or (record.path or '').startswith(self.path_prefix))
+            and (self.since is None or record.time >= self.since)
+            and (self.until is None or record.time < self.until)
+        )
+
+    def is_before_window(self, record: AccessLogRecord) -> bool:
+        """Whether scanning backwards has passed `since` (allowing for slightly out-of-order lines)."""
+        return self.since is not None and record.time.timestamp() < self.since.timestamp() - INDEX_ORDER_SLACK_SECONDS
+
+
+def encode_cursor(log_path: Path, inode: int, offset: int) -> str:
+    raw = json.dumps({"f": log_path.name, "i": inode, "o": offset}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, log_files: List[Path]) -> Tuple[int, int]:
+    """
+    Returns (index into log_files, offset) for a cursor. The file is found by
+    inode, so a cursor stays valid when logrotate renames access.log to access.log.1.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        name, inode, offset = str(data["f"]), int(data["i"]), int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Malformed cursor.")
+    for i, log_path in enumerate(log_files):
+        try:
+            if os.stat(log_path).st_ino == inode:
+                return i, offset
+        except OSError:
+            continue
+    raise InvalidCursorError(f"The log file '{name}' this cursor points into no longer exists.")
+
+
+def _scan_plain_log(log_path: Path, end: Optional[int], query: LogQuery, limit: int) -> Tuple[List[Tuple[int, AccessLogRecord]], bool]:
+    """
+    Scans a plain log backwards from byte `end` (EOF, or the index position of
+    `until`, if None). Returns up to `limit` matching (offset, record) pairs,
+    newest first, and whether the scan reached `since`, so that older files
+    don't need to be read. With `since`, the sparse index gives the offset to
+    stop at, so lines rejected by the prefilter never need to be parsed.
+    """
+    parse = compile_log_format(get_log_format(log_path)).parse
+    index = None
+    if query.since is not None or query.until is not None:
+        index = get_log_index(log_path)
+        index.update()
+
+    with open(log_path, 'rb') as f:
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+            until_offset = index.find_end_offset(query.until) if query.until is not None else None
+            if until_offset is not None:
+                end = until_offset
+        stop = index.find_offset(query.since) if query.since is not None else 0
+
+        matches: List[Tuple[int, AccessLogRecord]] = []
+        for offset, line in iter_lines_reversed(f, end):
+            if offset < stop:
+                return matches, True
+            if not query.prefilter(line):
+                continue
+            record = parse(line.decode('utf-8', errors='ignore'))
+            if record is not None and query.matches(record):
+                matches.append((offset, record))
+                if len(matches) >= limit:
+                    return matches, False
+        return matches, stop > 0
+
+
+def _scan_archived_log(log_path: Path, index: ArchiveIndex, end: Optional[int], query: LogQuery,
+                       limit: int) -> Tuple[List[Tuple[int, AccessLogRecord]], bool]:
+    """
+    Scans a compacted archive backwards one block at a time, like
+    _scan_plain_log: from the block holding uncompressed offset `end` (or the
+    last block that can hold lines before `until`), stopping after the block
+    that starts before `since`. Offsets are uncompressed, as for other .gz logs.
+    """
+    parse = compile_log_format(get_log_format(log_path)).parse
+    if end is not None:
+        stop = index.find_position(end - 1) + 1 if end > 0 else 0
+    else:
+        stop = index.find_end_block(query.until) if query.until is not None else len(index)
+    since_ts = query.since.timestamp() - INDEX_ORDER_SLACK_SECONDS if query.since is not None else None
+
+    matches: List[Tuple[int, AccessLogRecord]] = []
+    for block, data in iter_blocks_reversed(log_path, index, stop):
+        position = index.positions[block]
+        for offset, line in iter_lines_reversed(io.BytesIO(data), len(data)):
+            if end is not None and position + offset >= end:
+                continue
+            if not query.prefilter(line):
+                continue
+            record = parse(line.decode('utf-8', errors='ignore'))
+            if record is not None and query.matches(record):
+                matches.append((position + offset, record))
+                if len(matches) >= limit:
+                    return matches, False
+        if since_ts is not None and index.timestamps[block] < since_ts:
+            return matches, True
+    return matches, False
+
+
+def _scan_compressed_log(log_path: Path, end: Optional[int], query: LogQuery, limit: int) -> Tuple[List[Tuple[int, AccessLogRecord]], bool]:
+    """
+    Gzipped rotations can't be read backwards, so this streams the file forwards
+    (up to uncompressed offset `end`) keeping only the last `limit` matches.
+    Compacted archives are instead scanned backwards block by block.
+    """
+    index = get_archive_index(log_path)
+    if index is not None:
+        return _scan_archived_log(log_path, index, end, query, limit)
+    parse = compile_log_format(get_log_format(log_path)).parse
+    matches = deque(maxlen=limit)
+    reached_since = False
+    offset = 0
+    with gzip.open(log_path, 'rb') as f:
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if end is not None and line_offset >= end:
+                break
+            if line_offset == 0 and query.since is not None:
+                first_record = parse(line.decode('utf-8', errors='ignore'))
+                reached_since = first_record is not None and query.is_before_window(first_record)
+            if not query.prefilter(line):
+                continue
+            record = parse(line.decode('utf-8', errors='ignore'))
+            if record is not None and query.matches(record):
+                matches.append((line_offset, record))
+    return list(reversed(matches)), reached_since
+
+
+def run_log_query(log_files: List[Path], query: LogQuery, limit: int,
+                  cursor: Optional[str] = None) -> Tuple[List[AccessLogRecord], Optional[str]]:
+    """
+    Returns up to `limit` records matching `query` from `log_files` (ordered
+    newest first, as from discover_rotated_logs), newest first, plus an opaque
+    cursor for the next page or None when there are no older files to scan.
+    Blocking; run it off the event loop.
+    """
+    first_file, end = 0, None
+    if cursor:
+        first_file, end = decode_cursor(cursor, log_files)
+
+    results: List[AccessLogRecord] = []
+    for i in range(first_file, len(log_files)):
+        log_path = log_files[i]
+        inode = os.stat(log_path).st_ino
+        scan = _scan_compressed_log if log_path.suffix == '.gz' else _scan_plain_log
+        matches, reached_since = scan(log_path, end if i == first_file else None, query, limit - len(results))
+        results.extend(record for _, record in matches)
+        if len(results) >= limit:
+            return results, encode_cursor(log_path, inode, matches[-1][0])
+        if reached_since:
+            break
+    return results, None
@@ -0,0 +1,301 @@
+import os
+import re
+import gzip
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from helpers.logger import logger
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+
+TAIL_BLOCK_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class LogStream(NamedTuple):
+    """A prepared streaming response body for a log file."""
+    status_code: int
+    headers: Dict[str, str]
+    media_type: str
+    body: Iterator[bytes]
+
+
+class LogFollower:
+    """
+    Follows a growing log file by inode and byte offset, returning the complete
+    lines appended since the previous read. An inode change (rotation) or the
+    file shrinking (truncation) restarts reading at the beginning of the new file.
+    The first read starts `initial_bytes` before EOF. If the reader falls more
+    than `max_catch_up_bytes` behind, it skips ahead; with None it never skips
+    and instead reads at most `max_read_bytes` per call. `restarts` counts the
+    rotations and truncations seen, so callers can drop what they kept of the old
+    file, and `skipped_bytes` the bytes jumped over while catching up.
+    Not thread-safe; callers serialise reads.
+    """
+
+    def __init__(self, path: Path, initial_bytes: int = 0, max_catch_up_bytes: Optional[int] = 10 * 1024 * 1024,
+                 max_read_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.initial_bytes = initial_bytes
+        self.max_catch_up_bytes = max_catch_up_bytes
+        self.max_read_bytes = max_read_bytes
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.restarts = 0
+        self.skipped_bytes = 0
+
+    def read_new_lines(self) -> List[str]:
+        """Returns the complete lines appended since the last call. Blocking."""
+        try:
+            stats = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+
+        if self.inode is None:
+            start = max(0, stats.st_size - self.initial_bytes)
+        elif stats.st_ino != self.inode:
+            logger.info(f"{self.path.name} was rotated (inode {self.inode} -> {stats.st_ino}). Reading new file from the start.")
+            start = 0
+            self.restarts += 1
+        elif stats.st_size < self.offset:
+            logger.info(f"{self.path.name} was truncated ({self.offset} -> {stats.st_size} bytes). Reading from the start.")
+            start = 0
+            self.restarts += 1
+        else:
+            start = self.offset
+
+        # Don't try to catch up on more than max_catch_up_bytes if we fell far behind.
+        if self.max_catch_up_bytes is not None and stats.st_size - start > self.max_catch_up_bytes:
+            self.skipped_bytes += stats.st_size - self.max_catch_up_bytes - start
+            start = stats.st_size - self.max_catch_up_bytes
+
+        self.inode = stats.st_ino
+        if stats.st_size == start:
+            self.offset = start
+            return []
+
+        with open(self.path, 'rb') as log_file:
+            skip_partial = False
+            if start > 0 and start != self.offset:
+                # Landed at an arbitrary position; drop the partial first line unless
+                # the previous byte ends a line.
+                log_file.seek(start - 1)
+                skip_partial = log_file.read(1) != b'\n'
+            else:
+                log_file.seek(start)
+            read_size = stats.st_size - start
+            if self.max_read_bytes is not None:
+                read_size = min(read_size, self.max_read_bytes)
+            data = log_file.read(read_size)
+
+        line_end = data.rfind(b'\n')
+        if line_end == -1 and len(data) == self.max_read_bytes:
+            # A single line longer than max_read_bytes; drop it rather than stall.
+            self.offset = start + len(data)
+            return []
+        if line_end == -1:
+            # No complete line yet, wait for the writer to finish it.
+            self.offset = start
+            return []
+        self.offset = start + line_end + 1
+
+        lines = data[:line_end].decode('utf-8', errors='ignore').split('\n')
+        return lines[1:] if skip_partial else lines
+
+
+def read_tail(path: Path, lines: int, block_size: int = TAIL_BLOCK_SIZE) -> str:
+    """
+    Returns the last `lines` lines of a file by seeking backwards from EOF in
+    fixed-size blocks, stopping as soon as enough newlines have been seen.
+    Memory use is proportional to the lines returned, not to the file size.
+    Blocking; run it off the event loop.
+    """
+    if lines <= 0:
+        return ""
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        blocks = []
+        newlines = 0
+        trailing_newline = None
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            block = f.read(read_size)
+            if trailing_newline is None:
+                trailing_newline = block.endswith(b'\n')
+                newlines -= 1 if trailing_newline else 0
+            blocks.append(block)
+            newlines += block.count(b'\n')
+            # `lines` separators before the last line means the first wanted line is complete.
+            if newlines >= lines:
+                break
+
+    data = b''.join(reversed(blocks))
+    if trailing_newline:
+        data = data[:-1]
+    parts = data.rsplit(b'\n', lines)
+    if len(parts) > lines:
+        parts = parts[1:]
+    content = b'\n'.join(parts) + (b'\n' if trailing_newline else b'')
+    return content.decode('utf-8', errors='ignore')
+
+
+def iter_lines_reversed(f: BinaryIO, end: int, block_size: int = TAIL_BLOCK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yields (offset, line) pairs for the lines that end at or before byte `end`,
+    last line first, reading backwards in fixed-size blocks. `end` should be a
+    line boundary (a line start or EOF).
+    """
+    pos = end
+    remainder = b''
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        f.seek(pos)
+        lines = (f.read(read_size) + remainder).split(b'\n')
+        # The first piece may continue in the previous block.
+        remainder = lines[0]
+        offsets = []
+        offset = pos + len(remainder) + 1
+        for line in lines[1:]:
+            offsets.append(offset)
+            offset += len(line) + 1
+        for offset, line in zip(reversed(offsets), reversed(lines[1:])):
+            if line:
+                yield offset, line
+    if remainder:
+        yield 0, remainder
+
+
+def parse_range_header(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single `bytes=` range against a file of `size` bytes.
+    Returns (start, stop) with stop exclusive, None if the header is unusable
+    (malformed or multi-range, so the full body should be sent), or raises
+    ValueError if the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition('-'))
+    if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - suffix_length), size
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    stop = int(last) + 1 if last else size
+    return start, min(stop, size)
+
+
+def _if_range_matches(if_range: str, etag: str, mtime: float) -> bool:
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def _iter_file(path: Path, inode: int, start: int, stop: int, chunk_size: int) -> Iterator[bytes]:
+    # Opened on first iteration, so a response that is never sent doesn't leak the handle.
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_ino != inode:
+            raise OSError(f"{path} was rotated before the download started")
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _iter_gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def open_log_stream(path: Path, range_header: Optional[str] = None, if_range: Optional[str] = None,
+                    compress: bool = False, chunk_size: int = STREAM_CHUNK_SIZE) -> LogStream:
+    """
+    Prepares a chunked streaming download of a log file. The size is fixed up
+    front, so bytes appended during the download are not sent and the
+    Content-Length stays accurate; the file itself is only opened once the body
+    is iterated, and must still be the same inode by then. Supports a single HTTP Range (honouring
+    If-Range) or, with `compress`, gzips the whole file on the fly.
+    """
+    stats = os.stat(path)
+    if not os.access(path, os.R_OK):
+        raise PermissionError(f"{path} is not readable")
+    size = stats.st_size
+    etag = f'"{stats.st_ino:x}-{size:x}-{stats.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stats.st_mtime, usegmt=True),
+    }
+
+    if compress:
+        headers["Content-Disposition"] = f'attachment; filename="{path.name}.gz"'
+        return LogStream(200, headers, "application/gzip", _iter_gzip(_iter_file(path, stats.st_ino, 0, size, chunk_size)))
+
+    headers["Accept-Ranges"] = "bytes"
+    byte_range = None
+    if range_header and (if_range is None or _if_range_matches(if_range, etag, stats.st_mtime)):
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return LogStream(416, headers, "text/plain", iter(()))
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return LogStream(200, headers, "text/plain", _iter_file(path, stats.st_ino, 0, size, chunk_size))
+
+    start, stop = byte_range
+    headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    headers["Content-Length"] = str(stop - start)
+    return LogStream(206, headers, "text/plain", _iter_file(path, stats.st_ino, start, stop, chunk_size))
+
+
+def discover_rotated_logs(log_dir: Path, base_name: str = "access.log", max_rotations: int = 20) -> List[Path]:
+    """
+    Finds a log and its logrotate rotations (`name.N` and `name.N.gz`), ordered
+    newest first: [name, name.1, name.2.gz, ...]. Rotations above `max_rotations`
+    are ignored.
+    """
+    rotation_pattern = re.compile(re.escape(base_name) + r'\.(\d+)(\.gz)?$')
+    rotations = []
+    for log_file in log_dir.iterdir():
+        match = rotation_pattern.match(log_file.name)
+        if match and int(match.group(1)) <= max_rotations and log_file.is_file():
+            rotations.append((int(match.group(1)), log_file))
+    rotations.sort(key=lambda rotation: rotation[0])
+
+    base_path = log_dir / base_name
+    logs = [base_path] if base_path.is_file() else []
+    return logs + [log_file for _, log_file in rotations]
+
+
+def open_log_text(path: Path) -> TextIO:
+    """Opens a plain or gzipped log file for reading text lines."""
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8', errors='ignore')
+    return open(path, 'r', encoding='utf-8', errors='ignore')
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .analytics import LogScanAggregate
+from .log_batch import LogBatch
+from .log_parser import compile_log_format
+from .log_reader import open_log_text
+
+
+SCAN_READ_SIZE = 4 * 1024 * 1024
+
+
+def split_log_file(path: Path, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a plain log into (start, end) byte ranges of roughly `chunk_size`,
+    each beginning at a line start and ending just after a newline (or at EOF),
+    so every line falls in exactly one range. Gzipped logs can't be split and
+    are returned as a single range.
+    """
+    size = os.path.getsize(path)
+    if path.suffix == '.gz' or size <= chunk_size:
+        return [(0, size)] if size else []
+
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            boundary = start + chunk_size
+            if boundary >= size:
+                ranges.append((start, size))
+                break
+            f.seek(boundary)
+            # Extend the range to the end of the line it cuts through.
+            while True:
+                block = f.read(64 * 1024)
+                newline = block.find(b'\n')
+                if newline != -1:
+                    boundary = f.tell() - len(block) + newline + 1
+                    break
+                if not block:
+                    boundary = size
+                    break
+            ranges.append((start, boundary))
+            start = boundary
+    return ranges
+
+
+def scan_log_range(path: str, start: int, end: int, log_format: str) -> LogScanAggregate:
+    """
+    Parses the lines in bytes [start, end) of an access log (the whole file if
+    it is gzipped) into a partial aggregate. Runs in a worker process, so it
+    only takes and returns picklable values.
+    """
+    parse = compile_log_format(log_format).parse
+    aggregate = LogScanAggregate()
+    log_path = Path(path)
+
+    if log_path.suffix == '.gz':
+        with open_log_text(log_path) as log_file:
+            while True:
+                lines = log_file.readlines(SCAN_READ_SIZE)
+                if not lines:
+                    break
+                _add_lines(aggregate, parse, lines)
+        return aggregate
+
+    with open(log_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        pending = b''
+        while remaining > 0:
+            data = f.read(min(SCAN_READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            _add_lines(aggregate, parse, [line.decode('utf-8', errors='ignore') for line in lines])
+        if pending:
+            _add_lines(aggregate, parse, [pending.decode('utf-8', errors='ignore')])
+    return aggregate
+
+
+def _add_lines(aggregate: LogScanAggregate, parse, lines: Iterable[str]) -> None:
+    records = []
+    for line in lines:
+        record = parse(line)
+        if record is not None:
+            records.append(record)
+        elif line.strip():
+            aggregate.unparsed_lines += 1
+    aggregate.add(LogBatch.from_records(records))
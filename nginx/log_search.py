@@ -0,0 +1,172 @@
+import gzip
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from .log_archive import get_archive_index, iter_blocks
+from .log_scan import split_log_file
+
+
+# Uncompacted .gz logs are inflated and searched this many bytes at a time.
+GZIP_SEARCH_CHUNK_SIZE = 1024 * 1024
+
+
+class SearchHit(NamedTuple):
+    offset: int  # of the line, in the uncompressed log
+    line: str
+    before: List[str]
+    after: List[str]
+
+
+def compile_search(query: str, regex: bool = False, ignore_case: bool = False) -> Tuple[bytes, Optional[re.Pattern]]:
+    """
+    Returns (needle, pattern) for search_log_range: a plain case-sensitive
+    search only needs bytes.find, everything else a compiled byte regex, in
+    which ^ and $ match at line boundaries. Raises re.error for a bad regex.
+    """
+    needle = query.encode()
+    if not regex and not ignore_case:
+        return needle, None
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    return needle, re.compile(needle if regex else re.escape(needle), flags)
+
+
+def split_search_ranges(path: Path, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a log into ranges to search in parallel: newline-aligned byte
+    ranges of a plain log, runs of blocks of a compacted archive covering about
+    `chunk_size` uncompressed bytes, or a single range for other .gz files.
+    Blocking.
+    """
+    if path.suffix != '.gz':
+        return split_log_file(path, chunk_size)
+    index = get_archive_index(path)
+    if index is None:
+        return [(0, 0)]
+    ranges = []
+    start = 0
+    for block in range(1, len(index) + 1):
+        if block == len(index) or index.positions[block] - index.positions[start] >= chunk_size:
+            ranges.append((start, block))
+            start = block
+    return ranges
+
+
+def search_log_range(path: str, start: int, end: int, needle: bytes, pattern: Optional[re.Pattern],
+                     context: int, limit: int) -> List[SearchHit]:
+    """
+    Returns up to `limit` lines in one range from split_search_ranges that
+    contain `needle` (or match `pattern`), each with up to `context` lines
+    around it. Plain logs are memory-mapped, so only the pages searched are
+    read; for archives the range's blocks are decompressed, and context lines
+    don't reach past them; other .gz files are inflated a chunk at a time,
+    stopping once `limit` hits are found. Runs in a worker process, so it only
+    takes and returns picklable values.
+    """
+    log_path = Path(path)
+    if log_path.suffix != '.gz':
+        with open(log_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Truncated (e.g. by a copytruncate rotation) since the ranges were planned; empty files can't be mapped.
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _search(data, start, min(end, len(data)), 0, needle, pattern, context, limit)
+
+    index = get_archive_index(log_path)
+    if index is None:
+        with gzip.open(log_path, 'rb') as f:
+            return _search_stream(f, needle, pattern, context, limit)
+    data = b''.join(iter_blocks(log_path, index, start, end))
+    return _search(data, 0, len(data), index.positions[start], needle, pattern, context, limit)
+
+
+def _decode(line) -> str:
+    return bytes(line).decode('utf-8', errors='ignore')
+
+
+def _line_start_before(data: bytes, position: int) -> int:
+    """The start of the line ending just before `position`, which follows a newline."""
+    return data.rfind(b'\n', 0, position - 1) + 1
+
+
+def _search_stream(f, needle: bytes, pattern: Optional[re.Pattern], context: int, limit: int,
+                   chunk_size: int = GZIP_SEARCH_CHUNK_SIZE) -> List[SearchHit]:
+    # `data` holds `context` lines already searched (for before-context), lines
+    # still to search from `search_from`, and a trailing partial line. The last
+    # `context` complete lines are held back until more data arrives, so every
+    # hit has its after-context; `base` is the offset of data[0] in the file.
+    hits: List[SearchHit] = []
+    data = b''
+    base = search_from = 0
+    while len(hits) < limit:
+        chunk = f.read(chunk_size)
+        data += chunk
+        if not chunk:
+            search_end = len(data)
+        else:
+            search_end = data.rfind(b'\n') + 1
+            for _ in range(context):
+                if search_end <= search_from:
+                    break
+                search_end = _line_start_before(data, search_end)
+        if search_end > search_from:
+            # The region's final newline is left out so its last line ends at the region's end.
+            region_end = search_end - 1 if data[search_end - 1:search_end] == b'\n' else search_end
+            hits += _search(data, search_from, region_end, base, needle, pattern, context, limit - len(hits))
+            search_from = search_end
+        if not chunk:
+            break
+        keep = search_from
+        for _ in range(context):
+            if keep == 0:
+                break
+            keep = _line_start_before(data, keep)
+        data = data[keep:]
+        base += keep
+        search_from -= keep
+    return hits
+
+
+def _search(data, start: int, end: int, base: int, needle: bytes, pattern: Optional[re.Pattern],
+            context: int, limit: int) -> List[SearchHit]:
+    hits: List[SearchHit] = []
+    position = start
+    while position < end and len(hits) < limit:
+        if pattern is None:
+            found = data.find(needle, position, end)
+            if found == -1:
+                break
+        else:
+            match = pattern.search(data, position, end)
+            if match is None:
+                break
+            found = match.start()
+
+        line_start = data.rfind(b'\n', 0, found) + 1
+        line_end = data.find(b'\n', found, end)
+        if line_end == -1:
+            line_end = end
+
+        before = []
+        previous_end = line_start - 1
+        while len(before) < context and previous_end >= 0:
+            previous_start = data.rfind(b'\n', 0, previous_end) + 1
+            before.append(_decode(data[previous_start:previous_end]))
+            previous_end = previous_start - 1
+        before.reverse()
+
+        after = []
+        next_start = line_end + 1
+        while len(after) < context and next_start < len(data):
+            next_end = data.find(b'\n', next_start)
+            if next_end == -1:
+                next_end = len(data)
+            after.append(_decode(data[next_start:next_end]))
+            next_start = next_end + 1
+
+        hits.append(SearchHit(base + line_start, _decode(data[line_start:line_end]), before, after))
+        # One hit per line: carry on after the matching line.
+        position = line_end + 1
+    return hits
@@ -0,0 +1,143 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from helpers.logger import logger
+from .log_parser import compile_log_format
+from .log_batch import LogBatch
+from .log_format import get_log_format
+from .log_reader import LogFollower
+
+
+# A window grown for a large request goes back to its base size once no
+# request has needed the extra entries for this long.
+WINDOW_SHRINK_SECONDS = 600
+
+# How many skipped time spans a tailer remembers for coverage().
+MAX_COVERAGE_GAPS = 100
+
+
+class AccessLogTailer:
+    """
+    Follows an access log in-process, remembering the file's inode and the byte
+    offset of the last complete line it parsed. Each poll only parses bytes that
+    were appended since the previous poll and keeps a rolling window of records
+    as a columnar LogBatch, using the log_format nginx is configured to write
+    the file with. Rotation is detected by an inode change, truncation by the
+    file shrinking; either empties the window, as its records now live in the
+    rotated file (or are gone). Listeners are called with every LogBatch of new
+    records, in file order; coverage() tells them which times they didn't see.
+    """
+
+    def __init__(self, path: Path, window_size: int = 1000, bootstrap_bytes: int = 10 * 1024 * 1024,
+                 listeners: Iterable[Callable[[LogBatch], None]] = ()):
+        self.path = Path(path)
+        self.bootstrap_bytes = bootstrap_bytes
+        self.base_window_size = window_size
+        self.window_size = window_size
+        self._grown_at = 0.0
+        self.window = LogBatch()
+        self.listeners = list(listeners)
+        self._follower = LogFollower(self.path, initial_bytes=bootstrap_bytes, max_catch_up_bytes=bootstrap_bytes)
+        self._lock = threading.Lock()
+        self._first_time_us: Optional[int] = None
+        self._last_time_us: Optional[int] = None
+        self._gap_since_us: Optional[int] = None  # a skip happened after this record time, not yet followed by a record
+        self._gaps: List[Tuple[int, int]] = []
+
+    def poll(self) -> LogBatch:
+        """
+        Parses any newly appended lines and adds them to the window.
+        Returns the new records in file order. Blocking; run it off the event loop.
+        """
+        with self._lock:
+            restarts, skipped_bytes = self._follower.restarts, self._follower.skipped_bytes
+            lines = self._follower.read_new_lines()
+            if self._follower.skipped_bytes != skipped_bytes and self._gap_since_us is None:
+                self._gap_since_us = self._last_time_us
+            if self._follower.restarts != restarts:
+                self.window = LogBatch()
+            if self.window_size > self.base_window_size and time.monotonic() - self._grown_at > WINDOW_SHRINK_SECONDS:
+                self.window_size = self.base_window_size
+                self.window = self.window.take(range(max(0, len(self.window) - self.window_size), len(self.window)))
+            if not lines:
+                return LogBatch()
+
+            parse = compile_log_format(get_log_format(self.path)).parse
+            new_records = LogBatch.from_records(record for record in map(parse, lines) if record is not None)
+            self._track_coverage(new_records)
+
+            self.window.extend_batch(new_records)
+            if len(self.window) > 2 * self.window_size:
+                # Trimming in one go keeps appends amortised O(1) and drops strings no longer used.
+                self.window = self.window.take(range(len(self.window) - self.window_size, len(self.window)))
+            for listener in self.listeners:
+                try:
+                    listener(new_records)
+                except Exception as e:
+                    logger.exception(f"Access log listener {listener} failed: {e}")
+            logger.debug(f"Parsed {len(new_records)} new records from {self.path.name} (offset now {self._follower.offset}).")
+            return new_records
+
+    def _track_coverage(self, new_records: LogBatch) -> None:
+        if not len(new_records):
+            return
+        first_time_us = new_records.times[0]
+        if self._first_time_us is None:
+            self._first_time_us = first_time_us
+        elif self._gap_since_us is not None:
+            self._gaps.append((self._gap_since_us, first_time_us))
+            del self._gaps[:-MAX_COVERAGE_GAPS]
+        self._gap_since_us = None
+        self._last_time_us = new_records.times[-1]
+
+    def coverage(self) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+        """
+        Returns (time of the first record read, or None before any) and the
+        (last record before, first record after) times, in microseconds, of the
+        spans skipped since because the tailer fell more than bootstrap_bytes
+        behind. Records outside that coverage never reached the listeners.
+        """
+        with self._lock:
+            gaps = list(self._gaps)
+            if self._gap_since_us is not None:
+                # Skipped, and nothing read since: everything after the last record may be missing.
+                gaps.append((self._gap_since_us, 2 ** 63 - 1))
+            return self._first_time_us, gaps
+
+    def ensure_window(self, window_size: int) -> None:
+        """
+        Grows the rolling window to hold at least `window_size` entries, until
+        no caller has asked for more than the base size for WINDOW_SHRINK_SECONDS.
+        """
+        with self._lock:
+            if window_size > self.base_window_size:
+                self._grown_at = time.monotonic()
+            self.window_size = max(self.window_size, window_size)
+
+    def snapshot(self) -> LogBatch:
+        """Returns the newest `window_size` records, in file order."""
+        with self._lock:
+            return self.window.slice(max(0, len(self.window) - self.window_size), len(self.window))
+
+
+_tailers: Dict[Path, AccessLogTailer] = {}
+_tailers_lock = threading.Lock()
+
+
+def get_access_log_tailer(path: Path, window_size: int = 1000,
+                          listeners: Iterable[Callable[[LogBatch], None]] = ()) -> AccessLogTailer:
+    """
+    Returns the shared tailer for a log file, creating it (with `listeners`) on
+    first use. The window grows if a caller needs more entries than it currently keeps.
+    """
+    with _tailers_lock:
+        tailer = _tailers.get(path)
+        if tailer is None:
+            tailer = AccessLogTailer(path, window_size=window_size, bootstrap_bytes=Config.NGINX_LOG_BOOTSTRAP_BYTES, listeners=listeners)
+            _tailers[path] = tailer
+        else:
+            tailer.ensure_window(window_size)
+        return tailer
@@ -0,0 +1,210 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set
+
+from pydantic import TypeAdapter
+
+from config import Config
+from helpers.logger import logger
+from .models import StructuredLogEntry
+from .log_parser import compile_log_format
+from .log_format import get_log_format
+from .log_reader import LogFollower
+
+
+# inotify(7) event masks. The directory is watched, so rotation (a new file
+# created or moved in under the log's name) is seen as well as appends.
+_IN_MODIFY = 0x00000002
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+_entries_adapter = TypeAdapter(List[StructuredLogEntry])
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    # inotify is Linux-only; elsewhere the watcher polls.
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+_libc = _load_libc()
+
+
+class _DirectoryNotifier:
+    """A non-blocking inotify descriptor watching one directory for changes to one file name."""
+
+    def __init__(self, path: Path):
+        self.name = os.fsencode(path.name)
+        self.fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CREATE | _IN_MOVED_TO | _IN_DELETE
+        if _libc.inotify_add_watch(self.fd, os.fsencode(path.parent), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path.parent}")
+
+    def read_events(self) -> bool:
+        """Drains pending events; returns whether any concerned the watched file."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            position = 0
+            while position < len(data):
+                _, _, _, name_length = _INOTIFY_EVENT.unpack_from(data, position)
+                position += _INOTIFY_EVENT.size
+                if data[position:position + name_length].rstrip(b'\0') == self.name:
+                    relevant = True
+                position += name_length
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class LiveLogBatch(NamedTuple):
+    lines: List[str]
+    # JSON array of StructuredLogEntry, serialized once for all subscribers that asked for it.
+    entries_json: Optional[str]
+
+
+class LiveLogSubscription:
+    """
+    One subscriber's bounded queue of batches. When it is full, the oldest batch
+    is dropped (and its lines counted in `dropped`) rather than buffering without
+    limit for a slow client.
+    """
+
+    def __init__(self, parsed: bool, max_batches: int):
+        self.parsed = parsed
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_batches)
+
+    def offer(self, batch: LiveLogBatch) -> None:
+        if self._queue.full():
+            self.dropped += len(self._queue.get_nowait().lines)
+        self._queue.put_nowait(batch)
+
+    async def get(self) -> LiveLogBatch:
+        return await self._queue.get()
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class LogWatcher:
+    """
+    Watches one log file for appended lines and fans each batch out to every
+    subscriber. New data is signalled by inotify where available; otherwise the
+    file is stat-polled every NGINX_LIVE_TAIL_POLL_SECONDS. Lines are read (and
+    parsed, if any subscriber wants entries) once per batch, however many
+    subscribers there are.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.subscribers: Set[LiveLogSubscription] = set()
+        self._follower = LogFollower(self.path, initial_bytes=0, max_catch_up_bytes=Config.NGINX_LOG_BOOTSTRAP_BYTES)
+        self._notifier: Optional[_DirectoryNotifier] = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if _libc is not None:
+            try:
+                self._notifier = _DirectoryNotifier(self.path)
+                loop.add_reader(self._notifier.fd, self._on_notify)
+            except OSError as e:
+                logger.warning(f"inotify unavailable for {self.path}, falling back to polling: {e}")
+                self._notifier = None
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Started live tail of {self.path.name} ({'inotify' if self._notifier else 'polling'}).")
+
+    async def stop(self) -> None:
+        if self._notifier is not None:
+            asyncio.get_running_loop().remove_reader(self._notifier.fd)
+            self._notifier.close()
+            self._notifier = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info(f"Stopped live tail of {self.path.name}.")
+
+    def _on_notify(self) -> None:
+        if self._notifier.read_events():
+            self._changed.set()
+
+    async def _run(self) -> None:
+        # The first read only records the current end of the file.
+        await asyncio.to_thread(self._follower.read_new_lines)
+        # Even with inotify, an occasional stat catches events missed while reading.
+        timeout = Config.NGINX_LIVE_TAIL_POLL_SECONDS * (10 if self._notifier else 1)
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            # Subscribers that join during the read get the next batch, not this one.
+            recipients = list(self.subscribers)
+            try:
+                batch = await asyncio.to_thread(self._read_batch, any(s.parsed for s in recipients))
+            except Exception:
+                logger.exception(f"Error reading new lines from {self.path}")
+                continue
+            if batch is not None:
+                for subscription in recipients:
+                    if subscription in self.subscribers:
+                        subscription.offer(batch)
+
+    def _read_batch(self, parse: bool) -> Optional[LiveLogBatch]:
+        lines = self._follower.read_new_lines()
+        if not lines:
+            return None
+        entries_json = None
+        if parse:
+            parse_line = compile_log_format(get_log_format(self.path)).parse
+            records = (parse_line(line) for line in lines)
+            entries_json = _entries_adapter.dump_json([r.to_entry() for r in records if r is not None]).decode()
+        return LiveLogBatch(lines, entries_json)
+
+
+_watchers: Dict[Path, LogWatcher] = {}
+
+
+@asynccontextmanager
+async def subscribe_to_log(path: Path, parsed: bool = False) -> AsyncIterator[LiveLogSubscription]:
+    """
+    Subscribes to lines appended to `path` from now on. All subscribers of a
+    file share one LogWatcher, started with the first and stopped with the last.
+    """
+    watcher = _watchers.get(path)
+    if watcher is None:
+        watcher = _watchers[path] = LogWatcher(path)
+        watcher.start()
+    subscription = LiveLogSubscription(parsed, Config.NGINX_LIVE_TAIL_QUEUE_BATCHES)
+    watcher.subscribers.add(subscription)
+    try:
+        yield subscription
+    finally:
+        watcher.subscribers.discard(subscription)
+        if not watcher.subscribers and _watchers.get(path) is watcher:
+            del _watchers[path]
+            await watcher.stop()
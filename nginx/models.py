@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class SiteInfo(BaseModel):
     name: str
@@ -62,3 +62,224 @@ class StructuredLogEntry(BaseModel):
     response_size: int
     referer: Optional[str]
     user_agent: Optional[str]
+    host: Optional[str] = None # Only when the log_format includes $host or $server_name
+    request_time_ms: Optional[float] = None # From $request_time, when logged
+    upstream_response_time_ms: Optional[float] = None # From $upstream_response_time, summed over upstreams tried
+    upstream_addr: Optional[str] = None # The upstream that produced the response
+
+class StructuredLogPage(BaseModel):
+    """One page of filtered structured log entries, newest first."""
+    entries: List[StructuredLogEntry]
+    next_cursor: Optional[str] = None # Pass as `cursor` to fetch the next (older) page
+
+class TrafficRollup(BaseModel):
+    """Aggregated access log traffic for one time bucket."""
+    bucket_start: str # ISO 8601 string (UTC)
+    requests: int
+    status_classes: Dict[str, int] # e.g. {"2xx": 120, "5xx": 3}
+    bytes_sent: int
+    methods: Dict[str, int]
+    partial: bool = False # Some of the bucket's traffic was never read: it predates the tailer or was skipped while catching up
+
+class HeavyHitter(BaseModel):
+    """One frequent value and its approximate request count."""
+    value: str
+    count: int # Upper bound on the true count
+    error: int # The true count is at least count - error
+
+class HeavyHitters(BaseModel):
+    """The most frequent values of one request dimension within a time window."""
+    dimension: str # ip, path, user_agent or referer
+    window_start: str # ISO 8601 string (UTC)
+    window_end: str # ISO 8601 string (UTC)
+    total_requests: int
+    items: List[HeavyHitter]
+
+class UniqueVisitorBucket(BaseModel):
+    """Approximate distinct visitors in one time bucket."""
+    bucket_start: str # ISO 8601 string (UTC)
+    unique_ips: int
+    unique_clients: int # Distinct IP + user agent combinations
+
+class UniqueVisitors(BaseModel):
+    """Approximate distinct visitors per bucket and over a whole time range."""
+    site: Optional[str] # None for all sites
+    granularity: str
+    unique_ips: int # Over the whole range, not the sum of the buckets
+    unique_clients: int
+    buckets: List[UniqueVisitorBucket]
+
+class LatencySummary(BaseModel):
+    """Latency percentiles for one path or upstream (or overall, when key is None)."""
+    key: Optional[str]
+    count: int
+    mean_ms: Optional[float]
+    p50_ms: Optional[float]
+    p95_ms: Optional[float]
+    p99_ms: Optional[float]
+    max_ms: Optional[float]
+
+class LatencyReport(BaseModel):
+    """Latency percentiles over a time window, overall and for the busiest keys."""
+    dimension: str # path ($request_time) or upstream ($upstream_response_time)
+    granularity: str # minute or hour, the bucket size the window was built from
+    window_start: str # ISO 8601 string (UTC)
+    window_end: str # ISO 8601 string (UTC)
+    overall: LatencySummary
+    items: List[LatencySummary]
+
+class LogScanSummary(BaseModel):
+    """Statistics over a whole access log file."""
+    requests: int
+    unparsed_lines: int # Lines that did not match the log_format
+    bytes_sent: int
+    first_seen: Optional[str] # ISO 8601 string
+    last_seen: Optional[str] # ISO 8601 string
+    status_classes: Dict[str, int]
+    methods: Dict[str, int]
+    unique_ips: int # Approximate
+    top_ips: List[HeavyHitter]
+    top_paths: List[HeavyHitter]
+    latency: Optional[LatencySummary] # From $request_time, when the log_format includes it
+
+class LogScanProgress(BaseModel):
+    """One line of a streamed full-file scan; the last one has done=true."""
+    log_name: str
+    chunks_done: int
+    chunks_total: int
+    bytes_scanned: int
+    bytes_total: int
+    done: bool
+    summary: Optional[LogScanSummary] = None # Statistics of the chunks scanned so far
+
+class LogArchiveResult(BaseModel):
+    """One line of a streamed archive compaction job, for one gzipped log."""
+    log_name: str
+    status: str # compacted, already_compacted, empty, rotated (moved on by logrotate meanwhile) or failed
+    blocks: int = 0
+    original_bytes: int = 0
+    archived_bytes: int = 0
+    detail: Optional[str] = None
+
+class LogSearchMatch(BaseModel):
+    """One line of a streamed log search."""
+    log_name: str
+    offset: int # Byte offset of the line in the (uncompressed) log
+    line: str
+    before: List[str] = [] # Up to `context` lines preceding it
+    after: List[str] = [] # Up to `context` lines following it
+
+class ErrorLogEntry(BaseModel):
+    """A parsed nginx error log entry."""
+    timestamp: str # ISO 8601 string (server local time)
+    level: str # debug, info, notice, warn, error, crit, alert or emerg
+    pid: int
+    tid: int
+    connection: Optional[int] # The "*N" connection number, if the entry concerns a connection
+    message: str
+    template: str # The message with variable parts (numbers, addresses, paths, quoted values) masked
+    client: Optional[str] = None
+    server: Optional[str] = None
+    request: Optional[str] = None
+    upstream: Optional[str] = None
+    host: Optional[str] = None
+
+class ErrorTemplateCount(BaseModel):
+    """How often one normalised error message template occurred."""
+    template: str
+    level: str # The most severe level seen for this template
+    count: int
+    first_seen: str # ISO 8601 string
+    last_seen: str # ISO 8601 string
+    example: str # One full message matching the template
+    buckets: Dict[str, int] # bucket start (ISO 8601, UTC) -> count
+
+class ErrorLogSummary(BaseModel):
+    """Error log entries grouped by message template, most frequent first."""
+    log_name: str
+    granularity: str
+    total: int
+    templates: List[ErrorTemplateCount]
+
+class ConfDirective(BaseModel):
+    """A directive in a parsed nginx config file; block directives hold their children."""
+    name: str
+    args: List[str]
+    line: int
+    block: Optional[List["ConfDirective"]] = None
+    includes: Optional[List[str]] = None # For include directives: the files it loads
+
+class ConfError(BaseModel):
+    file: str
+    line: int # 0 when the whole file is affected (e.g. unreadable)
+    message: str
+
+class ConfFile(BaseModel):
+    path: str
+    sha256: str
+    directives: List[ConfDirective]
+
+class ConfTree(BaseModel):
+    """nginx.conf and every file it includes, each parsed once, in the order nginx loads them."""
+    files: List[ConfFile]
+    errors: List[ConfError]
+
+class ConfDirectiveMatch(BaseModel):
+    name: str
+    args: List[str]
+    file: str
+    line: int
+    context: List[str] # Enclosing blocks, outermost first, e.g. ["http", "server", "location /api"]
+
+class ConfLocation(BaseModel):
+    match: str # The location's arguments, e.g. "= /login" or "~* \.php$"
+    file: str
+    line: int
+    locations: List["ConfLocation"] = [] # Nested locations
+
+class ConfServer(BaseModel):
+    server_names: List[str]
+    listen: List[str] # One entry per listen directive, arguments joined by spaces
+    file: str
+    line: int
+    locations: List[ConfLocation]
+
+class ConfUpstream(BaseModel):
+    name: str
+    servers: List[str] # One entry per server directive, arguments joined by spaces
+    file: str
+    line: int
+
+class ServerNameEntry(BaseModel):
+    site: str
+    server_name: str # Lowercased, except regular expressions ("~...")
+    address: str # Listen address, e.g. "*", "127.0.0.1" or "[::]"
+    port: int # 0 for unix sockets
+    ssl: bool
+    enabled: bool
+    file: str # File of the server block (a site file or a snippet it includes)
+    line: int
+
+class ServerNameConflict(BaseModel):
+    server_name: str
+    port: int
+    ssl: bool
+    servers: List[ServerNameEntry] # Every server block claiming this name on this port
+
+class SiteOperation(BaseModel):
+    action: str = Field(..., pattern=r"^(create|update|enable|disable|delete)$")
+    name: str = Field(..., pattern=r"^[a-zA-Z0-9._-]+$")
+    content: Optional[str] = None # Required for create and update
+
+class SiteBatch(BaseModel):
+    operations: List[SiteOperation] = Field(..., min_length=1) # Applied in order
+    force: bool = False # Apply even if enabled sites end up with conflicting server names
+    reload: bool = True # Reload nginx once the new config passes `nginx -t`
+
+class SiteBatchResult(BaseModel):
+    success: bool
+    message: str
+    applied: bool # False if the changes were rolled back (or there was nothing to change)
+    sites: List[SiteInfo] # Final state of every site the batch changed, except deleted ones
+    test: Optional[NginxCommandStatus] = None
+    reload: Optional[NginxCommandStatus] = None
@@ -1,18 +1,54 @@
 import os
 import re
+import gzip
+import zlib
+import heapq
 import shutil
 import asyncio
 import aiofiles
 import aiofiles.os as aios
 import tempfile
-from urllib.parse import urlparse
+from collections import deque
+from itertools import islice
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Set, Tuple
 from datetime import datetime, timedelta, timezone
+from pymongo.errors import PyMongoError
+from pydantic import TypeAdapter
 
 from config import Config
 from helpers.logger import logger
-from .models import SiteInfo, LogInfo, NginxCommandStatus, StructuredLogEntry
+from .models import (
+    SiteInfo, LogInfo, NginxCommandStatus, StructuredLogEntry, StructuredLogPage, TrafficRollup,
+    HeavyHitters, UniqueVisitors, LatencyReport, ErrorLogEntry, ErrorLogSummary, LogScanProgress, LogArchiveResult,
+    LogSearchMatch, ConfTree, ConfDirectiveMatch, ConfServer, ConfUpstream, ServerNameEntry, ServerNameConflict,
+    SiteOperation, SiteBatchResult
+)
+from .log_tailer import AccessLogTailer, get_access_log_tailer
+from .log_reader import LogStream, read_tail, open_log_stream, discover_rotated_logs
+from .log_parser import as_utc, compile_log_format
+from .log_batch import LogBatch, parse_log_file
+from .log_format import get_log_format
+from .executors import get_process_pool
+from .log_index import discard_log_index, get_log_index, read_time_range
+from .log_watcher import subscribe_to_log
+from .log_scan import scan_log_range, split_log_file
+from .log_archive import compact_log_archive, read_compressed_tail, read_compressed_time_range
+from .log_search import compile_search, search_log_range, split_search_ranges
+from .log_ingest import aggregate_ingested_traffic, find_ingested_entries, get_ingester, start_ingester
+from .error_log import ERROR_BUCKET_SECONDS, ERROR_LOG_LEVELS, aggregate_error_log, read_error_log
+from .log_query import InvalidCursorError, LogQuery, run_log_query
+from .log_export import EXPORT_MEDIA_TYPES, LogExport, export_records, parquet_available
+from .response_cache import CachedResponse, ResponseCache, etag_matches, make_etag
+from .site_inventory import SiteInventory
+from .server_index import ServerKey, ServerNameIndex
+from .conf_parser import build_conf_tree, find_directives, find_servers, find_upstreams
+from .analytics import (
+    LogScanAggregate,
+    HEAVY_HITTER_DIMENSIONS, HEAVY_HITTER_RETENTION_MINUTES, LATENCY_DIMENSIONS, ROLLUP_GRANULARITIES,
+    UNIQUE_VISITOR_GRANULARITIES, heavy_hitters, latency_stats, traffic_rollups, unique_visitors
+)
 
 
 class NginxManagementError(Exception):
@@ -31,27 +67,87 @@ def _get_site_path(site_name: str, enabled: bool = False) -> Path:
     site_file = base_dir / site_name
     return site_file
 
+_site_inventory = SiteInventory()
+_server_index = ServerNameIndex()
+
+
 def list_sites() -> List[SiteInfo]:
-    """Lists all available sites and indicates if they are enabled."""
+    """Lists all available sites and indicates if they are enabled. Served from the site inventory. Blocking."""
+    return list(_site_inventory.get(Path(Config.NGINX_SITES_AVAILABLE), Path(Config.NGINX_SITES_ENABLED)).sites)
+
+
+async def get_site_list_response(if_none_match: Optional[str] = None) -> CachedResponse:
+    """
+    Lists sites as a serialized JSON response from the in-memory site
+    inventory, which only rescans sites-available and sites-enabled after they
+    change. The body is omitted when `if_none_match` already matches its ETag.
+    """
+    try:
+        listing = await asyncio.to_thread(
+            _site_inventory.get, Path(Config.NGINX_SITES_AVAILABLE), Path(Config.NGINX_SITES_ENABLED)
+        )
+    except OSError as e:
+        logger.error(f"Error listing site directories: {e}")
+        raise NginxManagementError("Could not list sites. Check permissions.", 500)
+    if etag_matches(if_none_match, listing.etag):
+        return CachedResponse(listing.etag, None)
+    return CachedResponse(listing.etag, listing.body)
+
+def _get_server_index() -> ServerNameIndex:
+    """The server name index, synced with the site inventory. Blocking."""
     available_path = Path(Config.NGINX_SITES_AVAILABLE)
-    enabled_path = Path(Config.NGINX_SITES_ENABLED)
-    sites = []
+    _server_index.sync(_site_inventory.get(available_path, Path(Config.NGINX_SITES_ENABLED)), available_path)
+    return _server_index
 
-    if not available_path.is_dir():
-        logger.warning(f"Sites available directory not found: {available_path}")
-        return []
 
-    enabled_site_names = {f.name for f in enabled_path.iterdir() if f.is_symlink() or f.is_file()}
+def lookup_server_name(host: str, port: Optional[int] = None) -> List[ServerNameEntry]:
+    """The enabled server blocks that could serve `host`, most specific server_name first. Blocking."""
+    return _get_server_index().lookup(host, port)
+
+
+def get_server_name_conflicts() -> List[ServerNameConflict]:
+    """Server names claimed on the same port by more than one enabled server block. Blocking."""
+    return _get_server_index().conflicts()
+
+
+def check_site_conflicts(site_name: str, content: Optional[str] = None) -> List[ServerNameConflict]:
+    """
+    The server name conflicts site `site_name` would have once enabled, with
+    `content` instead of its current file if given (the site needn't exist
+    yet). Blocking.
+    """
+    available_site_path = _get_site_path(site_name, enabled=False)
+    if content is None and not available_site_path.is_file():
+        raise NginxManagementError(f"Site '{site_name}' not found in available sites.", 404)
+    return _get_server_index().check_site(site_name, available_site_path, content)
+
+
+def _get_site_conflict_keys(site_names: Iterable[str]) -> Dict[str, Set[ServerKey]]:
+    index = _get_server_index()
+    return {site_name: index.site_conflict_keys(site_name) for site_name in site_names}
+
+
+def _describe_conflicts(site_name: str, conflicts: List[ServerNameConflict]) -> str:
+    described = []
+    for conflict in conflicts[:5]:
+        others = sorted({server.site for server in conflict.servers if server.site != site_name}) or [site_name]
+        name = conflict.server_name or '""'
+        listen = f"{conflict.port}{' ssl' if conflict.ssl else ''}"
+        described.append(f"{name} on {listen} ({', '.join(others)})")
+    more = f" and {len(conflicts) - 5} more" if len(conflicts) > 5 else ""
+    return f"Site '{site_name}' would introduce conflicting server names: {'; '.join(described)}{more}"
+
+
+def _raise_on_conflicts(site_name: str, content: Optional[str] = None) -> None:
+    """
+    Refuses (409) a site whose server names would introduce conflicts. Keys
+    the site itself already conflicts on don't count, so a site that already
+    conflicts can still be edited.
+    """
+    conflicts = _get_server_index().check_site(site_name, _get_site_path(site_name, enabled=False), content, new_only=True)
+    if conflicts:
+        raise NginxManagementError(f"{_describe_conflicts(site_name, conflicts)}. Use force to save anyway.", 409)
 
-    for site_file in available_path.iterdir():
-        if site_file.is_file() and not site_file.name.startswith('.'):
-            sites.append(SiteInfo(
-                name=site_file.name,
-                is_enabled=site_file.name in enabled_site_names
-            ))
-    from icecream import ic
-    ic(sites)
-    return sites
 
 def get_site_info(site_name: str) -> SiteInfo:
     """Gets information and content for a single site."""
@@ -79,20 +175,30 @@ def create_site(site_name: str, content: str) -> SiteInfo:
     try:
         available_site_path.parent.mkdir(parents=True, exist_ok=True)
         available_site_path.write_text(content)
+        _site_inventory.invalidate()
+        _server_index.update_site(available_site_path, site_name, enabled=False)
         logger.info(f"Created Nginx site configuration: {available_site_path}")
         return SiteInfo(name=site_name, is_enabled=False, content=content)
     except OSError as e:
         logger.error(f"Error creating site file {available_site_path}: {e}")
         raise NginxManagementError(f"Could not create site file '{site_name}'. Check permissions.", 500)
 
-def update_site_content(site_name: str, content: str) -> SiteInfo:
-    """Updates the content of an existing site file in sites-available."""
+def update_site_content(site_name: str, content: str, force: bool = False) -> SiteInfo:
+    """
+    Updates the content of an existing site file in sites-available. If the
+    site is enabled, new server name conflicts with other enabled sites are
+    refused (409) unless `force` is set.
+    """
     available_site_path = _get_site_path(site_name, enabled=False)
     if not available_site_path.is_file():
         raise NginxManagementError(f"Site '{site_name}' not found in available sites.", 404)
+    is_enabled = _get_site_path(site_name, enabled=True).exists()
+    if is_enabled and not force:
+        _raise_on_conflicts(site_name, content)
 
     try:
         available_site_path.write_text(content)
+        _server_index.update_site(available_site_path, site_name, enabled=is_enabled)
         logger.info(f"Updated Nginx site configuration: {available_site_path}")
         return get_site_info(site_name)
     except OSError as e:
@@ -100,8 +206,12 @@ def update_site_content(site_name: str, content: str) -> SiteInfo:
         raise NginxManagementError(f"Could not update site file '{site_name}'. Check permissions.", 500)
 
 
-def enable_site(site_name: str) -> None:
-    """Enables a site by creating a symlink in sites-enabled."""
+def enable_site(site_name: str, force: bool = False) -> None:
+    """
+    Enables a site by creating a symlink in sites-enabled. Refused (409) if its
+    server names would introduce a conflict with another enabled site's,
+    unless `force` is set.
+    """
     available_site_path = _get_site_path(site_name, enabled=False)
     enabled_site_path = _get_site_path(site_name, enabled=True)
 
@@ -110,10 +220,14 @@ def enable_site(site_name: str) -> None:
     if enabled_site_path.exists():
          logger.warning(f"Site '{site_name}' is already enabled or a file/link with the same name exists.")
          return 
+    if not force:
+        _raise_on_conflicts(site_name)
 
     try:
         enabled_site_path.parent.mkdir(parents=True, exist_ok=True) 
         os.symlink(available_site_path.resolve(), enabled_site_path)
+        _site_inventory.invalidate()
+        _server_index.update_site(available_site_path, site_name, enabled=True)
         logger.info(f"Enabled Nginx site: {site_name}")
     except OSError as e:
         logger.error(f"Error creating symlink from {available_site_path} to {enabled_site_path}: {e}")
@@ -134,6 +248,8 @@ def disable_site(site_name: str) -> None:
 
     try:
         enabled_site_path.unlink()
+        _site_inventory.invalidate()
+        _server_index.update_site(_get_site_path(site_name, enabled=False), site_name, enabled=False)
         logger.info(f"Disabled Nginx site: {site_name}")
     except OSError as e:
         logger.error(f"Error removing symlink {enabled_site_path}: {e}")
@@ -164,12 +280,199 @@ def delete_site(site_name: str) -> None:
             # Don't necessarily fail the whole delete if the available file was removed
             logger.warning(f"Could not remove symlink for '{site_name}', it might need manual removal.")
 
+    _site_inventory.invalidate()
+    _server_index.remove_site(site_name)
     # Check if the enabled path was a file, not a link
     if not site_existed and not enabled_site_path.exists(): 
          raise NginxManagementError(f"Site '{site_name}' not found.", 404)
 
 
 
+class _SiteState(NamedTuple):
+    content: Optional[bytes]  # None if the site file doesn't exist
+    enabled: bool
+
+
+def _read_site_state(site_name: str) -> _SiteState:
+    available_site_path = _get_site_path(site_name, enabled=False)
+    enabled_site_path = _get_site_path(site_name, enabled=True)
+    if enabled_site_path.exists() and not enabled_site_path.is_symlink():
+        raise NginxManagementError(f"Site '{site_name}' is enabled by a regular file, not a symlink; fix it manually first.", 400)
+    try:
+        content = available_site_path.read_bytes() if available_site_path.is_file() else None
+    except OSError as e:
+        logger.error(f"Error reading site file {available_site_path}: {e}")
+        raise NginxManagementError(f"Could not read site file '{site_name}'. Check permissions.", 500)
+    return _SiteState(content, enabled_site_path.is_symlink())
+
+
+def _plan_site_batch(operations: Sequence[SiteOperation]) -> Dict[str, Tuple[_SiteState, _SiteState]]:
+    """
+    Replays the operations against the current state of the sites they touch,
+    without changing anything, and returns {site: (state before, state after)}
+    for every site that ends up different. Raises on the first invalid
+    operation. Blocking.
+    """
+    before: Dict[str, _SiteState] = {}
+    after: Dict[str, _SiteState] = {}
+    for number, operation in enumerate(operations, 1):
+        if operation.name not in before:
+            before[operation.name] = after[operation.name] = _read_site_state(operation.name)
+        state = after[operation.name]
+        where = f"Operation {number} ({operation.action} '{operation.name}')"
+
+        if operation.action in ('create', 'update') and operation.content is None:
+            raise NginxManagementError(f"{where}: content is required.", 400)
+        if operation.action == 'create':
+            if state.content is not None:
+                raise NginxManagementError(f"{where}: site already exists.", 409)
+            state = _SiteState(operation.content.encode(), False)
+        elif operation.action == 'disable':
+            state = state._replace(enabled=False)
+        elif state.content is None and not (operation.action == 'delete' and state.enabled):
+            raise NginxManagementError(f"{where}: site not found in available sites.", 404)
+        elif operation.action == 'update':
+            state = state._replace(content=operation.content.encode())
+        elif operation.action == 'enable':
+            state = state._replace(enabled=True)
+        else:
+            state = _SiteState(None, False)
+        after[operation.name] = state
+    return {name: (before[name], after[name]) for name in before if before[name] != after[name]}
+
+
+def _write_site_states(states: Dict[str, _SiteState]) -> None:
+    """
+    Puts sites into the given states. New contents are all written to hidden
+    temporary files first and then renamed over the site files, so a failed
+    write leaves no site half-written. Blocking.
+    """
+    staged = []
+    try:
+        for site_name, state in states.items():
+            if state.content is None:
+                continue
+            available_site_path = _get_site_path(site_name, enabled=False)
+            temp_path = available_site_path.with_name(f".{site_name}.batch")
+            available_site_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(state.content)
+            if available_site_path.exists():
+                shutil.copymode(available_site_path, temp_path)
+            staged.append((temp_path, available_site_path))
+        for temp_path, available_site_path in staged:
+            os.replace(temp_path, available_site_path)
+    finally:
+        for temp_path, _ in staged:
+            temp_path.unlink(missing_ok=True)
+
+    try:
+        for site_name, state in states.items():
+            available_site_path = _get_site_path(site_name, enabled=False)
+            enabled_site_path = _get_site_path(site_name, enabled=True)
+            if state.content is None:
+                available_site_path.unlink(missing_ok=True)
+            if state.enabled and not enabled_site_path.is_symlink():
+                enabled_site_path.parent.mkdir(parents=True, exist_ok=True)
+                os.symlink(available_site_path.resolve(), enabled_site_path)
+            elif not state.enabled and enabled_site_path.is_symlink():
+                enabled_site_path.unlink()
+    finally:
+        _site_inventory.invalidate()
+        for site_name, state in states.items():
+            if state.content is None:
+                _server_index.remove_site(site_name)
+            else:
+                _server_index.update_site(_get_site_path(site_name, enabled=False), site_name, state.enabled)
+
+
+def _find_batch_conflicts(states: Dict[str, _SiteState], existing: Dict[str, Set[ServerKey]]) -> Optional[str]:
+    """
+    Describes the first enabled site of a written batch that conflicts on a
+    key that site didn't already conflict on before the batch (`existing`), if any. Blocking.
+    """
+    index = _get_server_index()
+    for site_name, state in states.items():
+        if state.content is None or not state.enabled:
+            continue
+        conflicts = [
+            conflict for conflict in index.check_site(site_name, _get_site_path(site_name, enabled=False))
+            if (conflict.server_name, conflict.port, conflict.ssl) not in existing.get(site_name, ())
+        ]
+        if conflicts:
+            return _describe_conflicts(site_name, conflicts)
+    return None
+
+
+# Held while site files are changed, so a batch (and its rollback) never
+# interleaves with another batch or a single-site change.
+_site_lock = asyncio.Lock()
+
+
+async def run_site_change(function, *args):
+    """Runs a blocking site change (create_site, update_site_content, ...) in a thread, serialized with site batches."""
+    async with _site_lock:
+        return await asyncio.to_thread(function, *args)
+
+
+async def apply_site_batch(operations: Sequence[SiteOperation], force: bool = False, reload: bool = True) -> SiteBatchResult:
+    """
+    Applies a batch of site operations as one change: they are checked against
+    the current sites first, then written together, then `nginx -t` runs once.
+    If the test (or the following reload) fails, or an enabled site would
+    introduce a server name conflict (unless `force`), every touched site is
+    put back the way it was and a failed result is returned. Batches and
+    single-site changes run one at a time.
+    """
+    async with _site_lock:
+        changes = await asyncio.to_thread(_plan_site_batch, operations)
+        if not changes:
+            return SiteBatchResult(success=True, message="Nothing to change.", applied=False, sites=[])
+        before = {site_name: change[0] for site_name, change in changes.items()}
+        after = {site_name: change[1] for site_name, change in changes.items()}
+        sites = [SiteInfo(name=site_name, is_enabled=state.enabled) for site_name, state in after.items() if state.content is not None]
+
+        committed = False
+        test_status = reload_status = None
+        existing_conflicts = {} if force else await asyncio.to_thread(_get_site_conflict_keys, after)
+        try:
+            await asyncio.to_thread(_write_site_states, after)
+            if not force:
+                conflict_message = await asyncio.to_thread(_find_batch_conflicts, after, existing_conflicts)
+                if conflict_message is not None:
+                    return SiteBatchResult(
+                        success=False, message=f"Rolled back {len(changes)} site changes: {conflict_message}. Use force to apply anyway.",
+                        applied=False, sites=sites,
+                    )
+            if reload:
+                test_status, reload_status = await test_and_reload_nginx()
+            else:
+                test_status = await test_nginx_config()
+            committed = test_status.success and (reload_status is None or reload_status.success)
+        except OSError as e:
+            logger.error(f"Error writing site batch: {e}")
+            raise NginxManagementError("Could not write the site changes. Check permissions.", 500)
+        finally:
+            if not committed:
+                try:
+                    await asyncio.to_thread(_write_site_states, before)
+                    logger.warning(f"Rolled back site batch touching {len(changes)} sites.")
+                except OSError as e:
+                    logger.error(f"CRITICAL: Failed to roll back site batch: {e}")
+                    raise NginxManagementError("Could not roll back the site changes; check the site directories manually.", 500)
+
+    if not committed:
+        failed = reload_status if reload_status is not None else test_status
+        return SiteBatchResult(
+            success=False, message=f"Rolled back {len(changes)} site changes: {failed.message}", applied=False,
+            sites=sites, test=test_status, reload=reload_status,
+        )
+    logger.info(f"Applied site batch changing {len(changes)} sites{' and reloaded Nginx' if reload_status else ''}.")
+    return SiteBatchResult(
+        success=True, message=f"Applied {len(changes)} site changes{' and reloaded Nginx' if reload_status else ''}.",
+        applied=True, sites=sites, test=test_status, reload=reload_status,
+    )
+
+
 def _get_log_path(log_name: str) -> Path:
     """Gets the Path object for a log file."""
     log_dir = Path(Config.NGINX_LOG_DIR)
@@ -179,202 +482,825 @@ def _get_log_path(log_name: str) -> Path:
     return log_file
 
 
+def _stat_logs(log_dir: Path) -> List[Tuple[Path, os.stat_result]]:
+    return [
+        (log_file, log_file.stat())
+        for log_file in log_dir.iterdir()
+        if log_file.is_file() and not log_file.name.startswith('.')
+    ]
+
+
 def list_logs() -> List[LogInfo]:
     """Lists Nginx log files."""
     log_dir = Path(Config.NGINX_LOG_DIR)
-    logs = []
     if not log_dir.is_dir():
         logger.warning(f"Nginx log directory not found: {log_dir}")
         return []
 
     try:
-        for log_file in log_dir.iterdir():
-            if log_file.is_file() and not log_file.name.startswith('.'):
-                stats = log_file.stat()
-                logs.append(LogInfo(
-                    name=log_file.name,
-                    size_bytes=stats.st_size,
-                    last_modified=stats.st_mtime
-                ))
-        return logs
+        return [
+            LogInfo(name=log_file.name, size_bytes=stats.st_size, last_modified=stats.st_mtime)
+            for log_file, stats in _stat_logs(log_dir)
+        ]
     except OSError as e:
         logger.error(f"Error listing log directory {log_dir}: {e}")
         raise NginxManagementError("Could not list log files. Check permissions.", 500)
 
 
-def get_log_content(log_name: str, tail_lines: Optional[int] = 100) -> str:
-    """Reads the end of a log file."""
+_log_list_adapter = TypeAdapter(List[LogInfo])
+
+
+async def get_log_list_response(if_none_match: Optional[str] = None) -> CachedResponse:
+    """
+    Lists log files as a serialized JSON response whose ETag is derived from
+    each file's (name, inode, size, mtime). The body is omitted when
+    `if_none_match` already matches it.
+    """
+    log_dir = Path(Config.NGINX_LOG_DIR)
+    if not await aios.path.isdir(log_dir):
+        logger.warning(f"Nginx log directory not found: {log_dir}")
+        return CachedResponse(make_etag(()), b"[]")
+
+    try:
+        stats = await asyncio.to_thread(_stat_logs, log_dir)
+    except OSError as e:
+        logger.error(f"Error listing log directory {log_dir}: {e}")
+        raise NginxManagementError("Could not list log files. Check permissions.", 500)
+
+    etag = make_etag(sorted((log_file.name, st.st_ino, st.st_size, st.st_mtime_ns) for log_file, st in stats))
+    if etag_matches(if_none_match, etag):
+        return CachedResponse(etag, None)
+    logs = [LogInfo(name=log_file.name, size_bytes=st.st_size, last_modified=st.st_mtime) for log_file, st in stats]
+    return CachedResponse(etag, _log_list_adapter.dump_json(logs))
+
+
+async def get_log_content(log_name: str, tail_lines: int = 100) -> str:
+    """
+    Reads the last `tail_lines` lines of a log file. Tailing seeks backwards from
+    EOF, so only the requested lines are read; of a gzipped log, only the last
+    blocks if it was compacted into an archive. File I/O runs in a worker thread.
+    Use stream_log_content to retrieve a whole log.
+    """
     log_file_path = _get_log_path(log_name)
-    if not log_file_path.is_file():
+    if not await aios.path.isfile(log_file_path):
         raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
 
+    read = read_compressed_tail if log_file_path.suffix == '.gz' else read_tail
     try:
-        with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            if tail_lines is None or tail_lines <= 0:
-                return f.read()
-            else:
-                lines = f.readlines()
-                return "".join(lines[-tail_lines:])
+        return await asyncio.to_thread(read, log_file_path, tail_lines)
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        logger.error(f"Error decompressing log file {log_file_path}: {e}")
+        raise NginxManagementError(f"Log file '{log_name}' is not a valid gzip file.", 400)
     except OSError as e:
         logger.error(f"Error reading log file {log_file_path}: {e}")
         raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
 
-async def get_combined_access_logs() -> List[StructuredLogEntry]:
+
+async def stream_log_content(
+    log_name: str,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None,
+    compress: bool = False
+) -> LogStream:
+    """
+    Prepares a chunked stream of a whole log file, optionally restricted to an
+    HTTP byte range or gzipped on the fly. Memory use does not depend on file size.
+    """
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+
+    try:
+        return await asyncio.to_thread(open_log_stream, log_file_path, range_header, if_range, compress)
+    except OSError as e:
+        logger.error(f"Error opening log file {log_file_path}: {e}")
+        raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
+
+async def stream_log_time_range(log_name: str, start: Optional[datetime], end: Optional[datetime]) -> Iterator[bytes]:
+    """
+    Prepares a stream of the lines of an access log logged within [start, end).
+    A sparse timestamp index kept next to the log locates the start without
+    scanning the file; only the matching slice is read. Gzipped logs compacted
+    into archives are read through their block index; other gzipped logs are
+    decompressed from the start. Naive bounds are taken as UTC.
+    """
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+    start, end = as_utc(start), as_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise NginxManagementError("The start of the time range must be before its end.", 400)
+
+    read = read_compressed_time_range if log_file_path.suffix == '.gz' else read_time_range
+    try:
+        return await asyncio.to_thread(read, log_file_path, start, end)
+    except OSError as e:
+        logger.error(f"Error indexing log file {log_file_path}: {e}")
+        raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
+
+
+async def stream_live_log(log_name: str, parsed: bool = False) -> AsyncIterator[str]:
+    """
+    Prepares a Server-Sent Events stream of the lines appended to a log from now
+    on, as raw `lines` events or, with `parsed`, `entries` events holding a JSON
+    array of structured entries. The file watcher is shared by all subscribers.
+    """
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+    if log_file_path.suffix == '.gz':
+        raise NginxManagementError(f"Compressed log '{log_name}' is not written to and can't be followed.", 400)
+    return _iter_live_log_events(log_file_path, parsed)
+
+
+async def _iter_live_log_events(log_file_path: Path, parsed: bool) -> AsyncIterator[str]:
+    async with subscribe_to_log(log_file_path, parsed) as subscription:
+        yield ": connected\n\n"
+        while True:
+            try:
+                batch = await asyncio.wait_for(subscription.get(), Config.NGINX_LIVE_TAIL_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment lines keep proxies from closing an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            dropped = subscription.take_dropped()
+            if dropped:
+                # The client fell behind and its oldest pending lines were discarded.
+                yield f"event: dropped\ndata: {dropped}\n\n"
+            if parsed:
+                yield f"event: entries\ndata: {batch.entries_json}\n\n"
+            else:
+                # A trailing '\r' (CRLF-terminated lines) would end the SSE field early.
+                lines = (line.rstrip('\r\n') for line in batch.lines)
+                yield "event: lines\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+def _get_main_access_log_tailer(window_size: int = 0) -> AccessLogTailer:
+    """Returns the shared tailer for access.log, which also feeds the traffic analytics."""
+    return get_access_log_tailer(
+        Path(Config.NGINX_LOG_DIR) / "access.log",
+        window_size=max(window_size, Config.NGINX_STRUCTURED_LOG_LIMIT),
+        listeners=[traffic_rollups.add, heavy_hitters.add, unique_visitors.add, latency_stats.add]
+    )
+
+
+async def poll_access_log() -> LogBatch:
+    """Parses lines appended to access.log since the last poll, updating the window and analytics."""
+    return await asyncio.to_thread(_get_main_access_log_tailer().poll)
+
+
+_rotated_log_cache: Dict[Path, Tuple[Tuple[int, int, int, int, str], LogBatch]] = {}
+
+
+async def _parse_rotated_log(log_path: Path, stats: os.stat_result, limit: int) -> LogBatch:
+    """
+    Parses one rotated log in the process pool. Rotations don't change once
+    written, so results are cached by (inode, size, mtime, limit, log_format).
+    """
+    log_format = await asyncio.to_thread(get_log_format, log_path)
+    fingerprint = (stats.st_ino, stats.st_size, stats.st_mtime_ns, limit, log_format)
+    cached = _rotated_log_cache.get(log_path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    loop = asyncio.get_running_loop()
+    batch = await loop.run_in_executor(get_process_pool(), parse_log_file, str(log_path), limit, log_format)
+    _rotated_log_cache[log_path] = (fingerprint, batch)
+    return batch
+
+
+def _select_since(batch: LogBatch, since: Optional[datetime]) -> Sequence[int]:
+    return batch.select(LogQuery(since=since)) if since is not None else range(len(batch))
+
+
+async def _read_rotated_logs(rotated_logs: List[Path], limit: int, since: Optional[datetime]) -> List[Tuple[LogBatch, Sequence[int]]]:
+    """
+    Parses rotated logs (ordered newest first) in parallel, one wave of up to
+    NGINX_LOG_WORKERS files at a time. Stops once `limit` entries newer than
+    `since` have been collected or a rotation was last written before `since`.
+    Returns each log's batch with the rows within the window.
+    """
+    results: List[Tuple[LogBatch, Sequence[int]]] = []
+    collected = 0
+    pending = deque(rotated_logs)
+
+    while pending and collected < limit:
+        wave = []
+        while pending and len(wave) < Config.NGINX_LOG_WORKERS:
+            log_path = pending.popleft()
+            stats = await aios.stat(log_path)
+            if since is not None and datetime.fromtimestamp(stats.st_mtime, timezone.utc) < since:
+                # Everything in it (and in older rotations) is outside the window.
+                pending.clear()
+                break
+            wave.append(_parse_rotated_log(log_path, stats, limit))
+
+        for batch in await asyncio.gather(*wave):
+            rows = _select_since(batch, since)
+            results.append((batch, rows))
+            collected += len(rows)
+
+    return results
+
+
+def _iter_newest_first(batch: LogBatch, rows: Sequence[int]) -> Iterator[Tuple[int, LogBatch, int]]:
+    times = batch.times
+    for row in reversed(rows):
+        yield times[row], batch, row
+
+
+def _structured_log_window_start(since_hours: Optional[float]) -> Optional[datetime]:
+    # Whole minutes, so repeated requests cover the same window and can share an ETag.
+    since_hours = Config.NGINX_STRUCTURED_LOG_WINDOW_HOURS if since_hours is None else since_hours
+    if since_hours <= 0:
+        return None
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    return now - timedelta(hours=since_hours)
+
+
+async def get_combined_access_logs(limit: Optional[int] = None, since_hours: Optional[float] = None) -> List[StructuredLogEntry]:
     """
-    Efficiently processes extremely large log files (100GB+) by using 
-    a streaming approach to read only the last 10MB and process it line by line.
+    Returns parsed entries from access.log and its rotations (access.log.N and
+    access.log.N.gz), merged newest first by timestamp.
+    access.log is followed by a shared in-process tailer, so each call only parses
+    the bytes appended since the previous call. Rotations are only parsed (in the
+    process pool) when access.log alone doesn't provide `limit` entries, and only
+    back to `since_hours` ago. Lines are parsed with each log's configured
+    log_format and kept as columnar LogBatches; entries are only materialised
+    for the records returned.
     """
+    return await _combine_access_logs(limit or Config.NGINX_STRUCTURED_LOG_LIMIT, _structured_log_window_start(since_hours))
+
+
+async def _combine_access_logs(limit: int, since: Optional[datetime]) -> List[StructuredLogEntry]:
     log_dir = Path(Config.NGINX_LOG_DIR)
     main_log_path = log_dir / "access.log"
-    combined_data: List[StructuredLogEntry] = []
-    TEN_MB = 10 * 1024 * 1024
-    BUFFER_SIZE = 8192  # 8KB buffer size for efficient streaming
 
-    if not await aios.path.isfile(main_log_path):
-        logger.warning(f"Main access log file not found: {main_log_path}")
+    if not await aios.path.isdir(log_dir):
+        logger.warning(f"Nginx log directory not found: {log_dir}")
         return []
 
     try:
-        file_size = await aios.path.getsize(main_log_path)
-        
-        if file_size <= TEN_MB:
-            # If file is small enough, process it directly line by line
-            logger.info(f"{main_log_path.name} is {file_size} bytes. Processing directly.")
-            return await process_log_file(main_log_path, 0)
-        
-        # For large files, start from 10MB before the end
-        start_pos = max(0, file_size - TEN_MB)
-        logger.info(f"{main_log_path.name} is {file_size} bytes. Processing last 10MB starting at position {start_pos}.")
-        
-        # Process from the calculated position
-        return await process_log_file(main_log_path, start_pos)
-            
-    except Exception as e:
-        logger.error(f"Error determining file size: {e}")
+        log_files = await asyncio.to_thread(discover_rotated_logs, log_dir, "access.log", Config.NGINX_MAX_LOG_ROTATIONS)
+    except OSError as e:
+        logger.error(f"Error listing log directory {log_dir}: {e}")
         return []
 
+    for cached_path in set(_rotated_log_cache) - set(log_files):
+        del _rotated_log_cache[cached_path]
+
+    sources: List[Tuple[LogBatch, Sequence[int]]] = []
+    if main_log_path in log_files:
+        tailer = _get_main_access_log_tailer(limit)
+        try:
+            await asyncio.to_thread(tailer.poll)
+        except OSError as e:
+            logger.error(f"Error reading access log {main_log_path}: {e}")
+            return []
+        window = tailer.snapshot()
+        sources.append((window, _select_since(window, since)[-limit:]))
+    else:
+        logger.warning(f"Main access log file not found: {main_log_path}")
+
+    rotated_logs = [log_path for log_path in log_files if log_path != main_log_path]
+    if rotated_logs and sum(len(rows) for _, rows in sources) < limit:
+        try:
+            sources.extend(await _read_rotated_logs(rotated_logs, limit, since))
+        except OSError as e:
+            logger.error(f"Error reading rotated access logs: {e}")
+
+    merged = heapq.merge(*(_iter_newest_first(batch, rows) for batch, rows in sources), key=itemgetter(0), reverse=True)
+    combined_data = [batch.to_entry(row) for _, batch, row in islice(merged, limit)]
+    logger.info(f"Returning {len(combined_data)} most recent entries from {len(sources)} access log file(s).")
+    return combined_data
+
+
+_response_cache = ResponseCache(Config.NGINX_RESPONSE_CACHE_BYTES)
+_structured_logs_adapter = TypeAdapter(List[StructuredLogEntry])
+
+
+def _access_logs_fingerprint(log_dir: Path) -> Tuple:
+    """(name, inode, size, mtime) of access.log and its rotations, plus the log_format they are parsed with."""
+    if not log_dir.is_dir():
+        return ()
+    files = []
+    for log_path in discover_rotated_logs(log_dir, "access.log", Config.NGINX_MAX_LOG_ROTATIONS):
+        stats = log_path.stat()
+        files.append((log_path.name, stats.st_ino, stats.st_size, stats.st_mtime_ns))
+    return tuple(files), get_log_format(log_dir / "access.log")
 
-async def process_log_file(file_path: Path, start_position: int) -> List[StructuredLogEntry]:
-    """
-    Process a log file starting from the specified position.
-    Uses a streaming approach to handle very large files efficiently.
-    """
-    combined_data = []
-    log_lines = []
-    skip_first_line = start_position > 0
-    
-    try:
-        async with aiofiles.open(file_path, mode='rb') as log_file:
-            if start_position > 0:
-                await log_file.seek(start_position)
-                
-            # Process first line separately if we started mid-file
-            if skip_first_line:
-                first_line = await log_file.readline()  # Skip potentially partial line
-                
-            # Read and store lines (limiting to last 2000 to ensure we get 1000 valid entries)
-            buffer = bytearray()
-            chunk = await log_file.read(8192)  # Read in reasonable chunks
-            
-            while chunk:
-                buffer.extend(chunk)
-                
-                # Process complete lines from buffer
-                while b'\n' in buffer:
-                    # Split at first newline
-                    line_end = buffer.find(b'\n') + 1
-                    line = buffer[:line_end].decode('utf-8', errors='ignore').strip()
-                    buffer = buffer[line_end:]
-                    
-                    if line:  # Skip empty lines
-                        log_lines.append(line)
-                        # Keep only last 2000 lines to save memory
-                        if len(log_lines) > 2000:
-                            log_lines.pop(0)
-                
-                chunk = await log_file.read(8192)
-            
-            # Process any remaining data in buffer
-            if buffer:
-                line = buffer.decode('utf-8', errors='ignore').strip()
-                if line:
-                    log_lines.append(line)
-                    if len(log_lines) > 2000:
-                        log_lines.pop(0)
-        
-        # Parse log entries (processing from newest to oldest)
-        log_pattern = re.compile(
-            r'(?P<ip>\S+)\s+-\s+-\s+'           # IP address
-            r'\[(?P<timestamp>[^\]]+)\]\s+'     # Timestamp
-            r'"(?P<request>[^"]+)"\s+'          # Request line
-            r'(?P<status>\d+)\s+'               # Status code
-            r'(?P<size>\d+|-)\s+'               # Response size
-            r'"(?P<referer>[^"]*)"\s+'          # Referer
-            r'"(?P<user_agent>[^"]*)"'          # User Agent
+
+async def get_combined_access_logs_response(limit: Optional[int] = None, since_hours: Optional[float] = None,
+                                            if_none_match: Optional[str] = None) -> CachedResponse:
+    """
+    Returns get_combined_access_logs serialized as JSON, with an ETag derived
+    from the access logs' fingerprint and the requested window. The body is
+    omitted when `if_none_match` matches. Serialized bodies are cached until
+    a log changes, and concurrent identical requests share one parse.
+    """
+    limit = limit or Config.NGINX_STRUCTURED_LOG_LIMIT
+    since = _structured_log_window_start(since_hours)
+    try:
+        fingerprint = await asyncio.to_thread(_access_logs_fingerprint, Path(Config.NGINX_LOG_DIR))
+    except OSError as e:
+        logger.error(f"Error reading access log metadata: {e}")
+        raise NginxManagementError("Could not read access logs. Check permissions.", 500)
+
+    etag = make_etag((fingerprint, limit, since))
+    if etag_matches(if_none_match, etag):
+        return CachedResponse(etag, None)
+
+    async def serialize() -> bytes:
+        entries = await _combine_access_logs(limit, since)
+        return await asyncio.to_thread(_structured_logs_adapter.dump_json, entries)
+
+    return CachedResponse(etag, await _response_cache.get(("structured_logs", limit, since), etag, serialize))
+
+async def query_access_logs(query: LogQuery, limit: int = 100, cursor: Optional[str] = None) -> StructuredLogPage:
+    """
+    Returns a page of access log entries (from access.log and its rotations)
+    matching the query's filters, newest first, with a cursor for the next page.
+    Filters are applied while scanning, before any entry is built.
+    """
+    log_dir = Path(Config.NGINX_LOG_DIR)
+    if not await aios.path.isdir(log_dir):
+        logger.warning(f"Nginx log directory not found: {log_dir}")
+        return StructuredLogPage(entries=[])
+
+    try:
+        log_files = await asyncio.to_thread(discover_rotated_logs, log_dir, "access.log", Config.NGINX_MAX_LOG_ROTATIONS)
+        records, next_cursor = await asyncio.to_thread(run_log_query, log_files, query, limit, cursor)
+    except InvalidCursorError as e:
+        raise NginxManagementError(str(e), 400)
+    except OSError as e:
+        logger.error(f"Error querying access logs: {e}")
+        raise NginxManagementError("Could not read access logs. Check permissions.", 500)
+
+    return StructuredLogPage(entries=[record.to_entry() for record in records], next_cursor=next_cursor)
+
+
+async def export_access_logs(query: LogQuery, export_format: str = "ndjson") -> LogExport:
+    """
+    Prepares a streamed export of the access log entries (from access.log and
+    its rotations) matching the query, oldest first, as NDJSON, CSV or Parquet.
+    Entries are parsed and converted one chunk at a time while the response is
+    sent, so memory use doesn't depend on how many rows are exported.
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise NginxManagementError(f"Invalid export format '{export_format}'. Use one of: {', '.join(EXPORT_MEDIA_TYPES)}.", 400)
+    if export_format == "parquet" and not parquet_available():
+        raise NginxManagementError("Parquet export requires pyarrow, which is not installed.", 501)
+    # Everything about the request is checked here: once the body is streaming, errors can only cut it off.
+    query.since, query.until = as_utc(query.since), as_utc(query.until)
+    if query.since is not None and query.until is not None and query.since >= query.until:
+        raise NginxManagementError("The start of the time range must be before its end.", 400)
+
+    log_dir = Path(Config.NGINX_LOG_DIR)
+    if not await aios.path.isdir(log_dir):
+        raise NginxManagementError(f"Nginx log directory not found: {log_dir}", 404)
+    try:
+        log_files = await asyncio.to_thread(discover_rotated_logs, log_dir, "access.log", Config.NGINX_MAX_LOG_ROTATIONS)
+    except OSError as e:
+        logger.error(f"Error listing log directory {log_dir}: {e}")
+        raise NginxManagementError("Could not read access logs. Check permissions.", 500)
+    return export_records(log_files, query, export_format)
+
+
+async def get_traffic_rollups(granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[TrafficRollup]:
+    """
+    Returns traffic rollups of the given granularity ('minute', 'hour' or 'day')
+    between `start` and `end`, after folding in any newly appended access.log lines.
+    Rollups are only kept in memory, so buckets from before the tailer started
+    (or spanning lines it skipped) are marked partial.
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise NginxManagementError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(ROLLUP_GRANULARITIES)}.", 400)
+    try:
+        await poll_access_log()
+    except OSError as e:
+        logger.error(f"Error reading access log for rollups: {e}")
+    coverage_start_us, gaps = _get_main_access_log_tailer().coverage()
+    return traffic_rollups.query(granularity, start, end, coverage_start_us, gaps)
+
+
+_WINDOW_PATTERN = re.compile(r'^(\d+)([mh])$')
+_WINDOW_UNITS = {"m": 1, "h": 60}
+
+
+async def get_heavy_hitters(dimension: str, window: str = "15m", limit: int = 20) -> HeavyHitters:
+    """
+    Returns the most frequent values of `dimension` ('ip', 'path', 'user_agent'
+    or 'referer') over the last `window` (e.g. '15m', '2h'), after folding in any
+    newly appended access.log lines. Counts are approximate but bounded.
+    """
+    if dimension not in HEAVY_HITTER_DIMENSIONS:
+        raise NginxManagementError(f"Invalid dimension '{dimension}'. Use one of: {', '.join(HEAVY_HITTER_DIMENSIONS)}.", 400)
+    match = _WINDOW_PATTERN.match(window)
+    minutes = int(match.group(1)) * _WINDOW_UNITS[match.group(2)] if match else 0
+    if not 0 < minutes <= HEAVY_HITTER_RETENTION_MINUTES:
+        raise NginxManagementError(
+            f"Invalid window '{window}'. Use minutes or hours like '15m' or '2h', up to {HEAVY_HITTER_RETENTION_MINUTES // 60}h.", 400
         )
-        
-        # Process lines from newest to oldest
-        for line in reversed(log_lines):
-            if len(combined_data) >= 1000:
-                break
-                
-            # Rest of parsing logic remains the same as your original code
-            match = log_pattern.match(line)
-            if match:
-                log_entry = match.groupdict()
-                log_timestamp = None
+    try:
+        await poll_access_log()
+    except OSError as e:
+        logger.error(f"Error reading access log for heavy hitters: {e}")
 
-                try:
-                    log_timestamp = datetime.strptime(log_entry['timestamp'], '%d/%b/%Y:%H:%M:%S %z')
-                except ValueError:
-                    logger.warning(f"Invalid timestamp '{log_entry['timestamp']}'")
-                    continue
-
-                method, path, query, protocol = None, None, None, None
-                request_parts = log_entry['request'].split(' ', 2)
-                if len(request_parts) == 3:
-                    method = request_parts[0]
-                    path_query = request_parts[1]
-                    protocol = request_parts[2]
-                    parsed_url = urlparse(path_query)
-                    path = parsed_url.path
-                    query = parsed_url.query
-                else:
-                    logger.warning(f"Malformed request line '{log_entry['request']}'")
-                    continue
+    end = datetime.now(timezone.utc)
+    start = (end - timedelta(minutes=minutes)).replace(second=0, microsecond=0)
+    return heavy_hitters.query(dimension, start, end, limit)
 
-                try:
-                   size = int(log_entry['size']) if log_entry['size'] != '-' else 0
-                except ValueError:
-                     logger.warning(f"Invalid size value '{log_entry['size']}'")
-                     size = 0
 
-                try:
-                    entry = StructuredLogEntry(
-                       timestamp=log_timestamp.isoformat(),
-                       date=log_timestamp.date().isoformat(),
-                       ip=log_entry['ip'],
-                       method=method,
-                       path=path,
-                       query=query if query else None,
-                       protocol=protocol,
-                       status_code=int(log_entry['status']),
-                       response_size=size,
-                       referer=log_entry['referer'] if log_entry['referer'] != '-' else None,
-                       user_agent=log_entry['user_agent'] if log_entry['user_agent'] != '-' else None,
-                    )
-                    combined_data.append(entry)
-                except Exception as model_err:
-                     logger.warning(f"Error creating model instance - {model_err}")
-        
-        # Sort final entries by timestamp
-        combined_data.sort(key=lambda x: x.timestamp, reverse=True)
-        logger.info(f"Returning {len(combined_data)} most recent entries from access.log (up to 1000 requested).")
-        return combined_data
-            
-    except Exception as e:
-        logger.error(f"Error processing log file: {e}")
-        return []
+async def get_unique_visitors(granularity: str = "hour", site: Optional[str] = None,
+                              start: Optional[datetime] = None, end: Optional[datetime] = None) -> UniqueVisitors:
+    """
+    Returns approximate distinct client IPs and IP + user agent pairs per 'hour'
+    or 'day' bucket between `start` and `end`, and over the whole range, for one
+    site (request host) or all of them.
+    """
+    if granularity not in UNIQUE_VISITOR_GRANULARITIES:
+        raise NginxManagementError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(UNIQUE_VISITOR_GRANULARITIES)}.", 400)
+    try:
+        await poll_access_log()
+    except OSError as e:
+        logger.error(f"Error reading access log for unique visitors: {e}")
+    return await asyncio.to_thread(unique_visitors.query, granularity, site, start, end)
+
+
+
+async def get_latency_report(dimension: str = "path", start: Optional[datetime] = None,
+                             end: Optional[datetime] = None, limit: int = 20) -> LatencyReport:
+    """
+    Returns p50/p95/p99 latency in milliseconds between `start` (default: an
+    hour ago) and `end` (default: now), overall and for the busiest paths
+    ($request_time) or upstreams ($upstream_response_time). Naive bounds are taken as UTC.
+    """
+    if dimension not in LATENCY_DIMENSIONS:
+        raise NginxManagementError(f"Invalid dimension '{dimension}'. Use one of: {', '.join(LATENCY_DIMENSIONS)}.", 400)
+    end = as_utc(end) or datetime.now(timezone.utc)
+    start = as_utc(start) or end - timedelta(hours=1)
+    if start >= end:
+        raise NginxManagementError("The start of the time range must be before its end.", 400)
+    try:
+        await poll_access_log()
+    except OSError as e:
+        logger.error(f"Error reading access log for latency stats: {e}")
+    return await asyncio.to_thread(latency_stats.query, dimension, start, end, limit)
+
+
+def _validate_error_log_level(level: Optional[str]) -> None:
+    if level is not None and level not in ERROR_LOG_LEVELS:
+        raise NginxManagementError(f"Invalid level '{level}'. Use one of: {', '.join(ERROR_LOG_LEVELS)}.", 400)
+
+
+async def get_error_log_entries(log_name: str = "error.log", limit: int = 100, min_level: Optional[str] = None,
+                                since: Optional[datetime] = None) -> List[ErrorLogEntry]:
+    """
+    Returns the newest entries of an error log at or above `min_level`, newest
+    first, parsed into timestamp, level, pid/tid, connection, message and the
+    client/server/request/upstream/host context. A naive `since` is taken as UTC.
+    """
+    _validate_error_log_level(min_level)
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+    try:
+        return await asyncio.to_thread(read_error_log, str(log_file_path), limit, min_level, as_utc(since))
+    except OSError as e:
+        logger.error(f"Error reading error log {log_file_path}: {e}")
+        raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
+
+
+async def get_error_log_summary(log_name: str = "error.log", granularity: str = "hour", min_level: Optional[str] = None,
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                limit: int = 50) -> ErrorLogSummary:
+    """
+    Groups the entries of an error log by normalised message template, with
+    counts per time bucket, e.g. to spot a storm of 'connect() failed' errors.
+    The log is streamed through in the process pool. Naive bounds are taken as UTC.
+    """
+    _validate_error_log_level(min_level)
+    if granularity not in ERROR_BUCKET_SECONDS:
+        raise NginxManagementError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(ERROR_BUCKET_SECONDS)}.", 400)
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_process_pool(), aggregate_error_log, str(log_file_path), granularity, min_level, as_utc(start), as_utc(end), limit
+        )
+    except OSError as e:
+        logger.error(f"Error aggregating error log {log_file_path}: {e}")
+        raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
+
+
+async def scan_access_log(log_name: str) -> AsyncIterator[str]:
+    """
+    Prepares a full-file scan of an access log (of any size) as an NDJSON
+    stream of LogScanProgress lines. The file is split into newline-aligned
+    byte ranges that are parsed in parallel in the process pool; partial
+    aggregates are merged as they finish.
+    """
+    log_file_path = _get_log_path(log_name)
+    if not await aios.path.isfile(log_file_path):
+        raise NginxManagementError(f"Log file '{log_name}' not found.", 404)
+    log_format = await asyncio.to_thread(get_log_format, log_file_path)
+    if not compile_log_format(log_format).supports_records:
+        raise NginxManagementError(f"'{log_name}' is not written in an access log format that can be scanned.", 400)
+    try:
+        ranges = await asyncio.to_thread(split_log_file, log_file_path, Config.NGINX_SCAN_CHUNK_BYTES)
+        total_bytes = (await aios.stat(log_file_path)).st_size
+    except OSError as e:
+        logger.error(f"Error splitting log file {log_file_path}: {e}")
+        raise NginxManagementError(f"Could not read log file '{log_name}'. Check permissions.", 500)
+    return _iter_log_scan(log_file_path, ranges, total_bytes, log_format)
+
+
+async def _iter_log_scan(log_file_path: Path, ranges: List[Tuple[int, int]], total_bytes: int,
+                         log_format: str) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    # Only a few ranges are queued ahead, so abandoning the scan discards little work.
+    max_in_flight = 2 * Config.NGINX_LOG_WORKERS
+    remaining = iter(ranges)
+    pending: Dict[asyncio.Future, int] = {}
+    aggregate = LogScanAggregate()
+    chunks_done = bytes_scanned = 0
+    last_summary = float('-inf')
+
+    def submit_next() -> None:
+        for start, end in remaining:
+            future = loop.run_in_executor(pool, scan_log_range, str(log_file_path), start, end, log_format)
+            pending[future] = end - start
+            if len(pending) >= max_in_flight:
+                return
+
+    try:
+        submit_next()
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                bytes_scanned += pending.pop(future)
+                aggregate.merge(future.result())
+                chunks_done += 1
+            submit_next()
+            done = not pending
+            # Summaries are throttled, since each one estimates and ranks the sketches.
+            include_summary = done or loop.time() - last_summary >= 1
+            if include_summary:
+                last_summary = loop.time()
+            progress = LogScanProgress(
+                log_name=log_file_path.name,
+                chunks_done=chunks_done,
+                chunks_total=len(ranges),
+                bytes_scanned=bytes_scanned,
+                bytes_total=total_bytes,
+                done=done,
+                summary=aggregate.to_summary() if include_summary else None,
+            )
+            yield progress.model_dump_json() + "\n"
+        if not ranges:
+            yield LogScanProgress(
+                log_name=log_file_path.name, chunks_done=0, chunks_total=0, bytes_scanned=0, bytes_total=0,
+                done=True, summary=aggregate.to_summary()
+            ).model_dump_json() + "\n"
+    finally:
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.info(f"Scan of {log_file_path.name} abandoned with {len(pending)} chunks in flight.")
+
+
+async def search_logs(query: str, regex: bool = False, ignore_case: bool = False, log_names: Sequence[str] = (),
+                      context: int = 0, limit: int = 100) -> AsyncIterator[str]:
+    """
+    Prepares a search of the log files (all of them, most recently written
+    first, or just `log_names`) for lines containing `query`, or matching it
+    as a regular expression, streamed as NDJSON LogSearchMatch lines in file
+    order. Files are memory-mapped and split into chunks that are searched in
+    parallel in the process pool; the search stops at `limit` matches or when
+    the stream is closed.
+    """
+    if not query:
+        raise NginxManagementError("The search query must not be empty.", 400)
+    try:
+        needle, pattern = compile_search(query, regex, ignore_case)
+    except re.error as e:
+        raise NginxManagementError(f"Invalid regular expression: {e}", 400)
+
+    log_dir = Path(Config.NGINX_LOG_DIR)
+    if not await aios.path.isdir(log_dir):
+        raise NginxManagementError(f"Nginx log directory not found: {log_dir}", 404)
+    log_files = [_get_log_path(log_name) for log_name in log_names]
+    for log_file_path in log_files:
+        if not await aios.path.isfile(log_file_path):
+            raise NginxManagementError(f"Log file '{log_file_path.name}' not found.", 404)
+
+    def plan() -> List[Tuple[Path, int, int]]:
+        files = log_files or [log_file for log_file, _ in sorted(_stat_logs(log_dir), key=lambda log: -log[1].st_mtime)]
+        return [
+            (log_file, start, end)
+            for log_file in files
+            for start, end in split_search_ranges(log_file, Config.NGINX_SEARCH_CHUNK_BYTES)
+        ]
+
+    try:
+        ranges = await asyncio.to_thread(plan)
+    except OSError as e:
+        logger.error(f"Error preparing log search in {log_dir}: {e}")
+        raise NginxManagementError("Could not read log files. Check permissions.", 500)
+    return _iter_search(ranges, needle, pattern, context, limit)
+
+
+async def _iter_search(ranges: List[Tuple[Path, int, int]], needle: bytes, pattern: Optional[re.Pattern],
+                       context: int, limit: int) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    remaining = iter(ranges)
+    # Submission order, so results are streamed in file order while later chunks are searched ahead.
+    pending: deque = deque()
+    found = 0
+
+    def submit_next() -> None:
+        for log_path, start, end in remaining:
+            future = loop.run_in_executor(pool, search_log_range, str(log_path), start, end, needle, pattern, context, limit)
+            pending.append((future, log_path))
+            if len(pending) >= 2 * Config.NGINX_LOG_WORKERS:
+                return
+
+    try:
+        submit_next()
+        while pending and found < limit:
+            future, log_path = pending[0]
+            try:
+                hits = await future
+            except (OSError, EOFError, zlib.error, gzip.BadGzipFile) as e:
+                logger.warning(f"Skipping {log_path.name} in log search: {e}")
+                hits = []
+            pending.popleft()
+            for hit in hits[:limit - found]:
+                yield LogSearchMatch(log_name=log_path.name, **hit._asdict()).model_dump_json() + "\n"
+            found += min(len(hits), limit - found)
+            submit_next()
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        if pending and found < limit:
+            logger.info(f"Log search abandoned with {len(pending)} chunks in flight.")
+
+
+_compaction_lock = asyncio.Lock()
+
+
+async def compact_log_archives() -> AsyncIterator[str]:
+    """
+    Prepares a job that recompresses every gzipped log in the log directory
+    into a seekable archive of independently compressed blocks, streamed as
+    NDJSON LogArchiveResult lines as each file finishes. Archives stay valid
+    .gz files; their block index lets the viewer, time-range and structured
+    queries decompress only the blocks they need. Files are compacted in the
+    process pool; already compacted ones are skipped.
+    """
+    log_dir = Path(Config.NGINX_LOG_DIR)
+    if not await aios.path.isdir(log_dir):
+        raise NginxManagementError(f"Nginx log directory not found: {log_dir}", 404)
+    if _compaction_lock.locked():
+        raise NginxManagementError("A log archive compaction is already running.", 409)
+    try:
+        log_files = sorted(log_file for log_file, _ in await asyncio.to_thread(_stat_logs, log_dir) if log_file.suffix == '.gz')
+    except OSError as e:
+        logger.error(f"Error listing log directory {log_dir}: {e}")
+        raise NginxManagementError("Could not list log files. Check permissions.", 500)
+    return _iter_compaction(log_files)
+
+
+async def _iter_compaction(log_files: List[Path]) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    remaining = iter(log_files)
+    pending: Dict[asyncio.Future, Path] = {}
+
+    def submit_next() -> None:
+        for log_path in remaining:
+            future = loop.run_in_executor(
+                pool, compact_log_archive, str(log_path), log_formats[log_path], Config.NGINX_LOG_ARCHIVE_BLOCK_BYTES
+            )
+            pending[future] = log_path
+            if len(pending) >= Config.NGINX_LOG_WORKERS:
+                return
+
+    # Taken here rather than checked only, so racing requests queue instead of compacting the same files.
+    async with _compaction_lock:
+        try:
+            # Resolving a log_format may re-parse nginx.conf, so it's done off the event loop.
+            log_formats = {log_path: await asyncio.to_thread(get_log_format, log_path) for log_path in log_files}
+            submit_next()
+            while pending:
+                finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    log_path = pending.pop(future)
+                    try:
+                        compaction = future.result()
+                    except (OSError, EOFError, zlib.error, gzip.BadGzipFile) as e:
+                        logger.error(f"Could not compact log archive {log_path}: {e}")
+                        result = LogArchiveResult(log_name=log_path.name, status="failed", detail=str(e))
+                    else:
+                        if compaction.status == "compacted":
+                            logger.info(
+                                f"Compacted {log_path.name} into {compaction.blocks} blocks "
+                                f"({compaction.original_bytes} -> {compaction.archived_bytes} bytes)."
+                            )
+                        result = LogArchiveResult(log_name=log_path.name, **compaction._asdict())
+                    yield result.model_dump_json() + "\n"
+                submit_next()
+        finally:
+            for future in pending:
+                future.cancel()
+            if pending:
+                logger.info(f"Log archive compaction abandoned with {len(pending)} files in flight.")
+
+
+def _get_ingester():
+    ingester = get_ingester()
+    if ingester is None:
+        raise NginxManagementError("Access log ingestion into MongoDB is not enabled (NGINX_LOG_INGEST_ENABLED).", 503)
+    return ingester
+
+
+async def query_ingested_logs(query: LogQuery, limit: int = 100) -> List[StructuredLogEntry]:
+    """Searches the access log entries ingested into MongoDB, newest first, with indexed queries."""
+    ingester = _get_ingester()
+    try:
+        return await find_ingested_entries(ingester, query, limit)
+    except PyMongoError as e:
+        logger.error(f"Error querying ingested access logs: {e}")
+        raise NginxManagementError("Could not query ingested access logs.", 500)
+
+
+async def get_ingested_rollups(granularity: str, start: Optional[datetime] = None,
+                               end: Optional[datetime] = None) -> List[TrafficRollup]:
+    """Returns traffic rollups computed by MongoDB over the ingested access log entries."""
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise NginxManagementError(f"Invalid granularity '{granularity}'. Use one of: {', '.join(ROLLUP_GRANULARITIES)}.", 400)
+    ingester = _get_ingester()
+    try:
+        return await aggregate_ingested_traffic(ingester, granularity, start, end)
+    except PyMongoError as e:
+        logger.error(f"Error aggregating ingested access logs: {e}")
+        raise NginxManagementError("Could not aggregate ingested access logs.", 500)
+
+_background_tasks: List[asyncio.Task] = []
+
+
+async def _poll_access_log_forever() -> None:
+    await asyncio.to_thread(unique_visitors.load)
+    loop = asyncio.get_running_loop()
+    last_save = loop.time()
+    while True:
+        try:
+            await poll_access_log()
+            if loop.time() - last_save >= Config.NGINX_ANALYTICS_SAVE_SECONDS:
+                last_save = loop.time()
+                await asyncio.to_thread(unique_visitors.save)
+        except Exception as e:
+            logger.error(f"Background access log poll failed: {e}")
+        await asyncio.sleep(Config.NGINX_LOG_POLL_SECONDS)
+
+
+def start_background_tasks() -> None:
+    """Starts polling access.log so analytics stay current even when nobody queries them."""
+    _background_tasks.append(asyncio.create_task(_poll_access_log_forever()))
+    logger.info(f"Started access log polling every {Config.NGINX_LOG_POLL_SECONDS}s.")
+
+
+async def _ingest_access_log_forever(db) -> None:
+    ingester = start_ingester(db)
+    while True:
+        try:
+            await ingester.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Access log ingestion into MongoDB failed; restarting in 30s.")
+        await asyncio.sleep(30)
+
+
+def start_log_ingestion(db) -> None:
+    """Starts ingesting access.log into MongoDB, if NGINX_LOG_INGEST_ENABLED is set."""
+    if not Config.NGINX_LOG_INGEST_ENABLED:
+        return
+    _background_tasks.append(asyncio.create_task(_ingest_access_log_forever(db)))
+    logger.info(f"Started access log ingestion into '{Config.NGINX_LOG_INGEST_COLLECTION}'.")
+
+
+async def stop_background_tasks() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    if _background_tasks:
+        await asyncio.to_thread(unique_visitors.save)
+    _background_tasks.clear()
+
 
 def delete_log(log_name: str) -> None:
     """Deletes a log file."""
@@ -385,6 +1311,7 @@ def delete_log(log_name: str) -> None:
     try:
         log_file_path.unlink()
         logger.info(f"Deleted log file: {log_file_path}")
+        discard_log_index(log_file_path)
     except OSError as e:
         logger.error(f"Error deleting log file {log_file_path}: {e}")
         raise NginxManagementError(f"Could not delete log file '{log_name}'. Check permissions.", 500)
@@ -434,10 +1361,66 @@ def update_nginx_conf(content: str) -> None:
         raise NginxManagementError(f"An unexpected error occurred: {e}", 500)
 
 
+async def _conf_root(site_name: Optional[str]) -> Path:
+    """The file to parse: a site from sites-available, or nginx.conf (with everything it includes)."""
+    if site_name is not None:
+        site_path = _get_site_path(site_name, enabled=False)
+        if not await aios.path.isfile(site_path):
+            raise NginxManagementError(f"Site '{site_name}' not found in available sites.", 404)
+        return site_path
+    conf_path = Path(Config.NGINX_CONF_FILE)
+    if not await aios.path.isfile(conf_path):
+        raise NginxManagementError(f"Nginx config file not found: {conf_path}", 404)
+    return conf_path
+
+
+async def get_conf_tree(site_name: Optional[str] = None) -> ConfTree:
+    """
+    Parses nginx.conf (or one site) and every file it includes into a syntax
+    tree with source lines. Each file's parse is cached by content hash, so
+    after an edit only the changed files are parsed again.
+    """
+    return await asyncio.to_thread(build_conf_tree, await _conf_root(site_name))
+
+
+async def find_conf_directives(name: str, site_name: Optional[str] = None) -> List[ConfDirectiveMatch]:
+    """Finds every `name` directive in the parsed config, with its file, line and enclosing blocks."""
+    return await asyncio.to_thread(find_directives, await _conf_root(site_name), name)
+
+
+async def get_conf_servers(site_name: Optional[str] = None) -> List[ConfServer]:
+    """Lists the server blocks in the parsed config with their names, listen addresses and locations."""
+    return await asyncio.to_thread(find_servers, await _conf_root(site_name))
+
+
+async def get_conf_upstreams(site_name: Optional[str] = None) -> List[ConfUpstream]:
+    """Lists the upstream blocks in the parsed config with their servers."""
+    return await asyncio.to_thread(find_upstreams, await _conf_root(site_name))
+
+
 # --- Nginx Service Management (Requires sudo) ---
 
+async def _stop_process(process: asyncio.subprocess.Process) -> None:
+    """Terminates a command (sudo passes SIGTERM on to it), killing it if it doesn't exit promptly."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
+
 async def _run_nginx_command(command_args: List[str]) -> NginxCommandStatus:
-    """Helper function to run an Nginx command with sudo and capture output."""
+    """
+    Helper function to run an Nginx command with sudo and capture output.
+    A command still running after NGINX_COMMAND_TIMEOUT_SECONDS (or whose
+    caller is cancelled) is stopped. Callers go through the control queue.
+    """
     command_str = " ".join(command_args)
     logger.info(f"Attempting to run command: {command_str}")
     try:
@@ -446,7 +1429,15 @@ async def _run_nginx_command(command_args: List[str]) -> NginxCommandStatus:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
-        stdout, stderr = await process.communicate()
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), Config.NGINX_COMMAND_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await _stop_process(process)
+            logger.error(f"Command '{command_str}' timed out after {Config.NGINX_COMMAND_TIMEOUT_SECONDS}s and was stopped.")
+            raise NginxManagementError(f"Command '{command_str}' timed out after {Config.NGINX_COMMAND_TIMEOUT_SECONDS} seconds.", 504)
+        except asyncio.CancelledError:
+            await _stop_process(process)
+            raise
         # Ensure return_code is int, default to -1 if process terminates unexpectedly
         return_code = process.returncode if process.returncode is not None else -1
 
@@ -482,43 +1473,110 @@ async def _run_nginx_command(command_args: List[str]) -> NginxCommandStatus:
     except FileNotFoundError:
         logger.error(f"Command not found: '{command_args[0]}'. Is it installed and in PATH?")
         raise NginxManagementError(f"Command '{command_args[0]}' not found. Ensure it's installed and accessible.", 500)
+    except NginxManagementError:
+        raise
     except Exception as e:
         logger.exception(f"Error running command '{command_str}': {e}")
         raise NginxManagementError(f"An unexpected error occurred while running '{command_str}': {e}", 500)
 
+
+# The control queue: every service command runs while holding this lock, so
+# they run one at a time, in the order they were requested.
+_control_lock = asyncio.Lock()
+_pending_reload: Optional[asyncio.Future] = None
+_reload_task: Optional[asyncio.Task] = None
+
+_TEST_COMMAND = ['sudo', 'nginx', '-t']
+_RELOAD_COMMAND = ['sudo', 'systemctl', 'reload', 'nginx']
+
+
+async def _run_queued_command(command_args: List[str]) -> NginxCommandStatus:
+    async with _control_lock:
+        return await _run_nginx_command(command_args)
+
+
+async def _run_coalesced_reload(result: asyncio.Future) -> None:
+    global _pending_reload
+    try:
+        await asyncio.sleep(Config.NGINX_RELOAD_DEBOUNCE_SECONDS)
+        async with _control_lock:
+            # Requests from here on may follow config changes this test won't see: they get the next reload.
+            _pending_reload = None
+            command_status = await _run_nginx_command(_TEST_COMMAND)
+            if command_status.success:
+                command_status = await _run_nginx_command(_RELOAD_COMMAND)
+            else:
+                command_status = command_status.model_copy(
+                    update={"message": f"Reload skipped, configuration test failed. {command_status.message}"}
+                )
+        result.set_result(command_status)
+    except asyncio.CancelledError:
+        result.cancel()
+        raise
+    except Exception as e:
+        result.set_exception(e)
+        # Every caller may have given up waiting; mark the exception retrieved so it isn't reported as lost.
+        result.exception()
+    finally:
+        if _pending_reload is result:
+            _pending_reload = None
+
 async def test_nginx_config() -> NginxCommandStatus:
     """Tests the Nginx configuration using 'sudo nginx -t'."""
     # Consider finding the actual nginx binary path if needed, e.g., shutil.which('nginx')
     # For now, assuming 'nginx' is in sudo path
-    return await _run_nginx_command(['sudo', 'nginx', '-t'])
+    return await _run_queued_command(_TEST_COMMAND)
+
+async def test_and_reload_nginx() -> Tuple[NginxCommandStatus, Optional[NginxCommandStatus]]:
+    """
+    Tests the configuration and, if it passes, reloads Nginx right away, in a
+    single turn of the control queue: no debounce, and not shared with other
+    reload requests. Returns the test status and the reload status (None if
+    the test failed).
+    """
+    async with _control_lock:
+        test_status = await _run_nginx_command(_TEST_COMMAND)
+        if not test_status.success:
+            return test_status, None
+        return test_status, await _run_nginx_command(_RELOAD_COMMAND)
 
 async def reload_nginx() -> NginxCommandStatus:
-    """Reloads the Nginx service using 'sudo systemctl reload nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'reload', 'nginx'])
+    """
+    Tests the configuration and reloads the Nginx service using 'sudo
+    systemctl reload nginx' if it passes. Reloads requested within
+    NGINX_RELOAD_DEBOUNCE_SECONDS of each other (or while the previous one
+    waits for the control queue) are collapsed into one, whose result every
+    caller gets. A caller giving up doesn't cancel the shared reload.
+    """
+    global _pending_reload, _reload_task
+    if _pending_reload is None:
+        _pending_reload = asyncio.get_running_loop().create_future()
+        _reload_task = asyncio.create_task(_run_coalesced_reload(_pending_reload))
+    return await asyncio.shield(_pending_reload)
 
 async def restart_nginx() -> NginxCommandStatus:
     """Restarts the Nginx service using 'sudo systemctl restart nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'restart', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'restart', 'nginx'])
 
 async def stop_nginx() -> NginxCommandStatus:
     """Stops the Nginx service using 'sudo systemctl stop nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'stop', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'stop', 'nginx'])
 
 async def start_nginx() -> NginxCommandStatus:
     """Starts the Nginx service using 'sudo systemctl start nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'start', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'start', 'nginx'])
 
 async def enable_nginx() -> NginxCommandStatus:
     """Enables the Nginx service to start on boot using 'sudo systemctl enable nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'enable', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'enable', 'nginx'])
 
 async def disable_nginx() -> NginxCommandStatus:
     """Disables the Nginx service from starting on boot using 'sudo systemctl disable nginx'."""
-    return await _run_nginx_command(['sudo', 'systemctl', 'disable', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'disable', 'nginx'])
 
 async def get_nginx_status() -> NginxCommandStatus:
     """Gets the Nginx service status using 'sudo systemctl status nginx'."""
     # Note: systemctl status often returns non-zero code even if service is inactive but found.
     # The success flag in the result will reflect the direct command success (code 0).
     # Consumers should check stdout/stderr for actual status details.
-    return await _run_nginx_command(['sudo', 'systemctl', 'status', 'nginx'])
+    return await _run_queued_command(['sudo', 'systemctl', 'status', 'nginx'])
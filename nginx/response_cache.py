@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    # The serialized response, or None when the client's If-None-Match already matches `etag`.
+    body: Optional[bytes]
+
+
+def make_etag(fingerprint: Any) -> str:
+    """Returns a strong ETag for a response that is fully determined by `fingerprint` (a repr-able value)."""
+    return '"' + hashlib.blake2b(repr(fingerprint).encode(), digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag`, using the weak comparison RFC 9110 requires for it."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    A small LRU cache of serialized response bodies, bounded by their total size.
+    Each key holds one body along with the ETag of the inputs it was built from,
+    so a changed fingerprint simply replaces it. Concurrent requests for the same
+    key and ETag share a single computation instead of each repeating it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[str, bytes]]" = OrderedDict()
+        self._size = 0
+        self._in_flight: Dict[Tuple[Hashable, str], asyncio.Future] = {}
+
+    async def get(self, key: Hashable, etag: str, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == etag:
+            self._entries.move_to_end(key)
+            return cached[1]
+
+        task = self._in_flight.get((key, etag))
+        if task is None:
+            # A task of its own, so the first requester disconnecting doesn't cancel it for the others.
+            task = self._in_flight[(key, etag)] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda done: self._finish(key, etag, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, etag: str, task: asyncio.Future) -> None:
+        del self._in_flight[(key, etag)]
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, etag, task.result())
+
+    def _store(self, key: Hashable, etag: str, body: bytes) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous[1])
+        if len(body) > self.max_bytes:
+            return
+        self._entries[key] = (etag, body)
+        self._size += len(body)
+        while self._size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
+from datetime import datetime
 
 from .models import (
     SiteInfo, SiteCreate, SiteUpdate, NginxConf, LogInfo,
-    SiteActionStatus, LogActionStatus, ConfActionStatus, StructuredLogEntry
+    SiteActionStatus, LogActionStatus, ConfActionStatus, StructuredLogEntry, StructuredLogPage,
+    TrafficRollup, HeavyHitters, UniqueVisitors, LatencyReport, ErrorLogEntry, ErrorLogSummary,
+    ConfTree, ConfDirectiveMatch, ConfServer, ConfUpstream, ServerNameEntry, ServerNameConflict,
+    SiteBatch, SiteBatchResult
 )
 from . import nginx_manager
 from .nginx_manager import NginxManagementError
+from .log_query import LogQuery
+from .response_cache import CachedResponse
 from auth.security import get_current_user
 from helpers.logger import logger
 
@@ -18,17 +26,27 @@ def handle_nginx_error(e: NginxManagementError):
     logger.error(f"Nginx API Error: {e.message} (Status Code: {e.status_code})")
     raise HTTPException(status_code=e.status_code, detail=e.message)
 
+def cached_json_response(cached: CachedResponse) -> Response:
+    # no-cache: clients may keep the body but must revalidate it with If-None-Match.
+    headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+    if cached.body is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 
 @nginx_router.get("/sites", response_model=List[SiteInfo], summary="List Nginx Sites")
-async def get_nginx_sites(current_user: dict = CurrentUser):
+async def get_nginx_sites(
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    current_user: dict = CurrentUser
+):
     """
     Retrieves a list of all available Nginx sites and their enabled status.
+    The list is kept in memory and only rebuilt when the site directories change.
+    Responses carry an ETag; a matching `If-None-Match` is answered with 304.
     Requires authentication.
     """
     try:
-        sites = nginx_manager.list_sites()
-        return sites
+        return cached_json_response(await nginx_manager.get_site_list_response(if_none_match))
     except NginxManagementError as e:
         handle_nginx_error(e)
     except Exception as e:
@@ -43,7 +61,7 @@ async def create_nginx_site(site_data: SiteCreate, current_user: dict = CurrentU
     Requires authentication. The site is NOT enabled automatically.
     """
     try:
-        created_site = nginx_manager.create_site(site_data.name, site_data.content)
+        created_site = await nginx_manager.run_site_change(nginx_manager.create_site, site_data.name, site_data.content)
         return SiteActionStatus(
             success=True,
             message=f"Site '{created_site.name}' created successfully in sites-available.",
@@ -56,6 +74,85 @@ async def create_nginx_site(site_data: SiteCreate, current_user: dict = CurrentU
          logger.exception(f"Unexpected error creating Nginx site {site_data.name}")
          raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
+@nginx_router.post("/sites/batch", response_model=SiteBatchResult, summary="Apply Site Operations as One Change")
+async def apply_nginx_site_batch(batch: SiteBatch, current_user: dict = CurrentUser):
+    """
+    Applies a list of create/update/enable/disable/delete operations together,
+    then tests the configuration once and (by default) reloads Nginx once.
+    An invalid operation fails the whole batch before anything is written; a
+    failed test or reload, or a server name conflict the batch introduces
+    between enabled sites (unless `force` is set), rolls every change back and
+    returns 400 with the failed result. Single-site changes wait while a batch runs.
+    Requires authentication and appropriate sudo permissions for the FastAPI process user.
+    """
+    try:
+        logger.info(f"Site batch of {len(batch.operations)} operations requested by user '{current_user.get('username')}'.")
+        result = await nginx_manager.apply_site_batch(batch.operations, batch.force, batch.reload)
+        response_status = status.HTTP_200_OK if result.success else status.HTTP_400_BAD_REQUEST
+        return Response(content=result.model_dump_json(), status_code=response_status, media_type="application/json")
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+         logger.exception("Unexpected error applying Nginx site batch")
+         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/sites/lookup", response_model=List[ServerNameEntry], summary="Find Sites Serving a Host")
+async def lookup_nginx_server_name(
+    host: str = Query(..., min_length=1, description="Host name, e.g. www.example.com"),
+    port: Optional[int] = Query(None, ge=0, le=65535, description="Only server blocks listening on this port"),
+    current_user: dict = CurrentUser
+):
+    """
+    Lists the enabled server blocks whose server_name matches `host`, in the
+    order nginx prefers them: exact names, wildcards starting with '*',
+    wildcards ending with '*', then regular expressions.
+    Served from an in-memory index of every site's server names and listen ports.
+    Requires authentication.
+    """
+    try:
+        return await asyncio.to_thread(nginx_manager.lookup_server_name, host, port)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+         logger.exception(f"Unexpected error looking up server name {host}")
+         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/sites/conflicts", response_model=List[ServerNameConflict], summary="List Server Name Conflicts")
+async def get_nginx_server_name_conflicts(current_user: dict = CurrentUser):
+    """
+    Lists server names that more than one enabled server block claims on the
+    same port (nginx ignores all but the first of them).
+    Requires authentication.
+    """
+    try:
+        return await asyncio.to_thread(nginx_manager.get_server_name_conflicts)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+         logger.exception("Unexpected error listing server name conflicts")
+         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.post("/sites/{site_name}/conflicts", response_model=List[ServerNameConflict], summary="Check Site for Server Name Conflicts")
+async def check_nginx_site_conflicts(site_name: str, site_content: Optional[NginxConf] = None, current_user: dict = CurrentUser):
+    """
+    Lists the server name conflicts a site would have with the enabled sites
+    once enabled. Send `content` to check an edit (or a new site) before saving it;
+    without a body the site's current file is checked.
+    Requires authentication.
+    """
+    try:
+        content = site_content.content if site_content is not None else None
+        return await asyncio.to_thread(nginx_manager.check_site_conflicts, site_name, content)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+         logger.exception(f"Unexpected error checking Nginx site {site_name} for conflicts")
+         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
 @nginx_router.get("/sites/{site_name}", response_model=SiteInfo, summary="Get Specific Nginx Site")
 async def get_nginx_site(site_name: str, current_user: dict = CurrentUser):
     """
@@ -63,7 +160,7 @@ async def get_nginx_site(site_name: str, current_user: dict = CurrentUser):
     Requires authentication.
     """
     try:
-        site_info = nginx_manager.get_site_info(site_name)
+        site_info = await asyncio.to_thread(nginx_manager.get_site_info, site_name)
         return site_info
     except NginxManagementError as e:
         handle_nginx_error(e)
@@ -73,31 +170,39 @@ async def get_nginx_site(site_name: str, current_user: dict = CurrentUser):
 
 
 @nginx_router.put("/sites/{site_name}", response_model=SiteActionStatus, summary="Update or Enable/Disable Nginx Site")
-async def update_nginx_site(site_name: str, site_update: SiteUpdate, current_user: dict = CurrentUser):
+async def update_nginx_site(
+    site_name: str,
+    site_update: SiteUpdate,
+    force: bool = Query(False, description="Save or enable even if the site's server names conflict with another enabled site"),
+    current_user: dict = CurrentUser
+):
     """
     Updates an Nginx site configuration or enables/disables it.
     - To update content, provide the `content` field.
     - To enable/disable, provide the `enable` field (true/false).
+    Saving an enabled site, or enabling one, fails with 409 if a server name it
+    listens for is already served on the same port by another enabled site,
+    unless `force` is set.
     Requires authentication.
     """
     action_taken = "updated" 
     try:
-        nginx_manager.get_site_info(site_name)
+        await asyncio.to_thread(nginx_manager.get_site_info, site_name)
 
         if site_update.content is not None:
-            nginx_manager.update_site_content(site_name, site_update.content)
+            await nginx_manager.run_site_change(nginx_manager.update_site_content, site_name, site_update.content, force)
             logger.info(f"Site '{site_name}' content updated by user '{current_user.get('username')}'.")
             action_taken = "content_updated"
 
 
         if site_update.enable is not None:
             if site_update.enable:
-                nginx_manager.enable_site(site_name)
+                await nginx_manager.run_site_change(nginx_manager.enable_site, site_name, force)
                 action_taken = "enabled" if action_taken == "updated" else f"{action_taken}_and_enabled"
                 logger.info(f"Site '{site_name}' enabled by user '{current_user.get('username')}'.")
 
             else:
-                nginx_manager.disable_site(site_name)
+                await nginx_manager.run_site_change(nginx_manager.disable_site, site_name)
                 action_taken = "disabled" if action_taken == "updated" else f"{action_taken}_and_disabled"
                 logger.info(f"Site '{site_name}' disabled by user '{current_user.get('username')}'.")
 
@@ -123,7 +228,7 @@ async def delete_nginx_site(site_name: str, current_user: dict = CurrentUser):
     Requires authentication. This is a permanent action.
     """
     try:
-        nginx_manager.delete_site(site_name)
+        await nginx_manager.run_site_change(nginx_manager.delete_site, site_name)
         logger.info(f"Site '{site_name}' deleted by user '{current_user.get('username')}'.")
         return SiteActionStatus(
             success=True,
@@ -140,14 +245,17 @@ async def delete_nginx_site(site_name: str, current_user: dict = CurrentUser):
 
 
 @nginx_router.get("/logs", response_model=List[LogInfo], summary="List Nginx Logs")
-async def get_nginx_logs(current_user: dict = CurrentUser):
+async def get_nginx_logs(
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    current_user: dict = CurrentUser
+):
     """
     Retrieves a list of Nginx log files found in the configured log directory.
+    Responses carry an ETag; a matching `If-None-Match` is answered with 304.
     Requires authentication.
     """
     try:
-        logs = nginx_manager.list_logs()
-        return logs
+        return cached_json_response(await nginx_manager.get_log_list_response(if_none_match))
     except NginxManagementError as e:
         handle_nginx_error(e)
     except Exception as e:
@@ -155,42 +263,178 @@ async def get_nginx_logs(current_user: dict = CurrentUser):
          raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
 
+@nginx_router.get("/logs/search", summary="Search Nginx Logs", response_class=StreamingResponse)
+async def search_nginx_logs(
+    q: str = Query(..., description="Text to search for, or a regular expression with regex=true"),
+    regex: bool = Query(False, description="Treat `q` as a regular expression"),
+    ignore_case: bool = Query(False, description="Match case-insensitively"),
+    log: List[str] = Query([], description="Only search these log files (repeatable); default all"),
+    context: int = Query(0, ge=0, le=10, description="Lines of context to include before and after each match"),
+    limit: int = Query(100, ge=1, le=10000, description="Maximum number of matching lines"),
+    current_user: dict = CurrentUser
+):
+    """
+    Searches all log files, including rotated and gzipped ones, for lines
+    containing `q`, like grep. Files are memory-mapped and searched in
+    parallel chunks across CPU cores. Streams NDJSON lines with the file, byte
+    offset and line of each match (plus `context` surrounding lines), most
+    recently written files first; stops at `limit` matches or when the client
+    disconnects. Requires authentication.
+    """
+    try:
+        matches = await nginx_manager.search_logs(q, regex, ignore_case, log, context, limit)
+        return StreamingResponse(matches, media_type="application/x-ndjson")
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error searching Nginx logs")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
 @nginx_router.get("/logs/{log_name}", summary="Get Nginx Log Content", response_class=Response)
 async def get_nginx_log_content(
     log_name: str,
     tail: Optional[int] = Query(100, description="Number of lines to tail from the end (0 or negative means full log)"),
+    gzip: bool = Query(False, description="When downloading the full log, gzip it on the fly"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
     current_user: dict = CurrentUser
 ):
     """
     Retrieves the content (or tail) of a specific Nginx log file.
+    The full log (tail <= 0) is streamed in chunks and supports `Range`/`If-Range`
+    for resumable downloads, or gzip compression with `gzip=true`.
     Requires authentication. Returns plain text.
     """
     try:
-        content = nginx_manager.get_log_content(log_name, tail_lines=tail if tail is not None and tail > 0 else None)
-        return Response(content=content, media_type="text/plain")
+        if tail is not None and tail > 0:
+            content = await nginx_manager.get_log_content(log_name, tail_lines=tail)
+            return Response(content=content, media_type="text/plain")
+
+        log_stream = await nginx_manager.stream_log_content(log_name, range_header, if_range, compress=gzip)
+        return StreamingResponse(
+            log_stream.body,
+            status_code=log_stream.status_code,
+            headers=log_stream.headers,
+            media_type=log_stream.media_type
+        )
     except NginxManagementError as e:
         handle_nginx_error(e)
     except Exception as e:
          logger.exception(f"Unexpected error reading Nginx log {log_name}")
          raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
+@nginx_router.get("/logs/{log_name}/range", summary="Get Nginx Log Lines in a Time Range", response_class=StreamingResponse)
+async def get_nginx_log_time_range(
+    log_name: str,
+    start: Optional[datetime] = Query(None, description="Only lines logged at or after this time (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="Only lines logged before this time (ISO 8601)"),
+    current_user: dict = CurrentUser
+):
+    """
+    Streams the lines of an access log logged between `start` and `end`.
+    Uses a sparse timestamp index persisted next to the log, so only the
+    matching slice of the file is read; gzipped logs compacted with
+    `/logs/archive/compact` are read through their block index.
+    Requires authentication. Returns plain text.
+    """
+    try:
+        lines = await nginx_manager.stream_log_time_range(log_name, start, end)
+        return StreamingResponse(lines, media_type="text/plain")
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error reading time range of Nginx log {log_name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+@nginx_router.get("/logs/{log_name}/live", summary="Follow an Nginx Log Live", response_class=StreamingResponse)
+async def follow_nginx_log(
+    log_name: str,
+    parsed: bool = Query(False, description="Send structured entries instead of raw lines"),
+    current_user: dict = CurrentUser
+):
+    """
+    Streams lines appended to a log as Server-Sent Events (`text/event-stream`).
+    The log is watched with inotify (or a cheap stat poll where unavailable) by a
+    single watcher shared between all clients. Each client has a bounded buffer;
+    if it falls behind, the oldest lines are dropped and reported in a `dropped` event.
+    Requires authentication.
+    """
+    try:
+        events = await nginx_manager.stream_live_log(log_name, parsed=parsed)
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error following Nginx log {log_name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+@nginx_router.get("/logs/{log_name}/scan", summary="Scan a Whole Nginx Access Log", response_class=StreamingResponse)
+async def scan_nginx_access_log(log_name: str, current_user: dict = CurrentUser):
+    """
+    Computes statistics over an entire access log of any size: request and
+    byte totals, status and method mix, distinct IPs, top IPs and paths and
+    latency percentiles. The file is split into newline-aligned chunks that are
+    parsed in parallel across CPU cores. Streams NDJSON progress lines as
+    chunks finish; the last one has `done: true` and the final summary.
+    Requires authentication.
+    """
+    try:
+        progress = await nginx_manager.scan_access_log(log_name)
+        return StreamingResponse(progress, media_type="application/x-ndjson")
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error scanning Nginx log {log_name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+@nginx_router.post("/logs/archive/compact", summary="Compact Gzipped Nginx Logs into Seekable Archives", response_class=StreamingResponse)
+async def compact_nginx_log_archives(current_user: dict = CurrentUser):
+    """
+    Recompresses every gzipped log (such as `access.log.2.gz`) into independently
+    compressed blocks, each recording its line count and first timestamp. The
+    result is still an ordinary .gz file, but the log viewer, time-range and
+    structured queries then only decompress the blocks they need. Streams one
+    NDJSON result line per file as it finishes; already compacted files are
+    skipped. Returns 409 while another compaction is running.
+    Requires authentication.
+    """
+    try:
+        results = await nginx_manager.compact_log_archives()
+        return StreamingResponse(results, media_type="application/x-ndjson")
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error compacting Nginx log archives")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
 @nginx_router.get(
     "/structured/logs",
     summary="Get Combined Structured Nginx Access Logs",
     response_model=List[StructuredLogEntry]
 )
 async def get_combined_structured_nginx_logs(
+    limit: Optional[int] = Query(None, ge=1, le=100000, description="Maximum number of entries (defaults to NGINX_STRUCTURED_LOG_LIMIT)"),
+    hours: Optional[float] = Query(None, ge=0, description="Only include entries from the last N hours (0 means no time bound)"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     current_user: dict = CurrentUser # Requires authentication
 ):
     """
     Retrieves and combines parsed structured data from Nginx access log files
-    (access.log and its rotations up to access.log.20). Useful for comprehensive
-    graphing and analysis of access patterns. Returns logs sorted newest first.
+    (access.log and its rotations up to access.log.20, including gzipped ones).
+    Useful for comprehensive graphing and analysis of access patterns.
+    Returns logs sorted newest first, bounded by `limit` and `hours`.
+    The ETag changes whenever a log file does (or the window moves on by a
+    minute); a matching `If-None-Match` is answered with 304 without parsing.
     Requires authentication.
     """
     try:
-        structured_data = await nginx_manager.get_combined_access_logs()
-        return structured_data
+        response = await nginx_manager.get_combined_access_logs_response(limit=limit, since_hours=hours, if_none_match=if_none_match)
+        return cached_json_response(response)
     except NginxManagementError as e:
         handle_nginx_error(e)
     except Exception as e:
@@ -198,6 +442,261 @@ async def get_combined_structured_nginx_logs(
         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
 
+@nginx_router.get("/structured/query", response_model=StructuredLogPage, summary="Query Structured Nginx Access Logs")
+async def query_structured_nginx_logs(
+    status_code: List[int] = Query([], alias="status", description="Only these status codes (repeatable)"),
+    ip: Optional[str] = Query(None, description="Only requests from this client IP"),
+    method: Optional[str] = Query(None, description="Only this request method"),
+    path_prefix: Optional[str] = Query(None, description="Only paths starting with this prefix"),
+    since: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Only entries before this time (ISO 8601)"),
+    limit: int = Query(100, ge=1, le=5000, description="Maximum number of entries per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page's next_cursor"),
+    current_user: dict = CurrentUser
+):
+    """
+    Searches access.log and its rotations for entries matching all given filters,
+    newest first. Filters are pushed down into the scan, and `since`/`until` use
+    the sparse time index, so rare matches don't require building every entry.
+    Returns a page of entries and a cursor for the next (older) page.
+    Requires authentication.
+    """
+    try:
+        query = LogQuery(
+            statuses=status_code, ip=ip, method=method, path_prefix=path_prefix, since=since, until=until
+        )
+        return await nginx_manager.query_access_logs(query, limit=limit, cursor=cursor)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error querying structured Nginx access logs")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/structured/export", summary="Export Structured Nginx Access Logs", response_class=StreamingResponse)
+async def export_structured_nginx_logs(
+    export_format: str = Query("ndjson", alias="format", description="ndjson, csv or parquet (parquet requires pyarrow)"),
+    status_code: List[int] = Query([], alias="status", description="Only these status codes (repeatable)"),
+    ip: Optional[str] = Query(None, description="Only requests from this client IP"),
+    method: Optional[str] = Query(None, description="Only this request method"),
+    path_prefix: Optional[str] = Query(None, description="Only paths starting with this prefix"),
+    since: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Only entries before this time (ISO 8601)"),
+    current_user: dict = CurrentUser
+):
+    """
+    Streams every access log entry (access.log and its rotations) matching the
+    filters, oldest first, as a download in NDJSON, CSV or Parquet. There is no
+    row limit: entries are generated from the logs while the response is sent,
+    with constant memory. Requires authentication.
+    """
+    try:
+        query = LogQuery(
+            statuses=status_code, ip=ip, method=method, path_prefix=path_prefix, since=since, until=until
+        )
+        export = await nginx_manager.export_access_logs(query, export_format)
+        return StreamingResponse(
+            export.body,
+            media_type=export.media_type,
+            headers={"Content-Disposition": f'attachment; filename="{export.filename}"'}
+        )
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error exporting structured Nginx access logs")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/db/logs", response_model=List[StructuredLogEntry], summary="Query Access Logs Ingested into MongoDB")
+async def query_ingested_nginx_logs(
+    status_code: List[int] = Query([], alias="status", description="Only these status codes (repeatable)"),
+    ip: Optional[str] = Query(None, description="Only requests from this client IP"),
+    method: Optional[str] = Query(None, description="Only this request method"),
+    path_prefix: Optional[str] = Query(None, description="Only paths starting with this prefix"),
+    since: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Only entries before this time (ISO 8601)"),
+    limit: int = Query(100, ge=1, le=5000, description="Maximum number of entries"),
+    current_user: dict = CurrentUser
+):
+    """
+    Searches the access log entries ingested into the MongoDB time-series
+    collection, newest first. Answered by indexed database queries, so it covers
+    the whole retention period without scanning log files. Requires
+    NGINX_LOG_INGEST_ENABLED. Requires authentication.
+    """
+    try:
+        query = LogQuery(
+            statuses=status_code, ip=ip, method=method, path_prefix=path_prefix, since=since, until=until
+        )
+        return await nginx_manager.query_ingested_logs(query, limit=limit)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error querying ingested Nginx access logs")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/db/rollups", response_model=List[TrafficRollup], summary="Get Traffic Rollups from MongoDB")
+async def get_ingested_nginx_rollups(
+    granularity: str = Query("hour", description="Bucket size: minute, hour or day"),
+    start: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="Only entries before this time (ISO 8601)"),
+    current_user: dict = CurrentUser
+):
+    """
+    Computes per-bucket traffic aggregates (requests, status classes, bytes
+    sent, methods) over the ingested access log entries with a MongoDB
+    aggregation. Requires NGINX_LOG_INGEST_ENABLED. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_ingested_rollups(granularity, start, end)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error aggregating ingested Nginx access logs")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/stats/rollups", response_model=List[TrafficRollup], summary="Get Time-Bucketed Traffic Rollups")
+async def get_nginx_traffic_rollups(
+    granularity: str = Query("minute", description="Bucket size: minute, hour or day"),
+    start: Optional[datetime] = Query(None, description="Only buckets starting at or after this time (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="Only buckets starting before this time (ISO 8601)"),
+    current_user: dict = CurrentUser
+):
+    """
+    Retrieves server-side aggregates of access.log traffic per time bucket:
+    request count, status class counts, bytes sent and method mix.
+    Rollups are maintained incrementally as the log grows, so they cover all
+    traffic seen rather than just the newest entries. They are kept in memory:
+    buckets flagged `partial` are missing traffic from before the server
+    started following the log (it reads back NGINX_LOG_BOOTSTRAP_BYTES) or
+    that it skipped after falling behind. Returns buckets oldest first.
+    Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_traffic_rollups(granularity, start, end)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error computing traffic rollups")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/stats/top", response_model=HeavyHitters, summary="Get Top Client IPs, Paths, User Agents or Referers")
+async def get_nginx_heavy_hitters(
+    dimension: str = Query("ip", description="What to rank: ip, path, user_agent or referer"),
+    window: str = Query("15m", description="How far back to look, e.g. 15m or 2h"),
+    limit: int = Query(20, ge=1, le=100, description="Number of values to return"),
+    current_user: dict = CurrentUser
+):
+    """
+    Retrieves the most frequent values of a request dimension in the recent
+    access.log traffic, e.g. the top 20 client IPs of the last 15 minutes.
+    Counts come from bounded-memory Space-Saving summaries: each is an upper
+    bound, off by at most its `error`. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_heavy_hitters(dimension, window, limit)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error computing heavy hitters")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/stats/unique", response_model=UniqueVisitors, summary="Get Unique Visitor Counts")
+async def get_nginx_unique_visitors(
+    granularity: str = Query("hour", description="Bucket size: hour or day"),
+    site: Optional[str] = Query(None, description="Only requests to this host (needs $host in the log_format)"),
+    start: Optional[datetime] = Query(None, description="Only buckets starting at or after this time (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="Only buckets starting before this time (ISO 8601)"),
+    current_user: dict = CurrentUser
+):
+    """
+    Retrieves approximate counts of distinct client IPs and distinct IP + user
+    agent pairs per hour or day, plus the distinct count over the whole range.
+    Counts come from HyperLogLog sketches (about 1.6% error) that are persisted
+    across restarts. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_unique_visitors(granularity, site, start, end)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error counting unique visitors")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/stats/latency", response_model=LatencyReport, summary="Get Latency Percentiles")
+async def get_nginx_latency(
+    dimension: str = Query("path", description="path ($request_time per path) or upstream ($upstream_response_time per upstream)"),
+    start: Optional[datetime] = Query(None, description="Start of the window (ISO 8601, default one hour ago)"),
+    end: Optional[datetime] = Query(None, description="End of the window (ISO 8601, default now)"),
+    limit: int = Query(20, ge=1, le=64, description="Number of paths or upstreams to return"),
+    current_user: dict = CurrentUser
+):
+    """
+    Retrieves p50/p95/p99 latency in milliseconds over a time window, overall
+    and for the busiest paths or upstreams. Requires a log_format that logs
+    `$request_time` and/or `$upstream_response_time` (and `$upstream_addr`).
+    Percentiles are within 1% of a real sample. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_latency_report(dimension, start, end, limit)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error computing latency percentiles")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/structured/errors", response_model=List[ErrorLogEntry], summary="Get Structured Nginx Error Log Entries")
+async def get_structured_nginx_errors(
+    log_name: str = Query("error.log", description="Error log file in the log directory"),
+    level: Optional[str] = Query(None, description="Minimum level: debug, info, notice, warn, error, crit, alert or emerg"),
+    since: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    limit: int = Query(100, ge=1, le=5000, description="Maximum number of entries"),
+    current_user: dict = CurrentUser
+):
+    """
+    Retrieves the newest entries of an nginx error log, newest first, parsed
+    into level, pid/tid, connection, message, normalised template and the
+    client/server/request/upstream/host context. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_error_log_entries(log_name, limit, level, since)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error parsing Nginx error log {log_name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/stats/errors", response_model=ErrorLogSummary, summary="Get Nginx Errors Grouped by Message Template")
+async def get_nginx_error_summary(
+    log_name: str = Query("error.log", description="Error log file in the log directory"),
+    granularity: str = Query("hour", description="Bucket size: minute, hour or day"),
+    level: Optional[str] = Query(None, description="Minimum level: debug, info, notice, warn, error, crit, alert or emerg"),
+    start: Optional[datetime] = Query(None, description="Only entries at or after this time (ISO 8601)"),
+    end: Optional[datetime] = Query(None, description="Only entries before this time (ISO 8601)"),
+    limit: int = Query(50, ge=1, le=500, description="Number of templates to return"),
+    current_user: dict = CurrentUser
+):
+    """
+    Groups the entries of an nginx error log by message template (variable parts
+    such as addresses, numbers and paths masked) with counts per time bucket,
+    most frequent first. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_error_log_summary(log_name, granularity, level, start, end, limit)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error aggregating Nginx error log {log_name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
 @nginx_router.delete("/logs/{log_name}", response_model=LogActionStatus, summary="Delete Nginx Log File")
 async def delete_nginx_log(log_name: str, current_user: dict = CurrentUser):
     """
@@ -205,7 +704,7 @@ async def delete_nginx_log(log_name: str, current_user: dict = CurrentUser):
     Requires authentication. Use with caution.
     """
     try:
-        nginx_manager.delete_log(log_name)
+        await asyncio.to_thread(nginx_manager.delete_log, log_name)
         logger.info(f"Log file '{log_name}' deleted by user '{current_user.get('username')}'.")
         return LogActionStatus(
             success=True,
@@ -228,7 +727,7 @@ async def get_main_nginx_conf(current_user: dict = CurrentUser):
     Requires authentication.
     """
     try:
-        content = nginx_manager.get_nginx_conf()
+        content = await asyncio.to_thread(nginx_manager.get_nginx_conf)
         return NginxConf(content=content)
     except NginxManagementError as e:
         handle_nginx_error(e)
@@ -245,7 +744,7 @@ async def update_main_nginx_conf(conf_data: NginxConf, current_user: dict = Curr
     Requires authentication. Use with extreme caution.
     """
     try:
-        nginx_manager.update_nginx_conf(conf_data.content)
+        await asyncio.to_thread(nginx_manager.update_nginx_conf, conf_data.content)
         logger.info(f"Main Nginx config updated by user '{current_user.get('username')}'.")
         return ConfActionStatus(
             success=True,
@@ -257,6 +756,83 @@ async def update_main_nginx_conf(conf_data: NginxConf, current_user: dict = Curr
     except Exception as e:
          logger.exception("Unexpected error updating main Nginx config")
          raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+@nginx_router.get("/conf/ast", response_model=ConfTree, summary="Get the Parsed Nginx Configuration")
+async def get_nginx_conf_ast(
+    site: Optional[str] = Query(None, description="Parse this site from sites-available instead of nginx.conf"),
+    current_user: dict = CurrentUser
+):
+    """
+    Returns nginx.conf and every file it includes (sites, snippets, ...) as a
+    syntax tree of directives with their line numbers, one entry per file.
+    Include directives list the files they load. Syntax errors are reported
+    alongside. Files are only re-parsed when their content changes.
+    Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_conf_tree(site)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error parsing Nginx config")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/conf/directives", response_model=List[ConfDirectiveMatch], summary="Find Nginx Configuration Directives")
+async def find_nginx_conf_directives(
+    name: str = Query(..., description="Directive name, e.g. proxy_pass or ssl_certificate"),
+    site: Optional[str] = Query(None, description="Search this site from sites-available instead of nginx.conf"),
+    current_user: dict = CurrentUser
+):
+    """
+    Finds every occurrence of a directive across nginx.conf and its includes,
+    with its file, line and enclosing blocks. Requires authentication.
+    """
+    try:
+        return await nginx_manager.find_conf_directives(name, site)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception(f"Unexpected error searching Nginx config for {name}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/conf/servers", response_model=List[ConfServer], summary="List Nginx Server Blocks")
+async def get_nginx_conf_servers(
+    site: Optional[str] = Query(None, description="Only this site from sites-available, enabled or not"),
+    current_user: dict = CurrentUser
+):
+    """
+    Lists the server blocks nginx loads (or those of one site) with their
+    server names, listen addresses and locations, each with file and line.
+    Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_conf_servers(site)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error listing Nginx server blocks")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+
+@nginx_router.get("/conf/upstreams", response_model=List[ConfUpstream], summary="List Nginx Upstreams")
+async def get_nginx_conf_upstreams(
+    site: Optional[str] = Query(None, description="Only this site from sites-available, enabled or not"),
+    current_user: dict = CurrentUser
+):
+    """
+    Lists the upstream blocks nginx loads (or those of one site) with their
+    servers, each with file and line. Requires authentication.
+    """
+    try:
+        return await nginx_manager.get_conf_upstreams(site)
+    except NginxManagementError as e:
+        handle_nginx_error(e)
+    except Exception as e:
+        logger.exception("Unexpected error listing Nginx upstreams")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
 # === Nginx Service Actions ===
 
 @nginx_router.post("/actions/test", response_model=nginx_manager.NginxCommandStatus, summary="Test Nginx Configuration")
@@ -281,7 +857,8 @@ async def test_nginx_configuration(current_user: dict = CurrentUser):
 @nginx_router.post("/actions/reload", response_model=nginx_manager.NginxCommandStatus, summary="Reload Nginx Service")
 async def reload_nginx_service(current_user: dict = CurrentUser):
     """
-    Reloads the Nginx service using `sudo systemctl reload nginx`.
+    Reloads the Nginx service using `sudo systemctl reload nginx`, once `sudo nginx -t` passes.
+    Reload requests arriving close together are collapsed into one test and reload, and all get its result.
     Requires authentication and appropriate sudo permissions for the FastAPI process user.
     Returns the result of the command execution.
     """
@@ -0,0 +1,239 @@
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from helpers.logger import logger
+from .models import ServerNameConflict, ServerNameEntry
+from .conf_parser import ParsedFile, iter_expanded, parse_conf_file, parse_conf_text, walk
+from .site_inventory import SiteListing
+
+
+# (server name, port, ssl): server blocks sharing one are in conflict.
+ServerKey = Tuple[str, int, bool]
+
+DEFAULT_LISTEN = ("*", 80, False)
+
+
+def parse_listen(args: Tuple[str, ...]) -> Optional[Tuple[str, int, bool]]:
+    """Returns (address, port, ssl) for a listen directive's arguments, or None if it can't be resolved statically."""
+    if not args:
+        return None
+    target = args[0]
+    ssl = 'ssl' in args[1:]
+    if target.startswith('unix:'):
+        return target, 0, ssl
+    if target.startswith('['):
+        address, _, port = target.partition(']')
+        address, port = address + ']', port.lstrip(':') or '80'
+    elif target.isdigit():
+        address, port = '*', target
+    elif ':' in target:
+        address, port = target.rsplit(':', 1)
+    else:
+        address, port = target, '80'
+    if not port.isdigit():
+        return None
+    return address, int(port), ssl
+
+
+def site_entries(site_name: str, source: ParsedFile, enabled: bool) -> List[ServerNameEntry]:
+    """One entry per (server_name, listen) pair of every server block in a site file, snippets included."""
+    entries = []
+    for directive, server_source, _ in walk(source):
+        if directive.name != 'server' or directive.block is None:
+            continue
+        names, listens = [], []
+        for child, _, _ in iter_expanded(directive.block, server_source, (server_source.path,)):
+            if child.name == 'server_name':
+                names.extend(child.args)
+            elif child.name == 'listen':
+                listen = parse_listen(child.args)
+                if listen is not None:
+                    listens.append(listen)
+        for name in names or [""]:
+            for address, port, ssl in listens or [DEFAULT_LISTEN]:
+                entries.append(ServerNameEntry(
+                    site=site_name, server_name=name if name.startswith('~') else name.lower(),
+                    address=address, port=port, ssl=ssl, enabled=enabled,
+                    file=server_source.path, line=directive.line,
+                ))
+    return entries
+
+
+def _key(entry: ServerNameEntry) -> ServerKey:
+    return entry.server_name, entry.port, entry.ssl
+
+
+def _block(entry: ServerNameEntry) -> Tuple[str, int]:
+    return entry.file, entry.line
+
+
+class ServerNameIndex:
+    """
+    An in-memory index of every server block in sites-available by
+    (server_name, port, ssl), and by name alone for host lookups. Site
+    operations update it one site at a time; sync() reconciles it with the
+    site inventory and re-indexes any site whose file, or a file it includes,
+    changed on disk since it was indexed (checked through the stat-keyed parse
+    cache, so unchanged files aren't read). A new file matching an include
+    glob is only picked up once the site is re-indexed for another reason.
+    Only enabled sites count for lookups and conflicts, as only they are loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listing_etag: Optional[str] = None
+        self._sites: Dict[str, Tuple[Dict[str, str], bool, List[ServerNameEntry]]] = {}  # site -> ({file: digest}, enabled, entries)
+        self._by_key: Dict[ServerKey, List[ServerNameEntry]] = defaultdict(list)
+        self._by_name: Dict[str, List[ServerNameEntry]] = defaultdict(list)
+        self._patterns: Dict[str, Optional[re.Pattern]] = {}  # "~regex" names; None if it doesn't compile
+
+    def _remove(self, site_name: str) -> None:
+        _, _, entries = self._sites.pop(site_name, ({}, False, []))
+        for entry in entries:
+            for index, key in ((self._by_key, _key(entry)), (self._by_name, entry.server_name)):
+                if key not in index:
+                    continue
+                remaining = [other for other in index[key] if other.site != site_name]
+                if remaining:
+                    index[key] = remaining
+                else:
+                    del index[key]
+            if entry.server_name not in self._by_name:
+                self._patterns.pop(entry.server_name, None)
+
+    def _index_site(self, site_path: Path, site_name: str, enabled: bool) -> bool:
+        current = self._sites.get(site_name)
+        if (current is not None and current[1] == enabled
+                and all(parse_conf_file(Path(path)).digest == digest for path, digest in current[0].items())):
+            return False
+        source = parse_conf_file(site_path)
+        files = {source.path: source.digest}
+        files.update((file.path, file.digest) for _, file, _ in walk(source))
+        self._remove(site_name)
+        entries = site_entries(site_name, source, enabled)
+        self._sites[site_name] = (files, enabled, entries)
+        for entry in entries:
+            self._by_key[_key(entry)].append(entry)
+            self._by_name[entry.server_name].append(entry)
+            if entry.server_name.startswith('~') and entry.server_name not in self._patterns:
+                try:
+                    self._patterns[entry.server_name] = re.compile(entry.server_name[1:])
+                except re.error:
+                    self._patterns[entry.server_name] = None
+        return True
+
+    def sync(self, listing: SiteListing, available_path: Path) -> None:
+        """
+        Brings the index up to date with a site inventory listing and with the
+        site files on disk. Costs a stat per indexed file when nothing changed. Blocking.
+        """
+        with self._lock:
+            enabled_by_site = {site.name: site.is_enabled for site in listing.sites}
+            changed = listing.etag != self._listing_etag
+            if changed:
+                for site_name in set(self._sites) - set(enabled_by_site):
+                    self._remove(site_name)
+            for site_name, enabled in enabled_by_site.items():
+                changed = self._index_site(available_path / site_name, site_name, enabled) or changed
+            self._listing_etag = listing.etag
+            if changed:
+                logger.debug(f"Synced server name index: {len(self._sites)} sites, {len(self._by_key)} names.")
+
+    def update_site(self, site_path: Path, site_name: str, enabled: bool) -> None:
+        """Re-indexes one site after it was created, edited, enabled or disabled. Blocking."""
+        with self._lock:
+            self._index_site(site_path, site_name, enabled)
+
+    def remove_site(self, site_name: str) -> None:
+        with self._lock:
+            self._remove(site_name)
+
+    def lookup(self, host: str, port: Optional[int] = None) -> List[ServerNameEntry]:
+        """
+        The enabled server blocks whose server_name matches `host`, in nginx's
+        order of precedence: exact name, longest wildcard starting with '*',
+        longest wildcard ending with '*', then regular expressions in order.
+        """
+        host = host.lower().rstrip('.')
+        labels = host.split('.')
+        candidates = [host]
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            if i:
+                candidates.append(f"*.{suffix}")
+            # ".example.com" matches example.com itself as well as its subdomains.
+            candidates.append(f".{suffix}")
+        candidates += [f"{'.'.join(labels[:i])}.*" for i in range(len(labels) - 1, 0, -1)]
+        with self._lock:
+            matches = [entry for name in candidates for entry in self._by_name.get(name, ())]
+            for name, pattern in self._patterns.items():
+                if pattern is not None and pattern.search(host):
+                    matches.extend(self._by_name[name])
+        return [entry for entry in matches if entry.enabled and (port is None or entry.port == port)]
+
+    def _conflicts(self, entries: Iterable[ServerNameEntry], exclude_site: Optional[str] = None) -> List[ServerNameConflict]:
+        conflicts = []
+        by_key: Dict[ServerKey, List[ServerNameEntry]] = defaultdict(list)
+        for entry in entries:
+            by_key[_key(entry)].append(entry)
+        for key, own in by_key.items():
+            others = [other for other in self._by_key.get(key, ()) if other.enabled and other.site != exclude_site]
+            servers = own + others
+            if len({_block(entry) for entry in servers}) > 1:
+                conflicts.append(ServerNameConflict(server_name=key[0], port=key[1], ssl=key[2], servers=servers))
+        return conflicts
+
+    def _is_conflicting(self, key: ServerKey) -> bool:
+        return len({_block(entry) for entry in self._by_key.get(key, ()) if entry.enabled}) > 1
+
+    def _site_conflict_keys(self, site_name: str) -> Set[ServerKey]:
+        _, enabled, entries = self._sites.get(site_name, ({}, False, []))
+        if not enabled:
+            return set()
+        return {_key(entry) for entry in entries if self._is_conflicting(_key(entry))}
+
+    def site_conflict_keys(self, site_name: str) -> Set[ServerKey]:
+        """The (server_name, port, ssl) keys a site conflicts on as currently indexed (none unless it is enabled)."""
+        with self._lock:
+            return self._site_conflict_keys(site_name)
+
+    def conflicts(self) -> List[ServerNameConflict]:
+        """Every (server_name, port, ssl) claimed by more than one enabled server block."""
+        with self._lock:
+            return [
+                ServerNameConflict(
+                    server_name=key[0], port=key[1], ssl=key[2],
+                    servers=[entry for entry in entries if entry.enabled],
+                )
+                for key, entries in self._by_key.items()
+                if self._is_conflicting(key)
+            ]
+
+    def check_site(self, site_name: str, site_path: Path, content: Optional[str] = None,
+                   new_only: bool = False) -> List[ServerNameConflict]:
+        """
+        The conflicts a site would have with the other enabled sites (and
+        within itself) if it were enabled with `content` (by default, its
+        current file). With `new_only`, conflicts on keys this site itself
+        already conflicts on as currently indexed are left out, so an existing
+        conflict doesn't block editing the site; joining a conflict between
+        other sites still counts. Blocking.
+        """
+        if content is None:
+            source = parse_conf_file(site_path)
+        else:
+            directives, errors = parse_conf_text(content)
+            source = ParsedFile(str(site_path), "", None, directives, errors)
+        entries = site_entries(site_name, source, enabled=True)
+        with self._lock:
+            conflicts = self._conflicts(entries, exclude_site=site_name)
+            if new_only:
+                existing = self._site_conflict_keys(site_name)
+                conflicts = [
+                    conflict for conflict in conflicts
+                    if (conflict.server_name, conflict.port, conflict.ssl) not in existing
+                ]
+            return conflicts
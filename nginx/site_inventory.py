@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from helpers.logger import logger
+from .models import SiteInfo
+from .response_cache import make_etag
+
+
+# Directory mtimes only advance in timer ticks, so a directory changed within
+# this long of a scan may have changed again after it without a new mtime.
+RACY_NANOSECONDS = 1_000_000_000
+
+_sites_adapter = TypeAdapter(List[SiteInfo])
+
+
+class SiteListing(NamedTuple):
+    sites: List[SiteInfo]  # sorted by name
+    etag: str
+    body: bytes  # `sites` serialized as JSON
+
+
+def _stat_directory(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        stats = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stats.st_dev, stats.st_ino, stats.st_mtime_ns
+
+
+def _scan_sites(available_path: Path, enabled_path: Path) -> List[SiteInfo]:
+    try:
+        with os.scandir(enabled_path) as entries:
+            enabled_site_names = {entry.name for entry in entries if entry.is_symlink() or entry.is_file()}
+    except FileNotFoundError:
+        enabled_site_names = set()
+
+    with os.scandir(available_path) as entries:
+        sites = [
+            SiteInfo(name=entry.name, is_enabled=entry.name in enabled_site_names)
+            for entry in entries
+            if entry.is_file() and not entry.name.startswith('.')
+        ]
+    sites.sort(key=lambda site: site.name)
+    return sites
+
+
+class SiteInventory:
+    """
+    The sites in sites-available and whether each is enabled, kept in memory.
+    Creating, removing or renaming an entry changes its directory's mtime, so
+    the listing is only rebuilt when the (device, inode, mtime) of either
+    directory differs from when it was built, or after invalidate() (called
+    by the site operations here). A listing built within RACY_NANOSECONDS of
+    a directory change isn't trusted past the next call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[Tuple] = None
+        self._listing: Optional[SiteListing] = None
+
+    def get(self, available_path: Path, enabled_path: Path) -> SiteListing:
+        """Returns the current listing, rescanning the directories if they changed. Blocking."""
+        fingerprint = (available_path, enabled_path, _stat_directory(available_path), _stat_directory(enabled_path))
+        with self._lock:
+            if self._listing is not None and fingerprint == self._fingerprint:
+                return self._listing
+
+            scanned_at = time.time_ns()
+            if fingerprint[2] is None:
+                logger.warning(f"Sites available directory not found: {available_path}")
+                sites = []
+            else:
+                sites = _scan_sites(available_path, enabled_path)
+            body = _sites_adapter.dump_json(sites)
+            self._listing = SiteListing(sites, make_etag(body), body)
+            mtimes = [stats[2] for stats in fingerprint[2:] if stats is not None]
+            racy = any(mtime >= scanned_at - RACY_NANOSECONDS for mtime in mtimes)
+            self._fingerprint = None if racy else fingerprint
+            logger.debug(f"Rebuilt site inventory: {len(sites)} sites.")
+            return self._listing
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fingerprint = None
+            self._listing = None
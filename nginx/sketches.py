@@ -0,0 +1,173 @@
+import heapq
+import math
+from hashlib import blake2b
+from operator import itemgetter
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters summary (Metwally et al.) over at most
+    2 * `capacity` counters. Counts are overestimates by at most the item's
+    `error`, and any item whose true count exceeds `floor` is guaranteed to be
+    tracked. Instead of replacing the minimum counter on every miss, the table
+    is pruned back to `capacity` when it fills up, which keeps inserts O(1)
+    amortised even when every item is new (e.g. a scraper rotating IPs).
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "floor")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self.floor = 0
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        counts = self.counts
+        current = counts.get(item)
+        if current is not None:
+            counts[item] = current + count
+            return
+        if len(counts) >= 2 * self.capacity:
+            self._prune()
+        # An untracked item may have been seen up to `floor` times before it was evicted.
+        counts[item] = self.floor + count
+        if self.floor:
+            self.errors[item] = self.floor
+
+    def _prune(self) -> None:
+        ranked = heapq.nlargest(self.capacity + 1, self.counts.items(), key=itemgetter(1))
+        self.floor = max(self.floor, ranked[-1][1])
+        self.counts = dict(ranked[:self.capacity])
+        self.errors = {item: self.errors[item] for item in self.counts if item in self.errors}
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Folds another summary into this one; the result bounds the combined stream."""
+        for item, count in other.counts.items():
+            if item in self.counts:
+                self.counts[item] += count
+                error = self.errors.get(item, 0) + other.errors.get(item, 0)
+            else:
+                self.counts[item] = self.floor + count
+                error = self.floor + other.errors.get(item, 0)
+            if error:
+                self.errors[item] = error
+        for item in self.counts.keys() - other.counts.keys():
+            self.counts[item] += other.floor
+            self.errors[item] = self.errors.get(item, 0) + other.floor
+        self.floor += other.floor
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def top(self, n: int) -> List[Tuple[Hashable, int, int]]:
+        """Returns up to `n` (item, estimated count, maximum overestimate) tuples, largest first."""
+        ranked = heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+        return [(item, count, self.errors.get(item, 0)) for item, count in ranked]
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-value counter (Flajolet et al.) with 2**`precision`
+    one-byte registers; the standard error is about 1.04 / sqrt(2**precision),
+    1.6% for the default of 12 (4 KiB). Sketches merge by taking the
+    register-wise maximum, so the union of many buckets costs no more than one.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(blake2b(value.encode('utf-8', errors='ignore'), digest_size=8).digest(), 'little')
+
+    def add_hash(self, hashed: int) -> None:
+        """Adds a value by its 64-bit hash, so one hash can update several sketches."""
+        index = hashed & ((1 << self.precision) - 1)
+        rank = 64 - self.precision - (hashed >> self.precision).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value: str) -> None:
+        self.add_hash(self.hash(value))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = _hll_alpha(m) * m * m / sum(_HLL_POWERS[register] for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+_HLL_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+def _hll_alpha(m: int) -> float:
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class LatencyHistogram:
+    """
+    A mergeable latency histogram with logarithmic buckets (as in DDSketch):
+    every quantile is returned within `LATENCY_RELATIVE_ACCURACY` of a real
+    sample, without keeping samples. Values up to 1 hour use about 1,000
+    possible buckets, stored sparsely.
+    """
+
+    __slots__ = ("buckets", "zero_count", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value_ms: float) -> None:
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+        if value_ms < _LATENCY_MIN_MS:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value_ms) / _LATENCY_LOG_GAMMA)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return min(2 * _LATENCY_GAMMA ** index / (_LATENCY_GAMMA + 1), self.max)
+        return self.max
+
+
+LATENCY_RELATIVE_ACCURACY = 0.01
+_LATENCY_GAMMA = (1 + LATENCY_RELATIVE_ACCURACY) / (1 - LATENCY_RELATIVE_ACCURACY)
+_LATENCY_LOG_GAMMA = math.log(_LATENCY_GAMMA)
+# nginx logs times with millisecond resolution; anything below is reported as 0.
+_LATENCY_MIN_MS = 0.5